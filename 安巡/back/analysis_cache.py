@@ -0,0 +1,162 @@
+"""基于内容哈希的分析结果缓存
+
+以上传文件的SHA-256加上分析参数作为键，把解析结果（列式数据包表+样本）和最终的AI结论
+保存在磁盘上，按总大小做LRU淘汰。重复上传同一个抓包文件时可以直接返回结果。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from packet_table import PacketTable
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """分块计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(kind: str, file_hash: str, **params) -> str:
+    """由缓存类型、文件哈希和分析参数生成缓存键"""
+    payload = json.dumps({"kind": kind, "file": file_hash, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """磁盘缓存，每个键一个目录，按最近访问时间淘汰"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> 占用字节数，按访问顺序排列
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_entries()
+
+    def _load_entries(self):
+        """启动时扫描磁盘，按目录修改时间恢复LRU顺序"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, key)
+            if key.startswith(".tmp_"):
+                shutil.rmtree(path, ignore_errors=True)  # 上次异常退出遗留的半成品
+            elif os.path.isdir(path):
+                entries.append((os.path.getmtime(path), key, self._dir_size(path)))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _touch(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(self._entry_dir(key))
+        except OSError:
+            pass
+
+    def _commit(self, key: str, tmp_dir: str):
+        """将写好的临时目录原子替换为正式条目，并执行容量淘汰"""
+        final_dir = self._entry_dir(key)
+        with self._lock:
+            if os.path.exists(final_dir):
+                shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(tmp_dir, final_dir)
+            self._entries[key] = self._dir_size(final_dir)
+            self._entries.move_to_end(key)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            print(f"[INFO] Evicted analysis cache entry {key[:12]} ({size} bytes)")
+
+    def _new_tmp_dir(self, key: str) -> str:
+        tmp_dir = os.path.join(self.cache_dir, f".tmp_{key}_{threading.get_ident()}_{time.time_ns()}")
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    def get_parsed(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的解析结果，返回与parse_capture相同的结构"""
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, "parsed.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            table = PacketTable.load(os.path.join(entry_dir, "table.npz"))
+        except (OSError, ValueError, KeyError):
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        self._touch(key)
+        return {"table": table, "samples": meta["samples"], "stats": meta["stats"]}
+
+    def put_parsed(self, key: str, parsed: Dict[str, Any]):
+        tmp_dir = self._new_tmp_dir(key)
+        try:
+            parsed["table"].save(os.path.join(tmp_dir, "table.npz"))
+            with open(os.path.join(tmp_dir, "parsed.json"), "w", encoding="utf-8") as f:
+                json.dump({"samples": parsed["samples"], "stats": parsed["stats"]}, f, ensure_ascii=False)
+            self._commit(key, tmp_dir)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            print(f"[WARNING] Failed to cache parsed capture: {str(e)}")
+
+    def get_result(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的最终分析结果"""
+        try:
+            with open(os.path.join(self._entry_dir(key), "result.json"), "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        self._touch(key)
+        return result
+
+    def put_result(self, key: str, result: Dict[str, Any]):
+        tmp_dir = self._new_tmp_dir(key)
+        try:
+            with open(os.path.join(tmp_dir, "result.json"), "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            self._commit(key, tmp_dir)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            print(f"[WARNING] Failed to cache analysis result: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": sum(self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -1,11 +1,26 @@
 from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 import os
-import tempfile
 import json
+import shutil
+import atexit
 from datetime import datetime
-from traffic_analyzer import TrafficAnalyzer
-import requests
+from traffic_analyzer import (TrafficAnalyzer, PACKET_PARSERS, ANALYSIS_MODES, DEFAULT_MAP_WORKERS, MAX_MAP_CHUNKS,
+                              FIELD_PROFILES)
+from job_manager import JobManager, QueueFullError, JobCancelled
+from upload_manager import UploadManager, UploadError, RECOMMENDED_CHUNK_SIZE
+from upload_pipeline import PipelineManager
+from frame_index import CaptureNotFound, DEFAULT_DRILLDOWN_PACKETS, MAX_DRILLDOWN_PACKETS
+from capture_service import (CaptureService, CaptureServiceError, DEFAULT_SEGMENT_MB, DEFAULT_SEGMENT_FILES,
+                             DEFAULT_SEGMENT_SECONDS)
+from capture_filters import CAPTURE_FILTER_PRESETS, CaptureFilterError, resolve_capture_filter
+from interface_inventory import InterfaceInventory
+from stream_metrics import MetricsRegistry, METRIC_WINDOWS, DEFAULT_TOP, MAX_TOP
+from storage import StorageError, is_document, read_document_meta, read_document_table
+from ollama_client import OllamaClient, ModelCallError
+from llm_cache import LLMResponseCache
+from live_stream import (LivePacketStream, SecondAggregator, compact_packet, LIVE_STREAM_MODES,
+                         MAX_STREAM_DURATION, MAX_STREAM_PACKETS)
 from typing import Dict, List, Any
 import threading
 import time
@@ -31,8 +46,55 @@ def performance_monitor(func):
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
+# 所有Ollama调用共用一个带连接池的客户端（地址、默认模型和超时见ollama_client）
+ollama = OllamaClient()
+atexit.register(ollama.close)
+
 # 初始化流量分析器
-analyzer = TrafficAnalyzer()
+analyzer = TrafficAnalyzer(ollama=ollama)
+
+# 模型回复缓存：相同的提示词直接返回缓存的回复（TTL和容量见llm_cache）
+ollama.cache = LLMResponseCache(os.path.join(analyzer.data_dir, 'llm_cache'))
+
+# 后台分析任务队列：并发执行数和排队上限可通过环境变量调整
+job_manager = JobManager(max_workers=int(os.environ.get('ANALYSIS_JOB_WORKERS', 2)),
+                         max_queue=int(os.environ.get('ANALYSIS_JOB_QUEUE', 16)))
+
+# 分块上传：单文件大小上限（默认8GB）和全局上传速率上限（字节/秒，0为不限速）
+upload_manager = UploadManager(os.path.join(analyzer.data_dir, 'uploads'),
+                               max_bytes=int(os.environ.get('MAX_UPLOAD_BYTES', 8 * 1024 ** 3)),
+                               rate_limit=float(os.environ.get('UPLOAD_RATE_LIMIT', 0)))
+
+# 边上传边解析：客户端超过该秒数不再发送数据时放弃流水线，完成上传后改为从磁盘重新解析
+upload_pipelines = PipelineManager(upload_manager,
+                                   idle_timeout=float(os.environ.get('UPLOAD_PIPELINE_IDLE_TIMEOUT', 300)))
+
+# 按接口的滑动窗口流量指标，由环形缓冲采集和实时数据包流写入
+stream_metrics = MetricsRegistry()
+
+# 持续环形缓冲采集：每个接口一个tshark进程，服务退出时一并终止
+capture_service = CaptureService(analyzer, os.path.join(analyzer.data_dir, 'live_captures'),
+                                 max_sessions=int(os.environ.get('MAX_LIVE_CAPTURES', 4)), metrics=stream_metrics)
+atexit.register(capture_service.stop_all)
+
+# 接口清单：缓存tshark -D结果并在后台刷新，同时采样/proc/net/dev计算各接口吞吐量。
+# 后台线程在第一次接口请求时才启动：debug模式下重载器的父进程也会导入本模块，不能在导入时启动
+interface_inventory = InterfaceInventory(analyzer.get_network_interfaces,
+                                         refresh_interval=float(os.environ.get('INTERFACE_REFRESH_INTERVAL', 300)),
+                                         sample_interval=float(os.environ.get('INTERFACE_SAMPLE_INTERVAL', 2)))
+atexit.register(interface_inventory.stop)
+
+# SSE连接无事件时发送心跳的间隔（秒）
+JOB_EVENT_KEEPALIVE = 15
+# 实时数据包流单个SSE事件最多携带的数据包数
+LIVE_STREAM_BATCH = 200
+# 同时进行的实时数据包流上限，每个流各占一个tshark进程
+MAX_LIVE_STREAMS = int(os.environ.get('MAX_LIVE_STREAMS', 4))
+live_stream_slots = threading.BoundedSemaphore(MAX_LIVE_STREAMS)
+# 保存的记录表分页读取：kind -> 数据目录下的子目录
+STORED_RECORD_DIRS = {"analysis": "analysis_results", "capture": "captured_traffic"}
+DEFAULT_STORED_RECORDS = 200
+MAX_STORED_RECORDS = 5000
 
 # 存储对话历史的字典（简单实现，生产环境应使用数据库）
 chat_sessions = {}
@@ -90,6 +152,7 @@ def chat_with_ai():
         message = data.get('message', '')
         session_id = data.get('session_id', 'default')
         model = data.get('model', 'qwen2.5:7b')
+        use_cache = data.get('cache', True)  # false时忽略缓存的回复重新生成
         
         if not message:
             return jsonify({"error": "消息内容不能为空"}), 400
@@ -101,28 +164,19 @@ def chat_with_ai():
         messages = chat_memory.get_context(session_id)
         
         # 调用Ollama API
-        url = "http://localhost:11434/api/chat"
-        payload = {
-            "model": "qwen3:8b" if model == "qwen2.5:7b" else model,
-            "messages": messages,
-            "stream": False
-        }
+        try:
+            ai_response = ollama.chat(messages, model=model, use_cache=use_cache) or '抱歉，无法获取回复'
+        except ModelCallError as e:
+            return jsonify({"error": f"AI服务调用失败，状态码: {e.status_code}"}), 500
         
-        response = requests.post(url, json=payload, timeout=60)
+        # 添加AI回复到记忆
+        chat_memory.add_message(session_id, "assistant", ai_response)
         
-        if response.status_code == 200:
-            ai_response = response.json().get('message', {}).get('content', '抱歉，无法获取回复')
-            
-            # 添加AI回复到记忆
-            chat_memory.add_message(session_id, "assistant", ai_response)
-            
-            return jsonify({
-                "response": ai_response,
-                "session_id": session_id,
-                "timestamp": datetime.now().isoformat()
-            })
-        else:
-            return jsonify({"error": f"AI服务调用失败，状态码: {response.status_code}"}), 500
+        return jsonify({
+            "response": ai_response,
+            "session_id": session_id,
+            "timestamp": datetime.now().isoformat()
+        })
             
     except Exception as e:
         return jsonify({"error": f"处理请求时发生错误: {str(e)}"}), 500
@@ -136,6 +190,7 @@ def chat_with_ai_stream():
         message = data.get('message', '')
         session_id = data.get('session_id', 'default')
         model = data.get('model', 'qwen2.5:7b')
+        use_cache = data.get('cache', True)
         
         if not message:
             return jsonify({"error": "消息内容不能为空"}), 400
@@ -148,42 +203,25 @@ def chat_with_ai_stream():
         
         def generate_stream():
             try:
-                # 调用Ollama API（流式）
-                url = "http://localhost:11434/api/chat"
-                payload = {
-                    "model": "qwen3:8b" if model == "qwen2.5:7b" else model,
-                    "messages": messages,
-                    "stream": True
-                }
+                # 调用Ollama API（流式，缓存命中时逐块回放）
+                full_response = ""
                 
-                response = requests.post(url, json=payload, stream=True, timeout=60)
-                
-                if response.status_code == 200:
-                    full_response = ""
+                for chunk_data in ollama.chat_stream(messages, model=model, use_cache=use_cache):
+                    if 'message' in chunk_data and 'content' in chunk_data['message']:
+                        content = chunk_data['message']['content']
+                        full_response += content
+                        
+                        # 发送流式数据
+                        yield f"data: {json.dumps({'content': content, 'session_id': session_id})}\n\n"
                     
-                    for line in response.iter_lines():
-                        if line:
-                            try:
-                                chunk_data = json.loads(line.decode('utf-8'))
-                                if 'message' in chunk_data and 'content' in chunk_data['message']:
-                                    content = chunk_data['message']['content']
-                                    full_response += content
-                                    
-                                    # 发送流式数据
-                                    yield f"data: {json.dumps({'content': content, 'session_id': session_id})}\n\n"
-                                
-                                # 检查是否完成
-                                if chunk_data.get('done', False):
-                                    # 添加完整回复到记忆
-                                    chat_memory.add_message(session_id, "assistant", full_response)
-                                    yield f"data: {json.dumps({'done': True, 'session_id': session_id, 'timestamp': datetime.now().isoformat()})}\n\n"
-                                    break
-                                    
-                            except json.JSONDecodeError:
-                                continue
-                else:
-                    yield f"data: {json.dumps({'error': f'AI服务调用失败，状态码: {response.status_code}'})}\n\n"
+                    # 检查是否完成
+                    if chunk_data.get('done', False):
+                        # 添加完整回复到记忆
+                        chat_memory.add_message(session_id, "assistant", full_response)
+                        yield f"data: {json.dumps({'done': True, 'session_id': session_id, 'cached': chunk_data.get('cached', False), 'timestamp': datetime.now().isoformat()})}\n\n"
                     
+            except ModelCallError as e:
+                yield f"data: {json.dumps({'error': f'AI服务调用失败，状态码: {e.status_code}'})}\n\n"
             except Exception as e:
                 yield f"data: {json.dumps({'error': f'处理请求时发生错误: {str(e)}'})}\n\n"
         
@@ -201,6 +239,85 @@ def chat_with_ai_stream():
     except Exception as e:
         return jsonify({"error": f"处理请求时发生错误: {str(e)}"}), 500
 
+ALLOWED_CAPTURE_EXTENSIONS = {'.pcap', '.pcapng', '.cap'}
+
+def read_analysis_options(form):
+    """从表单读取分析参数，返回(参数字典, 错误信息)"""
+    # 获取思考开关参数
+    enable_thinking = str(form.get('enable_thinking', 'true')).lower() == 'true'
+    
+    # 解析器选择：tshark（默认）或native（内置读取器，无法解码时回退tshark；输出固定字段集，忽略profile，
+    # 不含相对序列号、TCP分析等字段，见pcap_reader.NATIVE_OMITTED_FIELDS）
+    parser = str(form.get('parser', 'tshark')).lower()
+    if parser not in PACKET_PARSERS:
+        return None, f"不支持的解析器: {parser}"
+    
+    # tshark字段配置：full（默认）、five_tuple、tcp_health、payload
+    profile = str(form.get('profile', 'full')).lower()
+    if profile not in FIELD_PROFILES:
+        return None, f"不支持的字段配置: {profile}"
+    
+    # 分片并行解析的进程数（仅native解析器生效，默认不分片）
+    try:
+        workers = int(form.get('workers', 1))
+    except (TypeError, ValueError):
+        return None, "workers参数必须是整数"
+    workers = max(1, min(workers, os.cpu_count() or 1))
+    
+    # force=true时忽略缓存，强制重新分析
+    force = str(form.get('force', 'false')).lower() == 'true'
+    
+    # AI分析模式：single（默认）或mapreduce（分块并发调用模型，适合大文件）
+    mode = str(form.get('mode', 'single')).lower()
+    if mode not in ANALYSIS_MODES:
+        return None, f"不支持的分析模式: {mode}"
+    try:
+        map_workers = int(form.get('map_workers', DEFAULT_MAP_WORKERS))
+    except (TypeError, ValueError):
+        return None, "map_workers参数必须是整数"
+    map_workers = max(1, min(map_workers, MAX_MAP_CHUNKS))
+    
+    # 采集过滤器：capture_preset（预设）、capture_filter（BPF表达式）、snaplen（每包保留字节数）
+    try:
+        capture_filter = resolve_capture_filter(form.get('capture_preset'), form.get('capture_filter'),
+                                                form.get('snaplen'))
+    except CaptureFilterError as e:
+        return None, str(e)
+    
+    return {
+        "enable_thinking": enable_thinking,
+        "parser": parser,
+        "profile": profile,
+        "workers": workers,
+        "force": force,
+        "mode": mode,
+        "map_workers": map_workers,
+        "capture_filter": capture_filter,
+    }, None
+
+def save_uploaded_capture(file):
+    """校验扩展名并把上传的抓包文件保存到独立的临时目录，返回(文件路径, 错误信息)
+
+    每个请求使用自己的目录，并发上传互不干扰；处理完成后用analyzer.remove_scratch_dir删除。
+    """
+    if file.filename == '':
+        return None, "文件名为空"
+    
+    # 检查文件扩展名
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in ALLOWED_CAPTURE_EXTENSIONS:
+        return None, "不支持的文件格式，请上传pcap、pcapng或cap文件"
+    
+    # 保存临时文件
+    scratch_dir = analyzer.create_scratch_dir(prefix="upload_")
+    file_path = os.path.join(scratch_dir, f"upload{file_ext}")
+    try:
+        file.save(file_path)
+    except Exception:
+        analyzer.remove_scratch_dir(scratch_dir)
+        raise
+    return file_path, None
+
 @app.route('/api/analyze_pcap', methods=['POST'])
 @performance_monitor
 def analyze_pcap():
@@ -209,30 +326,18 @@ def analyze_pcap():
         if 'file' not in request.files:
             return jsonify({"error": "没有上传文件"}), 400
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({"error": "文件名为空"}), 400
-        
-        # 获取思考开关参数
-        enable_thinking = request.form.get('enable_thinking', 'true').lower() == 'true'
-        
-        # 检查文件扩展名
-        allowed_extensions = {'.pcap', '.pcapng', '.cap'}
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in allowed_extensions:
-            return jsonify({"error": "不支持的文件格式，请上传pcap、pcapng或cap文件"}), 400
+        options, error = read_analysis_options(request.form)
+        if error:
+            return jsonify({"error": error}), 400
         
-        # 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-            file.save(tmp_file.name)
-            tmp_file_path = tmp_file.name
+        file = request.files['file']
+        tmp_file_path, error = save_uploaded_capture(file)
+        if error:
+            return jsonify({"error": error}), 400
         
         try:
             # 分析文件
-            result = analyzer.process_pcap_file(tmp_file_path, enable_thinking=enable_thinking)
-            
-            # 清理临时文件
-            os.unlink(tmp_file_path)
+            result = analyzer.process_pcap_file(tmp_file_path, **options)
             
             return jsonify({
                 "success": True,
@@ -241,15 +346,337 @@ def analyze_pcap():
                 "timestamp": datetime.now().isoformat()
             })
             
-        except Exception as e:
-            # 确保清理临时文件
-            if os.path.exists(tmp_file_path):
-                os.unlink(tmp_file_path)
-            raise e
+        finally:
+            # 清理临时目录
+            analyzer.remove_scratch_dir(os.path.dirname(tmp_file_path))
             
     except Exception as e:
         return jsonify({"error": f"分析文件时发生错误: {str(e)}"}), 500
 
+@app.route('/api/jobs/analyze_pcap', methods=['POST'])
+def submit_analysis_job():
+    """提交后台分析任务，立即返回任务ID"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "没有上传文件"}), 400
+        
+        options, error = read_analysis_options(request.form)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        file = request.files['file']
+        tmp_file_path, error = save_uploaded_capture(file)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        def run(job):
+            return analyzer.process_pcap_file(tmp_file_path, progress_callback=job.report, **options)
+        
+        def cleanup():
+            analyzer.remove_scratch_dir(os.path.dirname(tmp_file_path))
+        
+        try:
+            job = job_manager.submit("analyze_pcap", run, params={"filename": file.filename, **options},
+                                     cleanup=cleanup)
+        except QueueFullError as e:
+            cleanup()
+            return jsonify({"error": str(e)}), 429
+        
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events",
+            "timestamp": datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({"error": f"提交分析任务时发生错误: {str(e)}"}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """列出全部后台任务（不含结果）"""
+    return jsonify({
+        "success": True,
+        "jobs": [job.to_dict(include_result=False) for job in job_manager.list_jobs()],
+        "stats": job_manager.stats()
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态，完成后包含分析结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """以SSE推送任务的阶段进度事件，任务结束后关闭连接"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    
+    # 断线重连时浏览器会带上Last-Event-ID，从下一个事件继续推送
+    try:
+        after = max(int(request.headers.get('Last-Event-ID', request.args.get('after', -1))) + 1, 0)
+    except ValueError:
+        after = 0
+    
+    def generate_events():
+        position = after
+        while True:
+            events = job.wait_events(position, timeout=JOB_EVENT_KEEPALIVE)
+            for event in events:
+                yield f"id: {event['id']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            position += len(events)
+            # 任务已结束且没有更多事件（包括重连时Last-Event-ID已是最后一个事件）时结束，不能继续空转
+            if job.finished and position >= len(job.events):
+                yield f"event: end\ndata: {json.dumps(job.to_dict(include_result=False), ensure_ascii=False)}\n\n"
+                break
+            if not events:
+                yield ": keepalive\n\n"
+    
+    return Response(
+        generate_events(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'Access-Control-Allow-Origin': '*'
+        }
+    )
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务：排队中立即取消，运行中在当前阶段结束后停止"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify({"success": True, "job_id": job.id, "state": job.state,
+                    "cancel_requested": job.cancel_event.is_set()})
+
+def upload_error_response(e: UploadError):
+    return jsonify({"error": str(e), **e.details}), e.status
+
+def upload_status(session):
+    data = session.to_dict()
+    pipeline = upload_pipelines.get(session.id)
+    if pipeline is not None:
+        data["pipeline"] = pipeline.to_dict()
+    return data
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """创建分块上传会话，请求体为JSON：filename、size（字节）、可选sha256
+
+    pipeline=true时立即启动后台解析，边接收分块边构建数据包表和流表；
+    此时parser、profile需在创建时给出，完成上传时使用相同参数才会复用流水线的解析结果。
+    """
+    try:
+        data = request.json or {}
+        pipeline = str(data.get('pipeline', 'false')).lower() == 'true'
+        if pipeline:
+            options, error = read_analysis_options(data)
+            if error:
+                return jsonify({"error": error}), 400
+        session = upload_manager.create(data.get('filename', ''), data.get('size'), data.get('sha256'))
+        if pipeline:
+            def parse(open_stream, stats, progress_callback):
+                return analyzer.parse_capture_stream(open_stream, parser=options["parser"],
+                                                     profile=options["profile"],
+                                                     progress_callback=progress_callback, stats=stats)
+            upload_pipelines.start(session.id, parse, {"parser": options["parser"], "profile": options["profile"]})
+        return jsonify({
+            "success": True,
+            **upload_status(session),
+            "chunk_size": RECOMMENDED_CHUNK_SIZE,
+            "upload_url": f"/api/uploads/{session.id}"
+        }), 201
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"error": f"创建上传会话时发生错误: {str(e)}"}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """查询已确认的偏移量，断线后从该位置续传"""
+    try:
+        return jsonify({"success": True, **upload_status(upload_manager.get(upload_id))})
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """写入一个分块：请求体为原始字节，偏移量由Upload-Offset请求头或offset参数指定"""
+    try:
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+        except ValueError:
+            return jsonify({"error": "缺少有效的Upload-Offset"}), 400
+        # 直接读取WSGI输入流，分块数据不经过表单解析，也不在内存中缓冲
+        session = upload_manager.write_chunk(upload_id, offset, request.stream, request.content_length)
+        return jsonify({"success": True, **upload_status(session)})
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"error": f"写入分块时发生错误: {str(e)}"}), 500
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """校验上传完整性并提交后台分析任务，分析参数与/api/analyze_pcap相同"""
+    try:
+        options, error = read_analysis_options(request.form or request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
+        
+        upload = upload_manager.finish(upload_id)
+        
+        pipeline = upload_pipelines.get(upload_id)
+        if pipeline is not None:
+            pipeline.mark_uploaded()
+            if ((pipeline.options["parser"], pipeline.options["profile"]) != (options["parser"], options["profile"])
+                    or options["capture_filter"]):
+                upload_pipelines.discard(upload_id)  # 参数不一致或需要先过滤，解析结果不可复用
+                pipeline = None
+        
+        def run(job):
+            preparsed = None
+            if pipeline is not None:
+                job.report("parsing", 0.05, "等待上传期间启动的流式解析完成")
+                while not pipeline.wait(1.0):
+                    if job.cancel_event.is_set():
+                        raise JobCancelled(f"任务 {job.id} 已取消")
+                preparsed = pipeline.parsed
+                if preparsed is None:
+                    print(f"[WARNING] Upload pipeline {upload_id} {pipeline.state}: {pipeline.error}, "
+                          f"parsing from disk")
+            # 上传过程中已增量计算哈希，无需再次读取整个文件
+            result = analyzer.process_pcap_file(upload["path"], file_hash=upload["sha256"],
+                                                progress_callback=job.report, preparsed=preparsed, **options)
+            if pipeline is not None and "error" not in result:
+                result["pipeline"] = {**pipeline.to_dict(),
+                                      "end_to_end_seconds": round(time.time() - pipeline.started_at, 3)}
+            return result
+        
+        def cleanup():
+            upload_pipelines.discard(upload_id)
+            upload_manager.remove(upload_id)
+        
+        try:
+            job = job_manager.submit("analyze_pcap", run, params={"filename": upload["filename"], **options},
+                                     cleanup=cleanup)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 429
+        
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "sha256": upload["sha256"],
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events",
+            "timestamp": datetime.now().isoformat()
+        }), 202
+        
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"error": f"提交分析任务时发生错误: {str(e)}"}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """放弃上传并删除已接收的数据"""
+    upload_pipelines.discard(upload_id)
+    upload_manager.remove(upload_id)
+    return jsonify({"success": True, "upload_id": upload_id})
+
+@app.route('/api/benchmark_profiles', methods=['POST'])
+@performance_monitor
+def benchmark_profiles():
+    """用各字段配置解析上传的pcap文件，比较解析吞吐量"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "没有上传文件"}), 400
+        
+        # 可选：逗号分隔的配置列表，默认测试全部配置
+        profiles = [p.strip() for p in request.form.get('profiles', '').split(',') if p.strip()] or None
+        unknown = [p for p in profiles or [] if p not in FIELD_PROFILES]
+        if unknown:
+            return jsonify({"error": f"不支持的字段配置: {', '.join(unknown)}"}), 400
+        try:
+            max_packets = int(request.form['max_packets']) if request.form.get('max_packets') else None
+        except ValueError:
+            return jsonify({"error": "max_packets参数必须是整数"}), 400
+        
+        tmp_file_path, error = save_uploaded_capture(request.files['file'])
+        if error:
+            return jsonify({"error": error}), 400
+        
+        try:
+            result = analyzer.benchmark_profiles(tmp_file_path, profiles=profiles, max_packets=max_packets)
+        finally:
+            analyzer.remove_scratch_dir(os.path.dirname(tmp_file_path))
+        
+        result["profiles"] = {name: profile["description"] for name, profile in FIELD_PROFILES.items()}
+        return jsonify({"success": True, "benchmark": result, "timestamp": datetime.now().isoformat()})
+        
+    except Exception as e:
+        return jsonify({"error": f"基准测试时发生错误: {str(e)}"}), 500
+
+@app.route('/api/captures/<result_id>', methods=['GET'])
+def get_capture_index(result_id):
+    """查询某次分析保留的抓包文件及索引信息"""
+    try:
+        index = analyzer.captures.open(result_id)
+        return jsonify({"success": True, **index.meta})
+    except CaptureNotFound as e:
+        return jsonify({"error": str(e)}), 404
+
+@app.route('/api/captures/<result_id>/packets', methods=['GET'])
+def get_capture_packets(result_id):
+    """按流ID和/或时间窗口读取数据包
+
+    参数：flow_id（结构化结果flows中的flow_id）、start/end（epoch秒）、
+    offset/limit分页（limit默认200，最大5000）、raw=true时附带原始字节的十六进制。
+    """
+    try:
+        try:
+            flow_id = int(request.args['flow_id']) if request.args.get('flow_id') else None
+            start = float(request.args['start']) if request.args.get('start') else None
+            end = float(request.args['end']) if request.args.get('end') else None
+            offset = max(int(request.args.get('offset', 0)), 0)
+            limit = int(request.args.get('limit', DEFAULT_DRILLDOWN_PACKETS))
+        except ValueError:
+            return jsonify({"error": "flow_id/offset/limit必须是整数，start/end必须是数字"}), 400
+        if flow_id is None and start is None and end is None:
+            return jsonify({"error": "至少需要指定flow_id或start/end之一"}), 400
+        limit = max(1, min(limit, MAX_DRILLDOWN_PACKETS))
+        include_raw = request.args.get('raw', 'false').lower() == 'true'
+        
+        start_time = time.time()
+        index = analyzer.captures.open(result_id)
+        rows = index.select(flow_id=flow_id, start=start, end=end)
+        packets = index.read_packets(rows[offset:offset + limit], include_raw=include_raw)
+        
+        return jsonify({
+            "success": True,
+            "result_id": result_id,
+            "total": int(len(rows)),
+            "offset": offset,
+            "returned": len(packets),
+            "packets": packets,
+            "elapsed_ms": round((time.time() - start_time) * 1000, 2)
+        })
+    except CaptureNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": f"读取数据包时发生错误: {str(e)}"}), 500
+
+@app.route('/api/capture_filters', methods=['GET'])
+def list_capture_filters():
+    """列出采集过滤器预设，可用于/api/capture_traffic和分析接口的capture_preset参数"""
+    return jsonify({"success": True, "presets": CAPTURE_FILTER_PRESETS})
+
 @app.route('/api/capture_traffic', methods=['POST'])
 @performance_monitor
 def capture_traffic():
@@ -259,6 +686,11 @@ def capture_traffic():
         duration = data.get('duration', 30)
         interface = data.get('interface', 'any')
         packet_count = data.get('packet_count', 50)
+        try:
+            capture_filter = resolve_capture_filter(data.get('capture_preset'), data.get('capture_filter'),
+                                                    data.get('snaplen'))
+        except CaptureFilterError as e:
+            return jsonify({"error": str(e)}), 400
         
         # 验证参数
         if duration > 300:  # 最大5分钟
@@ -273,7 +705,8 @@ def capture_traffic():
                 captured_data = analyzer.capture_live_traffic(
                     interface=interface, 
                     duration=duration, 
-                    packet_count=packet_count
+                    packet_count=packet_count,
+                    capture_filter=capture_filter
                 )
                 return captured_data
             except Exception as e:
@@ -287,12 +720,217 @@ def capture_traffic():
             "success": True,
             "captured_packets": len(captured_data),
             "data": captured_data,
+            "capture_filter": capture_filter,
             "timestamp": datetime.now().isoformat()
         })
         
     except Exception as e:
         return jsonify({"error": f"捕获流量时发生错误: {str(e)}"}), 500
 
+def escalate_segment(session, result, path):
+    """高风险分段提交后台AI分析任务；分段随后会被环形缓冲覆盖，先链接到独立的临时目录"""
+    if result["risk_level"] != "高":
+        return
+    scratch_dir = analyzer.create_scratch_dir(prefix="segment_")
+    target = os.path.join(scratch_dir, os.path.basename(path))
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    
+    def run(job):
+        return analyzer.process_pcap_file(target, parser="native", profile="five_tuple",
+                                          progress_callback=job.report,
+                                          extra_findings=result.get("fanout_findings"))
+    
+    try:
+        job = job_manager.submit("analyze_segment", run,
+                                 params={"interface": session.interface, "segment": result["segment"]},
+                                 cleanup=lambda: analyzer.remove_scratch_dir(scratch_dir))
+        result["job_id"] = job.id
+    except QueueFullError as e:
+        analyzer.remove_scratch_dir(scratch_dir)
+        print(f"[WARNING] Segment {result['segment']} on {session.interface} not escalated: {str(e)}")
+
+@app.route('/api/live_capture/start', methods=['POST'])
+def start_live_capture():
+    """在指定接口上启动持续环形缓冲采集
+
+    请求体JSON：interface、segment_mb（单个分段大小）、segment_files（分段数，磁盘上限为两者之积）、
+    segment_seconds（分段最长时长）、capture_filter（BPF过滤器）、escalate（高风险分段自动提交AI分析）。
+    """
+    try:
+        data = request.json or {}
+        try:
+            segment_mb = int(data.get('segment_mb', DEFAULT_SEGMENT_MB))
+            segment_files = int(data.get('segment_files', DEFAULT_SEGMENT_FILES))
+            segment_seconds = int(data.get('segment_seconds', DEFAULT_SEGMENT_SECONDS))
+        except (TypeError, ValueError):
+            return jsonify({"error": "segment_mb、segment_files、segment_seconds必须是整数"}), 400
+        escalate = str(data.get('escalate', 'false')).lower() == 'true'
+        
+        session = capture_service.start(str(data.get('interface', 'any')), segment_mb=segment_mb,
+                                        segment_files=segment_files, segment_seconds=segment_seconds,
+                                        capture_filter=data.get('capture_filter') or None,
+                                        on_segment=escalate_segment if escalate else None)
+        return jsonify({"success": True, **session.to_dict(segments=0)}), 201
+    except CaptureServiceError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"启动采集时发生错误: {str(e)}"}), 500
+
+@app.route('/api/live_capture/stop', methods=['POST'])
+def stop_live_capture():
+    """停止采集，最后一个分段分析完成后返回"""
+    try:
+        data = request.json or {}
+        session = capture_service.stop(str(data.get('interface', 'any')))
+        return jsonify({"success": True, **session.to_dict()})
+    except CaptureServiceError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": f"停止采集时发生错误: {str(e)}"}), 500
+
+@app.route('/api/live_capture/status', methods=['GET'])
+def live_capture_status():
+    """查询采集状态、累计计数、丢包计数和最近的分段分析结果（segments指定返回的分段数）"""
+    try:
+        try:
+            segments = max(0, int(request.args.get('segments', 1)))
+        except ValueError:
+            return jsonify({"error": "segments必须是整数"}), 400
+        interface = request.args.get('interface')
+        if interface:
+            captures = [capture_service.get(interface).to_dict(segments)]
+        else:
+            captures = capture_service.status(segments)
+        return jsonify({"success": True, "captures": captures, "timestamp": datetime.now().isoformat()})
+    except CaptureServiceError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route('/api/live_capture/stream', methods=['GET'])
+def live_capture_stream():
+    """以SSE实时推送采集到的数据包
+
+    参数：interface、mode（packets推送数据包批次，seconds每秒推送聚合统计）、duration（秒）、
+    max_packets、capture_preset、capture_filter（BPF过滤器）、snaplen。客户端断开时立即终止tshark；
+    同时进行的流超过MAX_LIVE_STREAMS时返回429。
+    """
+    mode = request.args.get('mode', 'packets')
+    if mode not in LIVE_STREAM_MODES:
+        return jsonify({"error": f"mode必须是{', '.join(LIVE_STREAM_MODES)}之一"}), 400
+    try:
+        duration = int(request.args.get('duration', 60))
+        max_packets = int(request.args.get('max_packets', 0))
+    except ValueError:
+        return jsonify({"error": "duration和max_packets必须是整数"}), 400
+    if not 0 < duration <= MAX_STREAM_DURATION or not 0 <= max_packets <= MAX_STREAM_PACKETS:
+        return jsonify({"error": f"duration范围为1-{MAX_STREAM_DURATION}秒，max_packets不超过{MAX_STREAM_PACKETS}"}), 400
+    try:
+        capture_filter = resolve_capture_filter(request.args.get('capture_preset'), request.args.get('capture_filter'),
+                                                request.args.get('snaplen'))
+    except CaptureFilterError as e:
+        return jsonify({"error": str(e)}), 400
+    if not live_stream_slots.acquire(blocking=False):
+        return jsonify({"error": f"同时进行的实时数据包流已达上限 {MAX_LIVE_STREAMS}"}), 429
+    try:
+        interface = request.args.get('interface', 'any')
+        stream = LivePacketStream(interface, duration, max_packets or None, capture_filter, metrics=stream_metrics)
+    except OSError as e:
+        live_stream_slots.release()
+        return jsonify({"error": f"无法启动tshark: {str(e)}"}), 500
+    
+    def close_stream():
+        # 响应关闭时一定会调用（包括客户端在生成器开始之前就断开），在这里释放名额
+        stream.close()
+        live_stream_slots.release()
+        print(f"[INFO] Live stream on {stream.interface} closed: {stream.stats['packets']} packets, "
+              f"first packet after {stream.stats['first_packet_ms']} ms")
+    
+    def generate_events():
+        aggregator = SecondAggregator() if mode == 'seconds' else None
+        last_event = time.time()
+        try:
+            yield f"event: start\ndata: {json.dumps({'interface': stream.interface, 'mode': mode, 'duration': duration}, ensure_ascii=False)}\n\n"
+            while True:
+                # 按秒聚合时等待到下一秒边界，逐包推送时等待下一个数据包
+                timeout = aggregator.second + 1 - time.time() if aggregator else JOB_EVENT_KEEPALIVE
+                try:
+                    record = stream.get(timeout)
+                except StopIteration:
+                    break
+                now = time.time()
+                if aggregator is not None:
+                    while now >= aggregator.second + 1:
+                        yield f"event: second\ndata: {json.dumps(aggregator.flush(), ensure_ascii=False)}\n\n"
+                    if record is not None:
+                        aggregator.add(record)
+                    continue
+                if record is None:
+                    if now - last_event >= JOB_EVENT_KEEPALIVE:
+                        last_event = now
+                        yield ": keepalive\n\n"
+                    continue
+                # 把已在队列中的数据包合并为一个事件，减少高速率下的事件开销
+                batch = [compact_packet(record)]
+                while len(batch) < LIVE_STREAM_BATCH:
+                    try:
+                        record = stream.get(0)
+                    except StopIteration:
+                        break
+                    if record is None:
+                        break
+                    batch.append(compact_packet(record))
+                last_event = now
+                yield f"event: packets\ndata: {json.dumps(batch, ensure_ascii=False)}\n\n"
+            if aggregator is not None and aggregator.packets:
+                yield f"event: second\ndata: {json.dumps(aggregator.flush(), ensure_ascii=False)}\n\n"
+            stream.close()
+            summary = {**stream.summary(), "error": stream.error()}
+            yield f"event: end\ndata: {json.dumps(summary, ensure_ascii=False)}\n\n"
+        finally:
+            stream.close()
+    
+    response = Response(
+        generate_events(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'Access-Control-Allow-Origin': '*'
+        }
+    )
+    response.call_on_close(close_stream)
+    return response
+
+@app.route('/api/metrics/top_talkers', methods=['GET'])
+def top_talkers():
+    """滑动窗口（1s/1m/5m）内的包速率、比特率以及按字节排序的源IP、目标端口和会话流
+
+    参数：interface（不指定时返回全部有数据的接口）、window（逗号分隔，默认全部）、top。
+    """
+    try:
+        windows = [w for w in request.args.get('window', ','.join(METRIC_WINDOWS)).split(',') if w]
+        unknown = [w for w in windows if w not in METRIC_WINDOWS]
+        if unknown:
+            return jsonify({"error": f"不支持的窗口: {', '.join(unknown)}，可选: {', '.join(METRIC_WINDOWS)}"}), 400
+        try:
+            top = max(1, min(int(request.args.get('top', DEFAULT_TOP)), MAX_TOP))
+        except ValueError:
+            return jsonify({"error": "top必须是整数"}), 400
+        interface = request.args.get('interface')
+        if interface:
+            metrics = stream_metrics.get(interface, create=False)
+            if metrics is None:
+                return jsonify({"error": f"接口 {interface} 还没有流量指标，请先启动持续采集或实时数据包流"}), 404
+            interfaces = [metrics]
+        else:
+            interfaces = [stream_metrics.get(name) for name in stream_metrics.interfaces()]
+        return jsonify({"success": True, "metrics": [m.snapshot(windows, top) for m in interfaces],
+                        "timestamp": datetime.now().isoformat()})
+    except Exception as e:
+        return jsonify({"error": f"获取流量指标时发生错误: {str(e)}"}), 500
+
 @app.route('/api/get_analysis_history', methods=['GET'])
 def get_analysis_history():
     """获取分析历史记录"""
@@ -303,21 +941,21 @@ def get_analysis_history():
         
         history = []
         
-        # 读取分析结果文件
+        # 读取分析结果文件（列式文件只读取页脚，旧版JSON文件需要完整解析）
         if os.path.exists(results_dir):
             for filename in os.listdir(results_dir):
-                if filename.endswith('.json'):
+                if is_document(filename):
                     filepath = os.path.join(results_dir, filename)
                     try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            history.append({
-                                "type": "analysis",
-                                "filename": filename,
-                                "timestamp": data.get('timestamp', ''),
-                                "packet_count": data.get('packet_count', 0),
-                                "source_file": data.get('source_file', '')
-                            })
+                        data = read_document_meta(filepath)
+                        history.append({
+                            "type": "analysis",
+                            "filename": filename,
+                            "timestamp": data.get('timestamp', ''),
+                            "packet_count": data.get('packet_count', 0),
+                            "source_file": data.get('source_file', ''),
+                            "tables": data.get('tables', {})
+                        })
                     except Exception as e:
                         print(f"[WARNING] Error reading {filepath}: {str(e)}")
         
@@ -333,6 +971,58 @@ def get_analysis_history():
     except Exception as e:
         return jsonify({"error": f"获取历史记录时发生错误: {str(e)}"}), 500
 
+@app.route('/api/stored_records/<kind>/<filename>', methods=['GET'])
+def get_stored_records(kind, filename):
+    """分页读取保存的结构化结果或实时采集文件中的一个记录表（列式文件和旧版JSON文件均可）
+
+    kind为analysis或capture；参数：table（默认packets）、columns（逗号分隔的列名投影）、
+    offset/limit分页（limit默认200，最大5000）、column/min/max按列的取值范围过滤（数值或字符串）。
+    """
+    try:
+        directory = STORED_RECORD_DIRS.get(kind)
+        if directory is None:
+            return jsonify({"error": f"kind必须是: {', '.join(STORED_RECORD_DIRS)}"}), 400
+        if filename != os.path.basename(filename) or not is_document(filename):
+            return jsonify({"error": "无效的文件名"}), 400
+        filepath = os.path.join(analyzer.data_dir, directory, filename)
+        if not os.path.exists(filepath):
+            return jsonify({"error": f"文件不存在: {filename}"}), 404
+        try:
+            offset = max(int(request.args.get('offset', 0)), 0)
+            limit = max(1, min(int(request.args.get('limit', DEFAULT_STORED_RECORDS)), MAX_STORED_RECORDS))
+        except ValueError:
+            return jsonify({"error": "offset/limit必须是整数"}), 400
+        table = request.args.get('table', 'packets')
+        columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()] or None
+        filters = None
+        if request.args.get('column'):
+            def bound(name):
+                value = request.args.get(name)
+                if value is None or value == '':
+                    return None
+                try:
+                    return float(value) if '.' in value else int(value)
+                except ValueError:
+                    return value
+            filters = {request.args['column']: (bound('min'), bound('max'))}
+        
+        start_time = time.time()
+        page = read_document_table(filepath, table, columns=columns, filters=filters, offset=offset, limit=limit)
+        return jsonify({
+            "success": True,
+            "filename": filename,
+            "table": table,
+            "total": page["total"],
+            "offset": offset,
+            "returned": len(page["rows"]),
+            "records": page["rows"],
+            "elapsed_ms": round((time.time() - start_time) * 1000, 2)
+        })
+    except StorageError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"读取记录时发生错误: {str(e)}"}), 500
+
 @app.route('/api/get_chat_history', methods=['GET'])
 def get_chat_history():
     """获取聊天历史"""
@@ -371,9 +1061,11 @@ def clear_chat_history():
 
 @app.route('/api/get_network_interfaces', methods=['GET'])
 def get_network_interfaces():
-    """获取可用的网络接口列表"""
+    """获取可用的网络接口列表（来自缓存，refresh=true时重新枚举），每项附带当前吞吐量"""
     try:
-        interfaces = analyzer.get_network_interfaces()
+        refresh = str(request.args.get('refresh', 'false')).lower() == 'true'
+        interface_inventory.start()
+        interfaces = interface_inventory.interfaces(refresh=refresh)
         
         return jsonify({
             "success": True,
@@ -384,17 +1076,52 @@ def get_network_interfaces():
     except Exception as e:
         return jsonify({"error": f"获取网络接口时发生错误: {str(e)}"}), 500
 
+@app.route('/api/interfaces/throughput', methods=['GET'])
+def interface_throughput():
+    """各接口的实时收发包速率和比特率，以及当前最繁忙的非回环接口"""
+    try:
+        refresh = str(request.args.get('refresh', 'false')).lower() == 'true'
+        interface_inventory.start()
+        return jsonify({"success": True, **interface_inventory.snapshot(refresh=refresh),
+                        "timestamp": datetime.now().isoformat()})
+    except Exception as e:
+        return jsonify({"error": f"获取接口吞吐量时发生错误: {str(e)}"}), 500
+
+@app.route('/api/preload_model', methods=['POST'])
+def preload_model():
+    """预热模型：让Ollama把模型加载进内存（不生成回复，也不经过回复缓存）"""
+    try:
+        data = request.json or {}
+        model = ollama.resolve_model(data.get('model'))
+        start_time = time.time()
+        try:
+            ollama.load_model(model)
+        except ModelCallError as e:
+            return jsonify({"error": f"AI服务调用失败，状态码: {e.status_code}"}), 500
+        return jsonify({"success": True, "model": model, "elapsed_ms": round((time.time() - start_time) * 1000, 2)})
+    except Exception as e:
+        return jsonify({"error": f"预热模型时发生错误: {str(e)}"}), 500
+
+@app.route('/api/llm_cache', methods=['GET'])
+def get_llm_cache_stats():
+    """模型回复缓存的命中率、条目数和占用空间"""
+    return jsonify({"success": True, **ollama.cache.stats(), "timestamp": datetime.now().isoformat()})
+
+@app.route('/api/llm_cache', methods=['DELETE'])
+def clear_llm_cache():
+    """清空模型回复缓存"""
+    try:
+        removed = ollama.cache.clear()
+        return jsonify({"success": True, "removed": removed})
+    except Exception as e:
+        return jsonify({"error": f"清空回复缓存时发生错误: {str(e)}"}), 500
+
 @app.route('/api/system_status', methods=['GET'])
 def system_status():
     """获取系统状态"""
     try:
         # 检查Ollama服务状态
-        ollama_status = "unknown"
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
-            ollama_status = "running" if response.status_code == 200 else "error"
-        except:
-            ollama_status = "offline"
+        ollama_status = ollama.status()
         
         # 检查数据目录状态
         data_dir_status = "ok" if os.path.exists(analyzer.data_dir) else "error"
@@ -402,8 +1129,15 @@ def system_status():
         return jsonify({
             "success": True,
             "ollama_service": ollama_status,
+            "ollama_client": ollama.stats(),
             "data_directory": data_dir_status,
             "active_sessions": len(chat_memory.sessions),
+            "analysis_cache": analyzer.cache.stats(),
+            "analysis_jobs": job_manager.stats(),
+            "uploads": upload_manager.stats(),
+            "upload_pipelines": upload_pipelines.stats(),
+            "retained_captures": analyzer.captures.stats(),
+            "live_captures": capture_service.stats(),
             "timestamp": datetime.now().isoformat()
         })
         
@@ -416,12 +1150,34 @@ if __name__ == '__main__':
     print("  - POST /api/chat - 与AI对话")
     print("  - POST /api/chat/stream - 与AI对话（流式响应）")
     print("  - POST /api/analyze_pcap - 分析pcap文件")
-    print("  - POST /api/capture_traffic - 实时捕获流量")
+    print("  - POST /api/jobs/analyze_pcap - 提交后台分析任务")
+    print("  - GET /api/jobs/<job_id> - 查询任务状态与结果")
+    print("  - GET /api/jobs/<job_id>/events - 订阅任务进度（SSE）")
+    print("  - POST /api/jobs/<job_id>/cancel - 取消任务")
+    print("  - POST /api/uploads - 创建分块上传会话（pipeline=true时边上传边解析）")
+    print("  - PUT /api/uploads/<upload_id> - 上传分块（Upload-Offset指定偏移量）")
+    print("  - GET /api/uploads/<upload_id> - 查询已确认的偏移量")
+    print("  - POST /api/uploads/<upload_id>/complete - 完成上传并提交分析任务")
+    print("  - POST /api/benchmark_profiles - 比较各字段配置的解析吞吐量")
+    print("  - GET /api/captures/<result_id> - 查询保留的抓包文件与索引")
+    print("  - GET /api/captures/<result_id>/packets - 按流ID或时间窗口读取数据包")
+    print("  - POST /api/capture_traffic - 实时捕获流量（单次少量采样）")
+    print("  - GET /api/capture_filters - 列出BPF采集过滤器与snaplen预设")
+    print("  - POST /api/live_capture/start - 启动持续环形缓冲采集")
+    print("  - POST /api/live_capture/stop - 停止持续采集")
+    print("  - GET /api/live_capture/status - 查询持续采集状态与分段分析结果")
+    print("  - GET /api/live_capture/stream - 以SSE实时推送数据包或每秒统计")
+    print("  - GET /api/metrics/top_talkers - 获取1s/1m/5m滑动窗口速率与重流量排行")
     print("  - GET /api/get_network_interfaces - 获取网络接口列表")
+    print("  - GET /api/interfaces/throughput - 获取各接口实时吞吐量")
     print("  - GET /api/get_analysis_history - 获取分析历史")
+    print("  - GET /api/stored_records/<kind>/<filename> - 分页读取保存的记录表（列投影/范围过滤）")
     print("  - GET /api/get_chat_history - 获取聊天历史")
     print("  - POST /api/clear_chat_history - 清空聊天历史")
+    print("  - POST /api/preload_model - 预热模型")
+    print("  - GET/DELETE /api/llm_cache - 模型回复缓存统计/清空")
     print("  - GET /api/system_status - 获取系统状态")
     print("  - GET /api/health - 健康检查")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # 每个请求在独立线程中处理，分析器本身无共享的临时文件，并发上传不会相互覆盖
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""BPF采集过滤器与截断长度（snaplen）下推
+
+实时采集时把BPF过滤器和snaplen交给tshark（-f/-s），由内核和libpcap在复制数据包之前丢弃无关流量；
+离线分析时先用tcpdump按BPF过滤、editcap按snaplen截断生成较小的抓包文件，再交给解析器。
+没有tcpdump时，预设过滤器退回到等价的tshark显示过滤器（解析后过滤，速度较慢）。
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+# 常见CDN网段，校园网分析时通常可以排除；可用CDN_EXCLUDE_NETS环境变量（逗号分隔）替换
+DEFAULT_CDN_NETS = [
+    "104.16.0.0/13", "172.64.0.0/13",     # Cloudflare
+    "23.0.0.0/12", "184.24.0.0/13",       # Akamai
+    "151.101.0.0/16",                      # Fastly
+    "13.32.0.0/15", "18.64.0.0/14",       # CloudFront
+]
+CDN_NETS = [net.strip() for net in os.environ.get('CDN_EXCLUDE_NETS', ",".join(DEFAULT_CDN_NETS)).split(",")
+            if net.strip()]
+
+# 以太网 + IPv6/IPv4选项 + TCP选项的头部长度上限，截断后仍能完整解码到传输层
+HEADERS_ONLY_SNAPLEN = 128
+
+MIN_SNAPLEN = 64
+MAX_SNAPLEN = 262144
+
+# 预设：bpf为采集过滤器，display_filter为没有tcpdump时离线使用的等价显示过滤器
+CAPTURE_FILTER_PRESETS = {
+    "tcp_udp": {
+        "description": "只保留TCP和UDP流量",
+        "bpf": "tcp or udp",
+        "display_filter": "tcp or udp",
+        "snaplen": None,
+    },
+    "headers_only": {
+        "description": f"只保留每个数据包的前{HEADERS_ONLY_SNAPLEN}字节（协议头部），不保存载荷",
+        "bpf": None,
+        "display_filter": None,
+        "snaplen": HEADERS_ONLY_SNAPLEN,
+    },
+    "exclude_cdn": {
+        "description": "排除常见CDN网段的流量（视频、软件更新等大流量下载）",
+        "bpf": " and ".join(f"not net {net}" for net in CDN_NETS),
+        "display_filter": " && ".join(f"!(ip.addr == {net})" for net in CDN_NETS),
+        "snaplen": None,
+    },
+    "dns_only": {
+        "description": "只保留DNS查询与响应",
+        "bpf": "port 53",
+        "display_filter": "dns",
+        "snaplen": None,
+    },
+    "web_only": {
+        "description": "只保留HTTP/HTTPS流量",
+        "bpf": "tcp port 80 or tcp port 443",
+        "display_filter": "tcp.port in {80 443}",
+        "snaplen": None,
+    },
+}
+
+
+class CaptureFilterError(ValueError):
+    """过滤参数无效，或当前环境无法对离线文件应用该过滤器"""
+
+
+def resolve_capture_filter(preset: str = None, bpf: str = None, snaplen: Any = None) -> Optional[Dict[str, Any]]:
+    """合并预设与自定义BPF过滤器和snaplen，三者都未指定时返回None
+
+    同时给出预设和自定义过滤器时两者取交集；自定义snaplen优先于预设。
+    """
+    display_filter = None
+    preset_snaplen = None
+    bpf = (bpf or "").strip() or None
+    if bpf and bpf.startswith("-"):
+        # 过滤器作为命令行参数传给tcpdump/tshark，不能被解析成选项
+        raise CaptureFilterError("BPF过滤器不能以'-'开头")
+    if preset:
+        if preset not in CAPTURE_FILTER_PRESETS:
+            raise CaptureFilterError(f"未知的过滤预设: {preset}，可选: {', '.join(CAPTURE_FILTER_PRESETS)}")
+        definition = CAPTURE_FILTER_PRESETS[preset]
+        preset_snaplen = definition["snaplen"]
+        if definition["bpf"] and bpf:
+            bpf = f"({definition['bpf']}) and ({bpf})"
+        elif definition["bpf"]:
+            bpf = definition["bpf"]
+            display_filter = definition["display_filter"]
+    bpf = (bpf or "").strip() or None
+
+    if snaplen in (None, "", 0, "0"):
+        snaplen = preset_snaplen
+    else:
+        try:
+            snaplen = int(snaplen)
+        except (TypeError, ValueError):
+            raise CaptureFilterError("snaplen必须是整数")
+        if not MIN_SNAPLEN <= snaplen <= MAX_SNAPLEN:
+            raise CaptureFilterError(f"snaplen范围为{MIN_SNAPLEN}-{MAX_SNAPLEN}")
+
+    if bpf is None and snaplen is None:
+        return None
+    return {"preset": preset or None, "bpf": bpf, "display_filter": display_filter, "snaplen": snaplen}
+
+
+def capture_args(capture_filter: Optional[Dict[str, Any]]) -> list:
+    """实时采集时追加给tshark/dumpcap的参数"""
+    args = []
+    if capture_filter and capture_filter["bpf"]:
+        args += ["-f", capture_filter["bpf"]]
+    if capture_filter and capture_filter["snaplen"]:
+        args += ["-s", str(capture_filter["snaplen"])]
+    return args
+
+
+def _run(cmd: list, **kwargs):
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.run(cmd, stderr=err_file, **kwargs)
+        if proc.returncode != 0:
+            err_file.seek(0)
+            message = err_file.read().decode("utf-8", errors="ignore").strip().splitlines()
+            raise CaptureFilterError(f"{cmd[0]}执行失败: {message[-1] if message else proc.returncode}")
+
+
+def prefilter_capture(src_path: str, dst_dir: str, capture_filter: Dict[str, Any]) -> Dict[str, Any]:
+    """按过滤参数生成较小的抓包文件，返回{"path", "method", "input_bytes", "output_bytes", "seconds"}"""
+    start_time = time.time()
+    bpf = capture_filter.get("bpf")
+    snaplen = capture_filter.get("snaplen")
+    # 保持原文件格式，pcapng可能包含多种链路类型，不能转换为pcap
+    out_format = "pcap" if os.path.splitext(src_path)[1].lower() in (".pcap", ".cap") else "pcapng"
+
+    if bpf and shutil.which("tcpdump"):
+        # tcpdump只输出pcap格式；需要截断时直接通过管道交给editcap，不落中间文件
+        dst_path = os.path.join(dst_dir, "filtered.pcap")
+        method = "tcpdump"
+        if snaplen:
+            method = "tcpdump+editcap"
+            with tempfile.TemporaryFile() as err_file:
+                dump = subprocess.Popen(["tcpdump", "-r", src_path, "-w", "-", "--", bpf],
+                                        stdout=subprocess.PIPE, stderr=err_file)
+                try:
+                    _run(["editcap", "-F", "pcap", "-s", str(snaplen), "-", dst_path], stdin=dump.stdout)
+                finally:
+                    dump.stdout.close()
+                    returncode = dump.wait()
+                if returncode != 0:
+                    err_file.seek(0)
+                    message = err_file.read().decode("utf-8", errors="ignore").strip().splitlines()
+                    raise CaptureFilterError(f"tcpdump执行失败: {message[-1] if message else returncode}")
+        else:
+            _run(["tcpdump", "-r", src_path, "-w", dst_path, "--", bpf], stdout=subprocess.DEVNULL)
+    elif bpf:
+        if not capture_filter.get("display_filter"):
+            raise CaptureFilterError("未安装tcpdump，无法对离线文件应用自定义BPF过滤器，请使用预设或安装tcpdump")
+        # 显示过滤器在完整解析后才生效，只在没有tcpdump时使用
+        dst_path = os.path.join(dst_dir, f"filtered.{out_format}")
+        method = "display_filter"
+        _run(["tshark", "-r", src_path, "-n", "-Y", capture_filter["display_filter"],
+              "-F", out_format, "-w", dst_path], stdout=subprocess.DEVNULL)
+        if snaplen:
+            method = "display_filter+editcap"
+            truncated = os.path.join(dst_dir, f"truncated.{out_format}")
+            _run(["editcap", "-s", str(snaplen), "-F", out_format, dst_path, truncated], stdout=subprocess.DEVNULL)
+            os.remove(dst_path)
+            dst_path = truncated
+    else:
+        dst_path = os.path.join(dst_dir, f"truncated.{out_format}")
+        method = "editcap"
+        _run(["editcap", "-s", str(snaplen), "-F", out_format, src_path, dst_path], stdout=subprocess.DEVNULL)
+
+    info = {
+        "path": dst_path,
+        "method": method,
+        "input_bytes": os.path.getsize(src_path),
+        "output_bytes": os.path.getsize(dst_path),
+        "seconds": round(time.time() - start_time, 3),
+    }
+    print(f"[INFO] Prefiltered capture with {method}: {info['input_bytes']} -> {info['output_bytes']} bytes "
+          f"in {info['seconds']}s")
+    return info
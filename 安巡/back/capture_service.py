@@ -0,0 +1,351 @@
+"""持续环形缓冲抓包服务
+
+每个接口运行一个长期的tshark进程，以环形缓冲（-b filesize/-b duration/-b files）写入分段文件，
+磁盘占用不超过 分段大小×分段数。监视线程在tshark切换到新分段后，把已写完的分段交给分析流程
+（建表→流聚合→启发式检测），采集同时继续进行。每个接口只保留最近若干个分段的分析摘要，
+内存占用与运行时长无关；丢包计数取自分段中的接口统计块（ISB），进程退出时再以tshark的汇总输出补充。
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+from detectors import merge_findings, risk_rank, run_detectors
+from flow_table import FlowTable
+from pcap_reader import CaptureFile, UnsupportedCaptureError
+
+DEFAULT_SEGMENT_MB = 16
+DEFAULT_SEGMENT_FILES = 8
+DEFAULT_SEGMENT_SECONDS = 30
+MAX_SEGMENT_MB = 1024
+MAX_SEGMENT_FILES = 64
+SEGMENT_HISTORY = 120
+POLL_INTERVAL = 1.0
+STOP_TIMEOUT = 10
+
+CAPTURE_STATES = ("running", "stopping", "stopped", "failed")
+
+# tshark/dumpcap退出时输出的汇总，例如：Packets received/dropped on interface 'eth0': 1000/3 (pcap:3/dumpcap:0/flushed:0/ps_ifdrop:0)
+_DROP_SUMMARY = re.compile(r"Packets received/dropped on interface '([^']*)': (\d+)/(\d+)")
+_SEGMENT_NAME = re.compile(r"^ring_(\d+)_\d+.*\.pcap(ng)?$")
+
+
+class CaptureServiceError(Exception):
+    """采集请求无效，status为对应的HTTP状态码"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class CaptureSession:
+    """单个接口上的环形缓冲采集"""
+
+    def __init__(self, analyzer, interface: str, segment_dir: str, segment_mb: int = DEFAULT_SEGMENT_MB,
+                 segment_files: int = DEFAULT_SEGMENT_FILES, segment_seconds: int = DEFAULT_SEGMENT_SECONDS,
+                 capture_filter: str = None, parser: str = "native",
+                 on_segment: Callable[["CaptureSession", Dict[str, Any], str], None] = None, metrics=None):
+        self.analyzer = analyzer
+        self.interface = interface
+        self.segment_dir = segment_dir
+        self.segment_mb = segment_mb
+        self.segment_files = segment_files
+        self.segment_seconds = segment_seconds
+        self.capture_filter = capture_filter
+        self.parser = parser
+        self.on_segment = on_segment
+        self.metrics = metrics  # MetricsRegistry
+        self.state = "running"
+        self.error = None
+        self.started_at = time.time()
+        self.stopped_at = None
+        self.segments: deque = deque(maxlen=SEGMENT_HISTORY)
+        self.totals = {"segments_processed": 0, "segments_skipped": 0, "segments_failed": 0, "packets": 0, "bytes": 0, "findings": 0}
+        self.drops = {"received": None, "if_dropped": None, "os_dropped": None, "source": None}
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._err_file = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(self._command(), stdout=subprocess.DEVNULL, stderr=self._err_file)
+        print(f"[INFO] Started ring-buffer capture on {interface} (pid {self.proc.pid}): {' '.join(self._command())}")
+        self._watcher = threading.Thread(target=self._watch, name=f"capture-{interface}", daemon=True)
+        self._watcher.start()
+
+    def _command(self) -> List[str]:
+        cmd = ["tshark", "-i", self.interface, "-q", "-n",
+               "-w", os.path.join(self.segment_dir, "ring.pcapng"),
+               "-b", f"filesize:{self.segment_mb * 1024}",
+               "-b", f"files:{self.segment_files}"]
+        if self.segment_seconds:
+            cmd += ["-b", f"duration:{self.segment_seconds}"]
+        if self.capture_filter:
+            cmd += ["-f", self.capture_filter]
+        return cmd
+
+    def _list_segments(self) -> List[tuple]:
+        segments = []
+        for name in os.listdir(self.segment_dir):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(self.segment_dir, name)))
+        return sorted(segments)
+
+    def _watch(self):
+        try:
+            while not self._stop.is_set():
+                self._poll(final=False)
+                if self.proc.poll() is not None:
+                    break
+                self._stop.wait(POLL_INTERVAL)
+            self.proc.wait()
+            self._poll(final=True)
+            self._read_exit_summary()
+            if self.proc.returncode not in (0, -15) and self.state != "stopping":
+                self.state = "failed"
+                self.error = self.error or f"tshark退出，返回码 {self.proc.returncode}"
+            elif self.state != "failed":
+                self.state = "stopped"
+        except Exception as e:
+            print(f"[ERROR] Capture watcher for {self.interface} failed: {str(e)}")
+            self.state = "failed"
+            self.error = str(e)
+            if self.proc.poll() is None:
+                self.proc.kill()
+        finally:
+            self.stopped_at = time.time()
+            self._err_file.close()
+            shutil.rmtree(self.segment_dir, ignore_errors=True)
+            print(f"[INFO] Ring-buffer capture on {self.interface} {self.state}")
+
+    def _poll(self, final: bool):
+        """处理所有已写完的分段：运行中时最新的分段仍在写入，进程退出后全部分段都已完成"""
+        segments = self._list_segments()
+        if not final:
+            segments = segments[:-1]
+        for seq, path in segments:
+            if seq <= self._last_seq:
+                continue
+            if seq > self._last_seq + 1:
+                # 分析跟不上采集时，环形缓冲可能已覆盖较早的分段
+                self.totals["segments_skipped"] += seq - self._last_seq - 1
+            self._last_seq = seq
+            try:
+                self._process_segment(seq, path)
+            except FileNotFoundError:
+                self.totals["segments_skipped"] += 1
+            except Exception as e:
+                # 单个分段损坏不影响后续分段
+                print(f"[WARNING] Failed to analyze segment {seq} on {self.interface}: {str(e)}")
+                self.totals["segments_failed"] += 1
+
+    def _process_segment(self, seq: int, path: str):
+        start_time = time.time()
+        parsed = self.analyzer.parse_capture(path, parser=self.parser, sample_size=0, profile="five_tuple")
+        table = parsed["table"]
+        # 有数据包后才为接口创建滑动窗口指标
+        metrics = self.metrics.get(self.interface, create=len(table) > 0) if self.metrics is not None else None
+        if metrics is not None:
+            metrics.add_table(table)
+        flow_table = FlowTable()
+        flow_table.add_table(table)
+        detection = run_detectors(table) if len(table) else {"findings": [], "risk_level": "低"}
+        fanout = []
+        if metrics is not None:
+            # 跨分段合并的扇出估计能发现单个分段内达不到阈值的慢速扫描
+            fanout = metrics.scanners("5m")
+            detection = merge_findings(detection, fanout)
+        summary = table.summary(top=5)
+        self._read_drop_counters(path)
+
+        result = {
+            "segment": seq,
+            "file": os.path.basename(path),
+            "file_bytes": os.path.getsize(path),
+            "packets": len(table),
+            "bytes": summary.get("total_bytes", 0),
+            "start_time": summary.get("start_time"),
+            "end_time": summary.get("end_time"),
+            "statistics": summary,
+            "flows": flow_table.overview(),
+            "top_flows": flow_table.summaries(limit=5),
+            "findings": detection["findings"][:10],
+            "fanout_findings": fanout[:10],
+            "risk_level": detection["risk_level"],
+            "parser": parsed["stats"].get("parser"),
+            "analysis_seconds": round(time.time() - start_time, 3),
+            "processed_at": time.time(),
+        }
+        with self._lock:
+            self.segments.append(result)
+            self.totals["segments_processed"] += 1
+            self.totals["packets"] += result["packets"]
+            self.totals["bytes"] += result["bytes"]
+            self.totals["findings"] += len(detection["findings"])
+        print(f"[INFO] Segment {seq} on {self.interface}: {result['packets']} packets, "
+              f"risk {result['risk_level']}, {result['analysis_seconds']}s")
+        if self.on_segment:
+            try:
+                self.on_segment(self, result, path)
+            except Exception as e:
+                print(f"[WARNING] Segment callback failed for {self.interface}: {str(e)}")
+
+    def _read_drop_counters(self, path: str):
+        """ISB中的计数器是从采集开始累计的，取最新分段的值即可"""
+        try:
+            with CaptureFile(path, check_interfaces=False) as capture:
+                counters = capture.interface_statistics()
+        except (UnsupportedCaptureError, OSError):
+            return
+        if not counters:
+            return
+        self.drops = {
+            "received": sum(c.get("ifrecv", 0) for c in counters.values()),
+            "if_dropped": sum(c.get("ifdrop", 0) for c in counters.values()),
+            "os_dropped": sum(c.get("osdrop", 0) for c in counters.values()),
+            "source": "isb",
+        }
+
+    def _read_exit_summary(self):
+        self._err_file.seek(0)
+        stderr = self._err_file.read().decode("utf-8", errors="ignore")
+        matches = _DROP_SUMMARY.findall(stderr)
+        if matches:
+            self.drops = {
+                "received": sum(int(received) for _, received, _ in matches),
+                "if_dropped": sum(int(dropped) for _, _, dropped in matches),
+                "os_dropped": self.drops.get("os_dropped"),
+                "source": "tshark",
+            }
+        if self.proc.returncode not in (0, -15) and stderr.strip():
+            self.error = stderr.strip().splitlines()[-1]
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """终止tshark并等待最后一个分段分析完成"""
+        if self.state == "running":
+            self.state = "stopping"
+        self._stop.set()
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self._watcher.join(timeout)
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("running", "stopping")
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for _, path in self._list_segments() if os.path.isdir(self.segment_dir) else []:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def to_dict(self, segments: int = 1) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self.segments)[-segments:] if segments else []
+            risk_level = max((s["risk_level"] for s in self.segments), key=risk_rank, default="低")
+            totals = dict(self.totals)
+        end = self.stopped_at or time.time()
+        return {
+            "interface": self.interface,
+            "state": self.state,
+            "pid": self.proc.pid,
+            "started_at": self.started_at,
+            "uptime_seconds": round(end - self.started_at, 1),
+            "capture_filter": self.capture_filter,
+            "ring": {
+                "segment_mb": self.segment_mb,
+                "segment_files": self.segment_files,
+                "segment_seconds": self.segment_seconds,
+                "max_disk_bytes": self.segment_mb * 1024 * 1024 * self.segment_files,
+                "disk_bytes": self.disk_bytes(),
+            },
+            "totals": totals,
+            "drops": self.drops,
+            "risk_level": risk_level,
+            "recent_segments": recent,
+            "error": self.error,
+        }
+
+
+class CaptureService:
+    """按接口管理环形缓冲采集，限制同时运行的采集数"""
+
+    def __init__(self, analyzer, root_dir: str, max_sessions: int = 4, metrics=None):
+        self.analyzer = analyzer
+        self.metrics = metrics  # MetricsRegistry，分段数据包同时计入对应接口的滑动窗口指标
+        self.root_dir = root_dir
+        self.max_sessions = max_sessions
+        self.sessions: Dict[str, CaptureSession] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def start(self, interface: str, segment_mb: int = DEFAULT_SEGMENT_MB, segment_files: int = DEFAULT_SEGMENT_FILES,
+              segment_seconds: int = DEFAULT_SEGMENT_SECONDS, capture_filter: str = None, parser: str = "native",
+              on_segment: Callable = None) -> CaptureSession:
+        if not interface or len(interface) > 256:
+            raise CaptureServiceError("无效的接口名称")
+        if not 1 <= segment_mb <= MAX_SEGMENT_MB:
+            raise CaptureServiceError(f"分段大小必须在1-{MAX_SEGMENT_MB}MB之间")
+        if not 2 <= segment_files <= MAX_SEGMENT_FILES:
+            raise CaptureServiceError(f"分段数必须在2-{MAX_SEGMENT_FILES}之间")
+        if segment_seconds < 0:
+            raise CaptureServiceError("分段时长不能为负数")
+
+        with self._lock:
+            existing = self.sessions.get(interface)
+            if existing is not None and existing.active:
+                raise CaptureServiceError(f"接口 {interface} 上已有运行中的采集", status=409)
+            if sum(1 for s in self.sessions.values() if s.active) >= self.max_sessions:
+                raise CaptureServiceError(f"同时运行的采集数已达上限 {self.max_sessions}", status=429)
+            segment_dir = tempfile.mkdtemp(prefix="ring_", dir=self.root_dir)
+            try:
+                session = CaptureSession(self.analyzer, interface, segment_dir, segment_mb, segment_files,
+                                         segment_seconds, capture_filter, parser, on_segment, self.metrics)
+            except OSError as e:
+                shutil.rmtree(segment_dir, ignore_errors=True)
+                raise CaptureServiceError(f"无法启动tshark: {str(e)}", status=500)
+            self.sessions[interface] = session
+        return session
+
+    def get(self, interface: str) -> CaptureSession:
+        with self._lock:
+            session = self.sessions.get(interface)
+        if session is None:
+            raise CaptureServiceError(f"接口 {interface} 上没有采集", status=404)
+        return session
+
+    def stop(self, interface: str) -> CaptureSession:
+        session = self.get(interface)
+        session.stop()
+        return session
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.stop()
+
+    def status(self, segments: int = 1) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return [session.to_dict(segments) for session in sessions]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return {
+            "active_captures": sum(1 for s in sessions if s.active),
+            "max_sessions": self.max_sessions,
+            "interfaces": [s.interface for s in sessions if s.active],
+        }
@@ -0,0 +1,335 @@
+"""启发式检测器
+
+在调用大模型之前，用NumPy对全部数据包做向量化检测：端口扫描扇出、SYN洪泛、P2P下载、
+周期性心跳（beaconing）和异常大流量上传。检测得分用于挑选送入提示词的会话流，
+并给出一个确定性的基线风险等级。
+"""
+import heapq
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from packet_table import PacketTable, IPPROTO_TCP, IPPROTO_UDP, TCP_SYN, TCP_ACK
+from flow_table import FlowTable
+
+# 检测阈值
+SCAN_MIN_PORTS = 100          # 单个源访问的不同目标端口数
+SCAN_MIN_HOSTS = 50           # 单个源访问的不同目标主机数
+SYN_FLOOD_MIN_SYNS = 200      # 单个目标收到的纯SYN包数
+SYN_FLOOD_MIN_RATIO = 3.0     # 纯SYN与SYN-ACK数量之比
+P2P_PORTS = (4662, 4672, 6346, 6347, 6881, 6882, 6883, 6884, 6885, 6886, 6887, 6888, 6889, 6969, 51413)
+P2P_MIN_PEERS = 30            # 高端口对高端口通信的不同对端数
+P2P_MIN_PORT_PACKETS = 20     # 使用P2P端口的最少包数
+BEACON_MIN_PACKETS = 8        # 判定心跳所需的最少包数
+BEACON_MIN_INTERVAL = 1.0     # 心跳平均间隔下限（秒），排除连续传输
+BEACON_MAX_CV = 0.1           # 包间隔变异系数上限
+UPLOAD_MIN_BYTES = 10 * 1024 * 1024
+UPLOAD_MIN_ZSCORE = 3.5
+MAX_FINDINGS_PER_DETECTOR = 200
+
+
+def _risk_level(score: float) -> str:
+    if score >= 0.7:
+        return "高"
+    if score >= 0.4:
+        return "中"
+    return "低"
+
+
+RISK_LEVELS = ("低", "中", "高")
+
+
+def risk_rank(level: str) -> int:
+    """风险等级排序值，兼容"中等"、"high"等模型自由输出"""
+    level = str(level).lower()
+    if "高" in level or "high" in level:
+        return 2
+    if "中" in level or "medium" in level:
+        return 1
+    return 0
+
+
+def _finding(detector: str, score: float, description: str, **evidence) -> Dict[str, Any]:
+    score = round(float(min(max(score, 0.0), 1.0)), 3)
+    return {"detector": detector, "score": score, "severity": _risk_level(score),
+            "description": description, **evidence}
+
+
+def _top(candidates: np.ndarray, scores: np.ndarray):
+    """按得分降序取前MAX_FINDINGS_PER_DETECTOR个候选，返回(下标, 得分)列表"""
+    order = np.argsort(scores)[::-1][:MAX_FINDINGS_PER_DETECTOR]
+    return list(zip(candidates[order].tolist(), scores[order].tolist()))
+
+
+def _sorted_groups(keys: np.ndarray):
+    """对整数键排序并分组，返回(排序下标, 每行所属组号, 各组的键)
+
+    比np.unique(return_inverse=True)更快，且组号与排序后的行一一对应。
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    boundary = np.empty(len(sorted_keys), dtype=bool)
+    boundary[:1] = True
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=boundary[1:])
+    group = np.cumsum(boundary) - 1
+    return order, group, sorted_keys[boundary]
+
+
+def _group_distinct(groups: np.ndarray, values: np.ndarray, group_count: int) -> np.ndarray:
+    """统计每个分组内不同取值的个数"""
+    if not len(groups):
+        return np.zeros(group_count, dtype=np.int64)
+    keys = np.sort(groups.astype(np.int64) << 32 | values.astype(np.int64))
+    distinct = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    return np.bincount((distinct >> 32).astype(np.int64), minlength=group_count)
+
+
+def detect_port_scans(table: PacketTable) -> List[Dict[str, Any]]:
+    """端口扫描/主机扫描：单个源IP访问大量不同端口或主机，且多数为未完成握手的SYN"""
+    src = table["src_ip"]
+    n_src = len(table.dictionaries["src_ip"])
+    distinct_ports = _group_distinct(src, table["dst_port"], n_src)
+    distinct_hosts = _group_distinct(src, table["dst_ip"], n_src)
+    is_syn = (table["ip_proto"] == IPPROTO_TCP) & ((table["tcp_flags"] & (TCP_SYN | TCP_ACK)) == TCP_SYN)
+    packets = np.bincount(src, minlength=n_src)
+    syn_ratio = np.bincount(src, weights=is_syn, minlength=n_src) / np.maximum(packets, 1)
+
+    flagged = np.nonzero((distinct_ports >= SCAN_MIN_PORTS) | (distinct_hosts >= SCAN_MIN_HOSTS))[0]
+    fanout = np.maximum(distinct_ports[flagged] / SCAN_MIN_PORTS, distinct_hosts[flagged] / SCAN_MIN_HOSTS)
+    scores = 0.4 + 0.3 * np.minimum(np.log10(fanout) + 0.5, 1.0) + 0.3 * syn_ratio[flagged]
+
+    findings = []
+    for code, score in _top(flagged, scores):
+        kind = "端口扫描" if distinct_ports[code] >= SCAN_MIN_PORTS else "主机扫描"
+        findings.append(_finding(
+            "port_scan", score,
+            f"{table.dictionaries['src_ip'][code]} 疑似{kind}：访问{int(distinct_hosts[code])}个主机、"
+            f"{int(distinct_ports[code])}个端口，纯SYN占比{syn_ratio[code]:.0%}",
+            ip=table.dictionaries["src_ip"][code], distinct_hosts=int(distinct_hosts[code]),
+            distinct_ports=int(distinct_ports[code]), syn_ratio=round(float(syn_ratio[code]), 3)))
+    return findings
+
+
+def detect_syn_floods(table: PacketTable) -> List[Dict[str, Any]]:
+    """SYN洪泛：目标收到大量纯SYN但很少回应SYN-ACK"""
+    is_tcp = table["ip_proto"] == IPPROTO_TCP
+    flags = table["tcp_flags"] & (TCP_SYN | TCP_ACK)
+    syn_mask = is_tcp & (flags == TCP_SYN)
+    synack_mask = is_tcp & (flags == (TCP_SYN | TCP_ACK))
+    if not syn_mask.any():
+        return []
+
+    # SYN按目标统计，SYN-ACK按源统计，两者需映射到同一个IP空间
+    dst_names = table.dictionaries["dst_ip"]
+    src_index = {ip: code for code, ip in enumerate(table.dictionaries["src_ip"])}
+    syns = np.bincount(table["dst_ip"][syn_mask], minlength=len(dst_names))
+    synacks_by_src = np.bincount(table["src_ip"][synack_mask], minlength=len(table.dictionaries["src_ip"]))
+    times = table["time_epoch"]
+    duration = max(float(times.max() - times.min()), 1.0)
+
+    findings = []
+    for code in np.nonzero(syns >= SYN_FLOOD_MIN_SYNS)[0]:
+        ip = dst_names[code]
+        synacks = int(synacks_by_src[src_index[ip]]) if ip in src_index else 0
+        ratio = syns[code] / max(synacks, 1)
+        if ratio < SYN_FLOOD_MIN_RATIO:
+            continue
+        score = 0.5 + 0.5 * min(np.log10(ratio / SYN_FLOOD_MIN_RATIO + 1), 1.0)
+        findings.append(_finding(
+            "syn_flood", score,
+            f"{ip} 收到{int(syns[code])}个纯SYN包但仅回应{synacks}个SYN-ACK，疑似SYN洪泛攻击",
+            ip=ip, syn_packets=int(syns[code]), synack_packets=synacks,
+            syn_rate=round(float(syns[code]) / duration, 2)))
+    return findings
+
+
+def detect_p2p(table: PacketTable) -> List[Dict[str, Any]]:
+    """P2P下载：使用常见P2P端口，或与大量对端进行高端口对高端口通信"""
+    src = table["src_ip"]
+    n_src = len(table.dictionaries["src_ip"])
+    sport, dport = table["src_port"], table["dst_port"]
+    known_port = np.isin(dport, P2P_PORTS) | np.isin(sport, P2P_PORTS)
+    high_ports = (sport > 1024) & (dport > 1024) & ((table["ip_proto"] == IPPROTO_TCP) |
+                                                     (table["ip_proto"] == IPPROTO_UDP))
+    known_packets = np.bincount(src[known_port], minlength=n_src)
+    peers = _group_distinct(src[high_ports], table["dst_ip"][high_ports], n_src)
+    p2p_bytes = np.bincount(src[known_port | high_ports], weights=table["frame_len"][known_port | high_ports],
+                            minlength=n_src)
+
+    flagged = np.nonzero((known_packets >= P2P_MIN_PORT_PACKETS) | (peers >= P2P_MIN_PEERS))[0]
+    scores = (0.3 + 0.2 * (known_packets[flagged] >= P2P_MIN_PORT_PACKETS)
+              + 0.3 * np.minimum(peers[flagged] / (P2P_MIN_PEERS * 3), 1.0))
+
+    findings = []
+    for code, score in _top(flagged, scores):
+        findings.append(_finding(
+            "p2p", score,
+            f"{table.dictionaries['src_ip'][code]} 疑似P2P下载：P2P端口包{int(known_packets[code])}个，"
+            f"高端口对端{int(peers[code])}个",
+            ip=table.dictionaries["src_ip"][code], p2p_port_packets=int(known_packets[code]),
+            high_port_peers=int(peers[code]), bytes=int(p2p_bytes[code])))
+    return findings
+
+
+def detect_beaconing(table: PacketTable) -> List[Dict[str, Any]]:
+    """周期性心跳：同一(源, 目标, 目标端口)的包间隔高度规律，常见于木马回连"""
+    if len(table) < BEACON_MIN_PACKETS:
+        return []
+    n_dst = len(table.dictionaries["dst_ip"])
+    pair = (table["src_ip"].astype(np.int64) * n_dst + table["dst_ip"]) * 65536 + table["dst_port"]
+    # 先按时间排序，再对键做稳定排序，得到组内按时间有序的行
+    by_time = np.argsort(table["time_epoch"], kind="stable")
+    order, group, _ = _sorted_groups(pair[by_time])
+    order = by_time[order]
+    times = table["time_epoch"][order]
+    counts = np.bincount(group)
+    same = group[1:] == group[:-1]
+    iat = np.diff(times)[same]
+    iat_group = group[1:][same]
+    n_groups = len(counts)
+    iat_count = np.bincount(iat_group, minlength=n_groups)
+    iat_sum = np.bincount(iat_group, weights=iat, minlength=n_groups)
+    iat_sq = np.bincount(iat_group, weights=iat * iat, minlength=n_groups)
+    mean = iat_sum / np.maximum(iat_count, 1)
+    std = np.sqrt(np.maximum(iat_sq / np.maximum(iat_count, 1) - mean * mean, 0.0))
+    cv = std / np.maximum(mean, 1e-9)
+
+    candidates = np.nonzero((counts >= BEACON_MIN_PACKETS) & (mean >= BEACON_MIN_INTERVAL) & (cv <= BEACON_MAX_CV))[0]
+    if not len(candidates):
+        return []
+    scores = 0.4 + 0.3 * (1 - cv[candidates] / BEACON_MAX_CV) + 0.3 * np.minimum(counts[candidates] / 100, 1.0)
+    findings = []
+    for g, score in _top(candidates, scores):
+        row = order[np.searchsorted(group, g)]
+        src_ip = table.dictionaries["src_ip"][table["src_ip"][row]]
+        dst_ip = table.dictionaries["dst_ip"][table["dst_ip"][row]]
+        dst_port = int(table["dst_port"][row])
+        findings.append(_finding(
+            "beaconing", score,
+            f"{src_ip} -> {dst_ip}:{dst_port} 每{mean[g]:.1f}秒规律通信{int(counts[g])}次（变异系数{cv[g]:.3f}），疑似心跳回连",
+            ip=src_ip, peer_ip=dst_ip, dst_port=dst_port, packets=int(counts[g]),
+            interval=round(float(mean[g]), 3), interval_cv=round(float(cv[g]), 4)))
+    return findings
+
+
+def detect_large_uploads(table: PacketTable) -> List[Dict[str, Any]]:
+    """异常大流量上传：按(源, 目标)统计发送字节数，用中位数绝对偏差找离群值"""
+    n_dst = len(table.dictionaries["dst_ip"])
+    pair = table["src_ip"].astype(np.int64) * n_dst + table["dst_ip"]
+    order, group, keys = _sorted_groups(pair)
+    sent = np.bincount(group, weights=table["payload_len"][order], minlength=len(keys))
+    if len(keys) < 3:
+        return []
+
+    log_sent = np.log1p(sent)
+    median = np.median(log_sent)
+    mad = max(float(np.median(np.abs(log_sent - median))), 0.1)  # 对数尺度下的下限，避免MAD为0时得分失真
+    zscore = 0.6745 * (log_sent - median) / mad
+
+    flagged = np.nonzero((sent >= UPLOAD_MIN_BYTES) & (zscore >= UPLOAD_MIN_ZSCORE))[0]
+    scores = (0.4 + 0.4 * np.minimum(zscore[flagged] / (UPLOAD_MIN_ZSCORE * 3), 1.0)
+              + 0.2 * np.minimum(sent[flagged] / (1 << 30), 1.0))
+    findings = []
+    for k, score in _top(flagged, scores):
+        src_ip = table.dictionaries["src_ip"][keys[k] // n_dst]
+        dst_ip = table.dictionaries["dst_ip"][keys[k] % n_dst]
+        findings.append(_finding(
+            "large_upload", score,
+            f"{src_ip} 向 {dst_ip} 发送{sent[k] / 1024 / 1024:.1f}MB数据，显著高于其他会话，疑似数据外传",
+            ip=src_ip, peer_ip=dst_ip, bytes=int(sent[k]), zscore=round(float(zscore[k]), 2)))
+    return findings
+
+
+DETECTORS = (detect_port_scans, detect_syn_floods, detect_p2p, detect_beaconing, detect_large_uploads)
+
+
+def run_detectors(table: PacketTable) -> Dict[str, Any]:
+    """运行全部检测器，返回按得分排序的发现与基线风险等级"""
+    start_time = time.time()
+    findings = []
+    if len(table):
+        for detector in DETECTORS:
+            findings.extend(detector(table))
+    findings.sort(key=lambda f: f["score"], reverse=True)
+
+    risk_score = findings[0]["score"] if findings else 0.0
+    return {
+        "findings": findings,
+        "risk_score": risk_score,
+        "risk_level": _risk_level(risk_score),
+        "elapsed_ms": round((time.time() - start_time) * 1000, 1),
+    }
+
+
+def fanout_findings(estimates: Dict[str, Any], window: str) -> List[Dict[str, Any]]:
+    """根据HyperLogLog估计的扇出（FanoutSketch.estimates的返回值）标记扫描源，评分方式与detect_port_scans一致
+
+    扇出概要可以跨时间桶和采集分段合并，能发现单个分段内扇出不足阈值的慢速扫描。
+    """
+    hosts = np.asarray(estimates["distinct_hosts"])
+    ports = np.asarray(estimates["distinct_ports"])
+    if not len(hosts):
+        return []
+    syn_ratio = estimates["syn"] / np.maximum(estimates["packets"], 1)
+    flagged = np.nonzero((ports >= SCAN_MIN_PORTS) | (hosts >= SCAN_MIN_HOSTS))[0]
+    fanout = np.maximum(ports[flagged] / SCAN_MIN_PORTS, hosts[flagged] / SCAN_MIN_HOSTS)
+    scores = 0.4 + 0.3 * np.minimum(np.log10(fanout) + 0.5, 1.0) + 0.3 * syn_ratio[flagged]
+
+    findings = []
+    for row, score in _top(flagged, scores):
+        ip = estimates["keys"][row]
+        kind = "端口扫描" if ports[row] >= SCAN_MIN_PORTS else "主机扫描"
+        findings.append(_finding(
+            "fanout_scan", score,
+            f"{ip} 在最近{window}内疑似{kind}：约访问{int(round(hosts[row]))}个主机、"
+            f"{int(round(ports[row]))}个端口（HyperLogLog估计），纯SYN占比{syn_ratio[row]:.0%}",
+            ip=ip, distinct_hosts=int(round(hosts[row])), distinct_ports=int(round(ports[row])),
+            syn_ratio=round(float(syn_ratio[row]), 3), window=window))
+    return findings
+
+
+def merge_findings(detection: Dict[str, Any], findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把额外的发现（如跨分段的扇出估计）并入检测结果并重新计算基线风险
+
+    同一IP已有精确的port_scan发现时，不再重复加入估计值。
+    """
+    scanned = {f.get("ip") for f in detection["findings"] if f["detector"] == "port_scan"}
+    extra = [f for f in findings if f.get("ip") not in scanned]
+    if not extra:
+        return detection
+    merged = sorted(detection["findings"] + extra, key=lambda f: f["score"], reverse=True)
+    risk_score = merged[0]["score"]
+    return {**detection, "findings": merged, "risk_score": risk_score, "risk_level": _risk_level(risk_score)}
+
+
+def _entity_scores(detection: Dict[str, Any]):
+    """把检测发现映射为IP和(IP, 对端IP)两级得分"""
+    ip_scores = {}
+    pair_scores = {}
+    for finding in detection.get("findings", []):
+        ip = finding.get("ip")
+        if finding.get("peer_ip"):
+            pair = (ip, finding["peer_ip"])
+            pair_scores[pair] = max(pair_scores.get(pair, 0.0), finding["score"])
+        if ip:
+            ip_scores[ip] = max(ip_scores.get(ip, 0.0), finding["score"] * 0.8)
+    return ip_scores, pair_scores
+
+
+def select_flows(flow_table: FlowTable, detection: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """按检测得分优先、字节数次之挑选送入提示词的流，并附上得分"""
+    ip_scores, pair_scores = _entity_scores(detection)
+
+    def flow_score(flow) -> float:
+        src, dst = flow.src_ip, flow.dst_ip
+        return max(pair_scores.get((src, dst), 0.0), pair_scores.get((dst, src), 0.0),
+                   ip_scores.get(src, 0.0), ip_scores.get(dst, 0.0))
+
+    top = heapq.nlargest(limit, flow_table, key=lambda flow: (flow_score(flow), flow.bytes))
+    selected = []
+    for flow in top:
+        summary = flow.to_dict()
+        summary["risk_score"] = round(flow_score(flow), 3)
+        selected.append(summary)
+    return selected
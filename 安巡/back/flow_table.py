@@ -0,0 +1,208 @@
+"""五元组流表
+
+单次遍历全部数据包，按双向五元组增量聚合包数、字节数、持续时间、出现过的TCP标志
+以及包间隔统计，后续分析使用流摘要而不是截断后的原始数据包。
+"""
+import math
+from typing import Any, Dict, List
+
+import numpy as np
+
+from packet_table import PacketTable, IPPROTO_TCP, IPPROTO_UDP, TCP_SYN, TCP_ACK, TCP_RST, TCP_FIN
+
+PROTOCOL_NAMES = {IPPROTO_TCP: "TCP", IPPROTO_UDP: "UDP"}
+
+# 与tshark tcp.flags.str一致的标志字符（按位从高到低）
+FLAG_CHARS = ((0x100, "N"), (0x080, "C"), (0x040, "E"), (0x020, "U"), (0x010, "A"),
+              (0x008, "P"), (0x004, "R"), (0x002, "S"), (0x001, "F"))
+
+
+def format_tcp_flags(flags: int) -> str:
+    """将标志位掩码转换为字符串，例如0x012 -> "AS" """
+    return "".join(ch for bit, ch in FLAG_CHARS if flags & bit)
+
+
+class FlowRecord:
+    """单条双向流的聚合记录，方向以首个数据包为准"""
+
+    __slots__ = (
+        "flow_id", "src_ip", "dst_ip", "src_port", "dst_port", "protocol",
+        "packets", "bytes", "payload_bytes", "fwd_packets", "fwd_bytes", "rev_packets", "rev_bytes",
+        "first_seen", "last_seen", "tcp_flags", "syn_count", "rst_count", "fin_count",
+        "iat_count", "iat_mean", "iat_m2", "iat_min", "iat_max",
+    )
+
+    def __init__(self, flow_id: int, src_ip: str, dst_ip: str, src_port: int, dst_port: int,
+                 protocol: int, timestamp: float):
+        self.flow_id = flow_id
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.protocol = protocol
+        self.packets = 0
+        self.bytes = 0
+        self.payload_bytes = 0
+        self.fwd_packets = 0
+        self.fwd_bytes = 0
+        self.rev_packets = 0
+        self.rev_bytes = 0
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.tcp_flags = 0
+        self.syn_count = 0
+        self.rst_count = 0
+        self.fin_count = 0
+        self.iat_count = 0
+        self.iat_mean = 0.0
+        self.iat_m2 = 0.0
+        self.iat_min = math.inf
+        self.iat_max = 0.0
+
+    def update(self, timestamp: float, length: int, payload_len: int, flags: int, forward: bool):
+        if self.packets:
+            # Welford在线算法更新包间隔均值与方差
+            iat = max(timestamp - self.last_seen, 0.0)
+            self.iat_count += 1
+            delta = iat - self.iat_mean
+            self.iat_mean += delta / self.iat_count
+            self.iat_m2 += delta * (iat - self.iat_mean)
+            if iat < self.iat_min:
+                self.iat_min = iat
+            if iat > self.iat_max:
+                self.iat_max = iat
+        if timestamp > self.last_seen:
+            self.last_seen = timestamp
+
+        self.packets += 1
+        self.bytes += length
+        self.payload_bytes += payload_len
+        if forward:
+            self.fwd_packets += 1
+            self.fwd_bytes += length
+        else:
+            self.rev_packets += 1
+            self.rev_bytes += length
+
+        if flags:
+            self.tcp_flags |= flags
+            if flags & TCP_SYN and not flags & TCP_ACK:
+                self.syn_count += 1
+            if flags & TCP_RST:
+                self.rst_count += 1
+            if flags & TCP_FIN:
+                self.fin_count += 1
+
+    @property
+    def duration(self) -> float:
+        return self.last_seen - self.first_seen
+
+    @property
+    def iat_std(self) -> float:
+        return math.sqrt(self.iat_m2 / self.iat_count) if self.iat_count > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "flow_id": self.flow_id,
+            "src_ip": self.src_ip,
+            "dst_ip": self.dst_ip,
+            "src_port": self.src_port,
+            "dst_port": self.dst_port,
+            "protocol": PROTOCOL_NAMES.get(self.protocol, str(self.protocol)),
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "payload_bytes": self.payload_bytes,
+            "fwd_packets": self.fwd_packets,
+            "fwd_bytes": self.fwd_bytes,
+            "rev_packets": self.rev_packets,
+            "rev_bytes": self.rev_bytes,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "duration": round(self.duration, 6),
+            "tcp_flags": format_tcp_flags(self.tcp_flags),
+            "syn_count": self.syn_count,
+            "rst_count": self.rst_count,
+            "fin_count": self.fin_count,
+            "iat_mean": round(self.iat_mean, 6),
+            "iat_std": round(self.iat_std, 6),
+            "iat_min": round(self.iat_min, 6) if self.iat_count else 0.0,
+            "iat_max": round(self.iat_max, 6),
+        }
+
+
+class FlowTable:
+    """增量五元组流表，可跨多个数据包表（例如多个抓包分段）持续累积"""
+
+    def __init__(self):
+        self.flows: Dict[tuple, FlowRecord] = {}
+        self.packet_count = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __iter__(self):
+        return iter(self.flows.values())
+
+    def add(self, src_ip: str, dst_ip: str, src_port: int, dst_port: int, protocol: int,
+            timestamp: float, length: int, payload_len: int = 0, flags: int = 0) -> FlowRecord:
+        """按双向五元组累加一个数据包"""
+        if (src_ip, src_port) <= (dst_ip, dst_port):
+            key = (protocol, src_ip, src_port, dst_ip, dst_port)
+        else:
+            key = (protocol, dst_ip, dst_port, src_ip, src_port)
+
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = FlowRecord(len(self.flows), src_ip, dst_ip, src_port, dst_port, protocol, timestamp)
+            self.flows[key] = flow
+        forward = flow.src_ip == src_ip and flow.src_port == src_port
+        flow.update(timestamp, length, payload_len, flags, forward)
+        self.packet_count += 1
+        return flow
+
+    def add_table(self, table: PacketTable) -> np.ndarray:
+        """将列式数据包表中的所有行加入流表，返回每行对应的flow_id"""
+        if not len(table):
+            return np.zeros(0, dtype=np.int32)
+
+        src_dict = table.dictionaries["src_ip"]
+        dst_dict = table.dictionaries["dst_ip"]
+        flow_ids = np.empty(len(table), dtype=np.int32)
+        rows = zip(table["src_ip"].tolist(), table["dst_ip"].tolist(),
+                   table["src_port"].tolist(), table["dst_port"].tolist(),
+                   table["ip_proto"].tolist(), table["time_epoch"].tolist(),
+                   table["frame_len"].tolist(), table["payload_len"].tolist(),
+                   table["tcp_flags"].tolist())
+        add = self.add
+        for i, (src, dst, sport, dport, proto, ts, length, payload_len, flags) in enumerate(rows):
+            flow_ids[i] = add(src_dict[src], dst_dict[dst], sport, dport, proto,
+                              ts, length, payload_len, flags).flow_id
+        return flow_ids
+
+    def summaries(self, limit: int = None, sort_by: str = "bytes") -> List[Dict[str, Any]]:
+        """按指定字段降序返回流摘要"""
+        flows = sorted(self.flows.values(), key=lambda f: getattr(f, sort_by), reverse=True)
+        if limit is not None:
+            flows = flows[:limit]
+        return [flow.to_dict() for flow in flows]
+
+    def overview(self) -> Dict[str, Any]:
+        """流表整体统计"""
+        if not self.flows:
+            return {"flow_count": 0}
+        flows = list(self.flows.values())
+        protocols = {}
+        for flow in flows:
+            name = PROTOCOL_NAMES.get(flow.protocol, str(flow.protocol))
+            protocols[name] = protocols.get(name, 0) + 1
+        durations = np.fromiter((f.duration for f in flows), dtype=np.float64, count=len(flows))
+        packets = np.fromiter((f.packets for f in flows), dtype=np.int64, count=len(flows))
+        return {
+            "flow_count": len(flows),
+            "packet_count": self.packet_count,
+            "flows_by_protocol": protocols,
+            "single_packet_flows": int((packets == 1).sum()),
+            "mean_flow_duration": round(float(durations.mean()), 6),
+            "max_flow_duration": round(float(durations.max()), 6),
+            "unanswered_tcp_flows": sum(1 for f in flows if f.protocol == IPPROTO_TCP and f.rev_packets == 0),
+        }
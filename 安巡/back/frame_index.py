@@ -0,0 +1,237 @@
+"""抓包文件的帧偏移索引与按流/时间窗口的数据包下钻
+
+分析完成后把抓包文件保留在captures/<result_id>/下，并为每个TCP/UDP数据包记录帧号、时间戳、
+流ID、字节偏移和长度。各列保存为独立的.npy文件，查询时以mmap方式打开并二分查找，
+再到mmap的抓包文件中按偏移直接读取对应的数据包，不需要重新解析整个文件。
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from pcap_reader import CaptureFile, Frame, frame_record
+
+DEFAULT_DRILLDOWN_PACKETS = 200
+MAX_DRILLDOWN_PACKETS = 5000
+
+# 每个索引行对应数据包表中的一行；*_order为按时间/流ID稳定排序后的行号，*_sorted为对应的排序键
+INDEX_COLUMNS = ("frame_number", "ts_ns", "flow_id", "offset", "caplen", "wirelen", "linktype",
+                 "time_order", "ts_sorted", "flow_order", "flow_sorted")
+
+_RESULT_ID = re.compile(r"^[0-9A-Za-z_]+$")
+
+
+class CaptureNotFound(Exception):
+    """结果ID没有对应的已保留抓包文件"""
+
+
+def build_frame_index(capture_path: str, frame_numbers: np.ndarray,
+                      flow_ids: np.ndarray) -> Tuple[Dict[str, np.ndarray], int]:
+    """遍历抓包文件的记录头得到每帧的偏移，再按数据包表的帧号取出对应行
+
+    只读取记录头不解码数据包；链路类型不受内置读取器支持时抛出UnsupportedCaptureError。
+    返回(索引列, 第1帧的时间戳)：frame.time_relative与tshark一样相对于文件第1帧，
+    该帧可能是ARP等未被索引的数据包。
+    """
+    offsets, caplens, wirelens, linktypes, timestamps = (array("Q"), array("I"), array("I"),
+                                                         array("H"), array("q"))
+    with CaptureFile(capture_path, check_interfaces=False) as capture:
+        for frame in capture.iter_frames():
+            offsets.append(frame.offset)
+            caplens.append(frame.caplen)
+            wirelens.append(frame.wirelen)
+            linktypes.append(frame.linktype)
+            timestamps.append(frame.ts_ns)
+
+    first_ts_ns = timestamps[0] if len(timestamps) else 0
+    rows = np.asarray(frame_numbers, dtype=np.int64) - 1
+    if len(rows) and (rows.min() < 0 or rows.max() >= len(offsets)):
+        raise ValueError("数据包表中的帧号与抓包文件不一致")
+    flow_ids = np.asarray(flow_ids, dtype=np.int32)
+    ts_ns = np.frombuffer(timestamps, dtype=np.int64)[rows]
+    time_order = np.argsort(ts_ns, kind="stable")
+    flow_order = np.argsort(flow_ids, kind="stable")
+    return {
+        "frame_number": np.asarray(frame_numbers, dtype=np.uint32),
+        "ts_ns": ts_ns,
+        "flow_id": flow_ids,
+        "offset": np.frombuffer(offsets, dtype=np.uint64)[rows],
+        "caplen": np.frombuffer(caplens, dtype=np.uint32)[rows],
+        "wirelen": np.frombuffer(wirelens, dtype=np.uint32)[rows],
+        "linktype": np.frombuffer(linktypes, dtype=np.uint16)[rows],
+        "time_order": time_order,
+        "ts_sorted": ts_ns[time_order],
+        "flow_order": flow_order,
+        "flow_sorted": flow_ids[flow_order],
+    }, first_ts_ns
+
+
+class CaptureIndex:
+    """以mmap方式打开的单个抓包索引"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.capture_path = os.path.join(directory, self.meta["capture_file"])
+        self.columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                        for name in INDEX_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["frame_number"])
+
+    def select(self, flow_id: int = None, start: float = None, end: float = None) -> np.ndarray:
+        """返回匹配的索引行号：指定流时按帧顺序，否则按时间顺序"""
+        cols = self.columns
+        start_ns = int(start * 1e9) if start is not None else None
+        end_ns = int(end * 1e9) if end is not None else None
+        if flow_id is not None:
+            lo = np.searchsorted(cols["flow_sorted"], flow_id, side="left")
+            hi = np.searchsorted(cols["flow_sorted"], flow_id, side="right")
+            rows = np.asarray(cols["flow_order"][lo:hi])
+            if start_ns is not None or end_ns is not None:
+                ts = np.asarray(cols["ts_ns"][rows])
+                mask = np.ones(len(rows), dtype=bool)
+                if start_ns is not None:
+                    mask &= ts >= start_ns
+                if end_ns is not None:
+                    mask &= ts <= end_ns
+                rows = rows[mask]
+            return rows
+        lo = np.searchsorted(cols["ts_sorted"], start_ns, side="left") if start_ns is not None else 0
+        hi = np.searchsorted(cols["ts_sorted"], end_ns, side="right") if end_ns is not None else len(self)
+        return np.asarray(cols["time_order"][lo:hi])
+
+    def read_packets(self, rows: np.ndarray, include_raw: bool = False) -> List[Dict[str, Any]]:
+        """按索引行在抓包文件中定位并解码数据包，输出与tshark同名的字段
+
+        由内置读取器解码，字段集与native解析器相同（不含pcap_reader.NATIVE_OMITTED_FIELDS）；
+        按偏移读取时没有全局会话编号，tcp.stream/udp.stream由flow_id代替。
+        """
+        cols = self.columns
+        first_ts = self.meta["first_ts_ns"]
+        packets = []
+        prev_ts = None
+        with CaptureFile(self.capture_path, check_interfaces=False) as capture:
+            for row in rows.tolist():
+                offset = int(cols["offset"][row])
+                caplen = int(cols["caplen"][row])
+                ts_ns = int(cols["ts_ns"][row])
+                frame = Frame(int(cols["frame_number"][row]), ts_ns, int(cols["linktype"][row]), caplen,
+                              int(cols["wirelen"][row]), offset, offset)
+                data = capture.buf[offset:offset + caplen]
+                try:
+                    record = frame_record(frame, data, first_ts, ts_ns) or {}
+                    raw = bytes(data).hex() if include_raw else None
+                finally:
+                    data.release()
+                # frame.time_delta需要上一帧的时间，下钻结果只给出与上一个返回数据包的间隔
+                record.pop("frame.time_delta", None)
+                record["frame.time_delta_displayed"] = f"{(ts_ns - (prev_ts if prev_ts is not None else ts_ns)) / 1e9:.9f}"
+                prev_ts = ts_ns
+                packet = {"flow_id": int(cols["flow_id"][row]), "file_offset": offset, "fields": record}
+                if raw is not None:
+                    packet["raw"] = raw
+                packets.append(packet)
+        return packets
+
+
+class CaptureStore:
+    """保留已分析的抓包文件及其帧索引，按总大小淘汰最早的条目"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, result_id: str) -> str:
+        if not _RESULT_ID.match(result_id or ""):
+            raise CaptureNotFound(f"无效的结果ID: {result_id}")
+        return os.path.join(self.root, result_id)
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def add(self, result_id: str, capture_path: str, frame_numbers: np.ndarray, flow_ids: np.ndarray,
+            source_file: str = None) -> Optional[Dict[str, Any]]:
+        """保留抓包文件并建立索引，返回索引元数据；无法建立索引时返回None"""
+        if self.max_bytes <= 0:
+            return None
+        directory = self._entry_dir(result_id)
+        tmp_dir = directory + ".tmp"
+        start_time = time.time()
+        try:
+            os.makedirs(tmp_dir)
+            capture_file = "capture" + os.path.splitext(capture_path)[1].lower()
+            target = os.path.join(tmp_dir, capture_file)
+            try:
+                os.link(capture_path, target)  # 同一文件系统内硬链接，不复制数据
+            except OSError:
+                shutil.copyfile(capture_path, target)
+
+            columns, first_ts_ns = build_frame_index(target, frame_numbers, flow_ids)
+            for name, values in columns.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+            meta = {
+                "result_id": result_id,
+                "source_file": source_file or os.path.basename(capture_path),
+                "capture_file": capture_file,
+                "capture_bytes": os.path.getsize(target),
+                "packets": len(columns["frame_number"]),
+                "flows": int(columns["flow_id"].max()) + 1 if len(columns["flow_id"]) else 0,
+                "first_ts_ns": int(first_ts_ns),
+                "last_ts_ns": int(columns["ts_sorted"][-1]) if len(columns["ts_sorted"]) else 0,
+                "created_at": time.time(),
+                "index_seconds": round(time.time() - start_time, 3),
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            with self._lock:
+                shutil.rmtree(directory, ignore_errors=True)
+                os.replace(tmp_dir, directory)
+                self._evict_locked(keep=result_id)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            print(f"[WARNING] Failed to index capture for {result_id}: {str(e)}")
+            return None
+        print(f"[INFO] Indexed {meta['packets']} packets of {result_id} in {meta['index_seconds']}s")
+        return meta
+
+    def _evict_locked(self, keep: str):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".tmp") or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), name, self._dir_size(path)))
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+            print(f"[INFO] Evicted retained capture {name} ({size} bytes)")
+
+    def open(self, result_id: str) -> CaptureIndex:
+        directory = self._entry_dir(result_id)
+        try:
+            return CaptureIndex(directory)
+        except (OSError, ValueError, KeyError):
+            raise CaptureNotFound(f"结果 {result_id} 没有保留的抓包文件或索引")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            names = [name for name in os.listdir(self.root)
+                     if not name.endswith(".tmp") and os.path.isdir(os.path.join(self.root, name))]
+            total = sum(self._dir_size(os.path.join(self.root, name)) for name in names)
+        return {"captures": len(names), "total_bytes": total, "max_bytes": self.max_bytes}
@@ -0,0 +1,153 @@
+"""网络接口清单与实时吞吐量
+
+缓存tshark -D枚举出的接口列表并在后台定期刷新，接口列表接口不再每次启动tshark；
+同一后台线程周期性读取/proc/net/dev的收发计数器，按相邻两次采样的差值计算每个接口的
+收发包速率和比特率，便于在不试抓的情况下找到真正有流量的镜像端口。
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+PROC_NET_DEV = "/proc/net/dev"
+
+DEFAULT_REFRESH_INTERVAL = 300
+DEFAULT_SAMPLE_INTERVAL = 2
+
+
+def read_proc_net_dev(path: str = PROC_NET_DEV) -> Optional[Dict[str, Dict[str, int]]]:
+    """读取各接口的累计收发字节数和包数，不是Linux（文件不存在）时返回None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()[2:]  # 前两行是表头
+    except OSError:
+        return None
+    counters = {}
+    for line in lines:
+        name, _, values = line.partition(":")
+        values = values.split()
+        if len(values) < 12:
+            continue
+        counters[name.strip()] = {
+            "rx_bytes": int(values[0]), "rx_packets": int(values[1]), "rx_drop": int(values[3]),
+            "tx_bytes": int(values[8]), "tx_packets": int(values[9]), "tx_drop": int(values[11]),
+        }
+    return counters
+
+
+class InterfaceInventory:
+    """接口列表缓存 + /proc/net/dev采样线程"""
+
+    def __init__(self, enumerate_func: Callable[[], List[Dict[str, Any]]],
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL, proc_path: str = PROC_NET_DEV):
+        self.enumerate_func = enumerate_func
+        self.refresh_interval = refresh_interval
+        self.sample_interval = sample_interval
+        self.proc_path = proc_path
+        self._interfaces: Optional[List[Dict[str, Any]]] = None
+        self._enumerated_at = 0.0
+        self._counters: Optional[Dict[str, Dict[str, int]]] = None
+        self._sampled_at = None
+        self._rates: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台刷新线程，可重复调用（并发调用也只启动一个线程）"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="interface-inventory", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            if time.time() - self._enumerated_at >= self.refresh_interval:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"[WARNING] Interface refresh failed: {str(e)}")
+            self._stop.wait(self.sample_interval)
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """重新运行tshark -D；并发调用时只执行一次"""
+        with self._refresh_lock:
+            if self._interfaces is not None and time.time() - self._enumerated_at < 1.0:
+                return self._interfaces
+            interfaces = self.enumerate_func()
+            with self._lock:
+                self._interfaces = interfaces
+                self._enumerated_at = time.time()
+            return interfaces
+
+    def sample(self):
+        """读取一次计数器，与上一次采样比较得到各接口速率"""
+        counters = read_proc_net_dev(self.proc_path)
+        now = time.time()
+        if counters is None:
+            return
+        with self._lock:
+            previous, previous_at = self._counters, self._sampled_at
+            self._counters, self._sampled_at = counters, now
+            if previous is None or now <= previous_at:
+                return
+            elapsed = now - previous_at
+            rates = {}
+            for name, current in counters.items():
+                before = previous.get(name)
+                if before is None:
+                    continue
+                # 计数器被重置（接口重建）时差值为负，按0处理
+                delta = {key: max(current[key] - before[key], 0) for key in current}
+                rates[name] = {
+                    "rx_pps": round(delta["rx_packets"] / elapsed, 1),
+                    "tx_pps": round(delta["tx_packets"] / elapsed, 1),
+                    "rx_bps": round(delta["rx_bytes"] * 8 / elapsed, 1),
+                    "tx_bps": round(delta["tx_bytes"] * 8 / elapsed, 1),
+                    "rx_drop_ps": round(delta["rx_drop"] / elapsed, 1),
+                }
+            self._rates = rates
+
+    def interfaces(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """返回缓存的接口列表，每项附带最近一次采样得到的吞吐量（没有计数器时为None）"""
+        if refresh or self._interfaces is None:
+            self.refresh()
+        with self._lock:
+            rates = self._rates
+            counters = self._counters or {}
+            result = []
+            for iface in self._interfaces:
+                # tshark -D在Linux上的device就是内核接口名，Windows上的NPF设备名在/proc中不存在
+                name = iface.get("device")
+                entry = dict(iface)
+                entry["throughput"] = rates.get(name)
+                entry["counters"] = counters.get(name)
+                result.append(entry)
+        return result
+
+    def snapshot(self, refresh: bool = False) -> Dict[str, Any]:
+        """接口列表 + 全部内核接口的速率 + 当前最繁忙的接口"""
+        interfaces = self.interfaces(refresh)
+        with self._lock:
+            rates = dict(self._rates)
+            sampled_at = self._sampled_at
+            enumerated_at = self._enumerated_at
+        busiest = None
+        candidates = [(rate["rx_pps"] + rate["tx_pps"], name) for name, rate in rates.items() if name != "lo"]
+        if candidates and max(candidates)[0] > 0:
+            busiest = max(candidates)[1]
+        return {
+            "interfaces": interfaces,
+            "rates": rates,
+            "busiest": busiest,
+            "counters_available": os.path.exists(self.proc_path),
+            "sample_interval": self.sample_interval,
+            "sampled_at": sampled_at,
+            "enumerated_at": enumerated_at,
+        }
@@ -0,0 +1,191 @@
+"""后台分析任务队列
+
+上传接口立即返回任务ID，由有界线程池执行耗时的解析和AI分析。任务按阶段上报进度事件，
+客户端可以轮询状态或通过SSE订阅事件，也可以取消排队中或运行中的任务。
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """任务在阶段边界检测到取消请求"""
+
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+class Job:
+    """单个后台任务的状态与进度事件"""
+
+    def __init__(self, kind: str, params: Dict[str, Any] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.state = "queued"
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events: List[Dict[str, Any]] = []
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.cleanup = None
+        self._cond = threading.Condition()
+        self._emit("queued", 0.0, "任务已进入队列")
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def _emit(self, stage: str, progress: Optional[float], message: str = ""):
+        with self._cond:
+            self.stage = stage
+            if progress is not None:
+                self.progress = max(self.progress, min(progress, 1.0))
+            self.events.append({
+                "id": len(self.events),
+                "state": self.state,
+                "stage": stage,
+                "progress": round(self.progress, 3),
+                "message": message,
+                "time": time.time(),
+            })
+            self._cond.notify_all()
+
+    def report(self, stage: str, progress: Optional[float] = None, message: str = ""):
+        """上报阶段进度，作为process_pcap_file的progress_callback；已请求取消时抛出JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"任务 {self.id} 已取消")
+        self._emit(stage, progress, message)
+
+    def _finish(self, state: str, message: str = ""):
+        self.state = state
+        self.finished_at = time.time()
+        self._emit(state, 1.0 if state == "succeeded" else None, message)
+
+    def wait_events(self, after: int, timeout: float) -> List[Dict[str, Any]]:
+        """返回编号大于等于after的事件，没有新事件时最多等待timeout秒"""
+        with self._cond:
+            if len(self.events) <= after and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[after:]
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if include_result and self.state == "succeeded":
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """有界线程池执行后台任务，限制排队深度并定期清理已结束的任务"""
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16, retention_seconds: float = 3600):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+
+    def _prune_locked(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and now - job.finished_at > self.retention_seconds]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def submit(self, kind: str, func: Callable[[Job], Any], params: Dict[str, Any] = None,
+               cleanup: Callable[[], None] = None) -> Job:
+        """提交任务，func接收Job对象并返回结果；cleanup在任务结束（包括取消）后调用"""
+        with self._lock:
+            self._prune_locked()
+            pending = sum(1 for job in self.jobs.values() if job.state == "queued")
+            if pending >= self.max_queue:
+                raise QueueFullError(f"排队任务已达上限 {self.max_queue}")
+            job = Job(kind, params)
+            job.cleanup = cleanup
+            self.jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, func)
+        return job
+
+    @staticmethod
+    def _cleanup(job: Job):
+        if job.cleanup is not None:
+            try:
+                job.cleanup()
+            except Exception as e:
+                print(f"[WARNING] Job {job.id} cleanup failed: {str(e)}")
+
+    def _run(self, job: Job, func: Callable[[Job], Any]):
+        try:
+            if job.cancel_event.is_set():
+                job._finish("cancelled", "任务在开始前被取消")
+                return
+            job.state = "running"
+            job.started_at = time.time()
+            job.report("started", 0.0, "任务开始执行")
+            result = func(job)
+            if isinstance(result, dict) and "error" in result:
+                job.error = result["error"]
+                job._finish("failed", result["error"])
+            else:
+                job.result = result
+                job._finish("succeeded", "任务完成")
+        except JobCancelled:
+            job._finish("cancelled", "任务已取消")
+        except Exception as e:
+            print(f"[ERROR] Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job._finish("failed", str(e))
+        finally:
+            self._cleanup(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """请求取消任务：排队中的任务直接取消，运行中的任务在下一个阶段边界停止"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job._finish("cancelled", "任务在开始前被取消")
+            self._cleanup(job)
+        else:
+            job._emit(job.stage, None, "已请求取消，将在当前阶段结束后停止")
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self.jobs.values():
+                counts[job.state] += 1
+        return {"max_workers": self.max_workers, "max_queue": self.max_queue, "jobs": counts}
@@ -0,0 +1,211 @@
+"""实时数据包流
+
+以行缓冲字段模式（tshark -l -T fields）运行采集，读取线程逐行解析数据包并放入有界队列，
+调用方（SSE接口）从队列中取出后立即推送单个数据包或按秒聚合的统计，
+不必等整个采集结束再重新读取抓包文件，首个数据包的延迟以毫秒计。
+"""
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from capture_filters import capture_args
+from packet_table import TCP_ACK, TCP_RST, TCP_SYN, _to_int
+from traffic_analyzer import FIELD_PROFILES, parse_tshark_line
+
+LIVE_STREAM_MODES = ("packets", "seconds")
+MAX_STREAM_DURATION = 3600
+MAX_STREAM_PACKETS = 1_000_000
+STREAM_QUEUE_SIZE = 10000
+
+# 写入滑动窗口指标的批大小与最长间隔（秒）
+METRICS_BATCH_PACKETS = 1000
+METRICS_BATCH_SECONDS = 1.0
+
+# 推送给前端的字段，与五元组配置相同，额外保留tcp.flags.str便于展示
+LIVE_FIELDS = FIELD_PROFILES["five_tuple"]["fields"] + ["tcp.flags.str"]
+
+_END = object()
+
+
+def compact_packet(record: Dict[str, str]) -> Dict[str, Any]:
+    """把tshark记录压缩为前端展示用的精简结构"""
+    if "tcp.srcport" in record:
+        proto, sport, dport = "TCP", record.get("tcp.srcport"), record.get("tcp.dstport")
+    elif "udp.srcport" in record:
+        proto, sport, dport = "UDP", record.get("udp.srcport"), record.get("udp.dstport")
+    else:
+        proto, sport, dport = record.get("ip.proto") or record.get("ipv6.nxt") or "", None, None
+    return {
+        "number": _to_int(record.get("frame.number")),
+        "time": float(record.get("frame.time_epoch") or 0.0),
+        "src": record.get("ip.src") or record.get("ipv6.src"),
+        "dst": record.get("ip.dst") or record.get("ipv6.dst"),
+        "src_port": _to_int(sport),
+        "dst_port": _to_int(dport),
+        "protocol": proto,
+        "length": _to_int(record.get("frame.len")),
+        "flags": (record.get("tcp.flags.str") or "").strip("·") or None,
+    }
+
+
+class SecondAggregator:
+    """按墙钟秒聚合数据包，产出每秒的包数、字节数和主要通信方"""
+
+    def __init__(self, top: int = 5):
+        self.top = top
+        self.second = int(time.time())
+        self._reset()
+
+    def _reset(self):
+        self.packets = 0
+        self.bytes = 0
+        self.tcp = 0
+        self.udp = 0
+        self.syn = 0
+        self.rst = 0
+        self.sources = Counter()
+        self.destinations = Counter()
+        self.ports = Counter()
+
+    def add(self, record: Dict[str, str]):
+        self.packets += 1
+        self.bytes += _to_int(record.get("frame.len"))
+        if "tcp.srcport" in record:
+            self.tcp += 1
+            flags = _to_int(record.get("tcp.flags"), 16)
+            if flags & (TCP_SYN | TCP_ACK) == TCP_SYN:
+                self.syn += 1
+            if flags & TCP_RST:
+                self.rst += 1
+            self.ports[_to_int(record.get("tcp.dstport"))] += 1
+        elif "udp.srcport" in record:
+            self.udp += 1
+            self.ports[_to_int(record.get("udp.dstport"))] += 1
+        self.sources[record.get("ip.src") or record.get("ipv6.src")] += 1
+        self.destinations[record.get("ip.dst") or record.get("ipv6.dst")] += 1
+
+    def flush(self) -> Dict[str, Any]:
+        """输出当前秒的统计并开始下一秒"""
+        bucket = {
+            "second": self.second,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "tcp_packets": self.tcp,
+            "udp_packets": self.udp,
+            "syn_packets": self.syn,
+            "rst_packets": self.rst,
+            "top_src_ips": [{"value": k, "count": v} for k, v in self.sources.most_common(self.top)],
+            "top_dst_ips": [{"value": k, "count": v} for k, v in self.destinations.most_common(self.top)],
+            "top_dst_ports": [{"port": k, "count": v} for k, v in self.ports.most_common(self.top)],
+        }
+        self.second += 1
+        self._reset()
+        return bucket
+
+
+class LivePacketStream:
+    """一次实时采集：tshark子进程 + 读取线程 + 有界队列
+
+    队列满时丢弃新数据包并计数（dropped_by_server），保证推送慢的客户端不会拖慢tshark或占满内存。
+    capture_filter为resolve_capture_filter的返回值（BPF过滤器和snaplen）。
+    metrics为MetricsRegistry，收到第一批数据包后才为接口创建滑动窗口指标，不存在的接口名不会占用内存。
+    """
+
+    def __init__(self, interface: str, duration: int, max_packets: int = None, capture_filter: Dict[str, Any] = None,
+                 queue_size: int = STREAM_QUEUE_SIZE, metrics=None):
+        self.interface = interface
+        self.duration = duration
+        self.max_packets = max_packets
+        self.capture_filter = capture_filter
+        self.metrics = metrics
+        self.stats = {"packets": 0, "dropped_by_server": 0, "first_packet_ms": None, "returncode": None}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._finished = threading.Event()
+        self._err_file = tempfile.TemporaryFile()
+        self.started_at = time.time()
+        self.proc = subprocess.Popen(self.command(), stdout=subprocess.PIPE, stderr=self._err_file)
+        self._reader = threading.Thread(target=self._read, name=f"live-stream-{interface}", daemon=True)
+        self._reader.start()
+
+    def command(self) -> List[str]:
+        # -l：每个数据包输出后立即刷新标准输出；-a duration：到时自动停止
+        cmd = ["tshark", "-i", self.interface, "-l", "-T", "fields", "-a", f"duration:{self.duration}"]
+        cmd += FIELD_PROFILES["five_tuple"]["options"]  # 已包含-n
+        for field in LIVE_FIELDS:
+            cmd += ["-e", field]
+        cmd += ["-Y", "tcp or udp"]
+        return cmd + capture_args(self.capture_filter)
+
+    def _read(self):
+        batch = []
+        flushed_at = time.time()
+        try:
+            for raw_line in self.proc.stdout:
+                record = parse_tshark_line(raw_line.decode("utf-8", errors="ignore"), LIVE_FIELDS)
+                if record is None:
+                    continue
+                if self.stats["first_packet_ms"] is None:
+                    self.stats["first_packet_ms"] = round((time.time() - self.started_at) * 1000, 1)
+                self.stats["packets"] += 1
+                try:
+                    self._queue.put_nowait(record)
+                except queue.Full:
+                    self.stats["dropped_by_server"] += 1
+                if self.metrics is not None:
+                    # 指标按批建表写入，不受推送队列丢包影响
+                    batch.append(record)
+                    if len(batch) >= METRICS_BATCH_PACKETS or time.time() - flushed_at >= METRICS_BATCH_SECONDS:
+                        self.metrics.get(self.interface).add_records(batch)
+                        batch, flushed_at = [], time.time()
+                if self.max_packets and self.stats["packets"] >= self.max_packets:
+                    break
+        finally:
+            self.close()
+            if self.metrics is not None and batch:
+                self.metrics.get(self.interface).add_records(batch)
+            # 客户端已断开时队列可能是满的，不能阻塞；get()在队列取空后根据结束标志返回
+            self._finished.set()
+            try:
+                self._queue.put_nowait(_END)
+            except queue.Full:
+                pass
+
+    def get(self, timeout: float) -> Optional[Dict[str, str]]:
+        """取出下一个数据包；超时返回None，采集结束且队列已取空时抛出StopIteration"""
+        try:
+            if self._finished.is_set():
+                item = self._queue.get_nowait()
+            else:
+                item = self._queue.get(timeout=max(timeout, 0.0))
+        except queue.Empty:
+            if self._finished.is_set() and self._queue.empty():
+                raise StopIteration
+            return None
+        if item is _END:
+            raise StopIteration
+        return item
+
+    def close(self):
+        """终止tshark（客户端断开或达到上限时调用，可重复调用）"""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.stats["returncode"] = self.proc.wait()
+
+    def error(self) -> Optional[str]:
+        """tshark异常退出时返回stderr的最后一行"""
+        if self.stats["returncode"] in (0, None, -9) or self._err_file.closed:
+            return None
+        self._err_file.seek(0)
+        lines = self._err_file.read().decode("utf-8", errors="ignore").strip().splitlines()
+        return lines[-1] if lines else f"tshark退出，返回码 {self.stats['returncode']}"
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "interface": self.interface,
+            "elapsed_seconds": round(time.time() - self.started_at, 3),
+            **self.stats,
+        }
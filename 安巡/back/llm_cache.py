@@ -0,0 +1,210 @@
+"""提示词级别的模型回复缓存
+
+以规范化后的(模型, 消息, 选项)的SHA-256为键缓存Ollama的完整回复：内存中保留最近使用的若干条（LRU），
+同时每条回复以JSON文件写入磁盘，重启后仍可命中，磁盘按总大小做LRU淘汰。
+每条回复有存活时间（TTL），过期后视为未命中并删除。演示重跑、常见安全问答等重复的提示词不再占用模型。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_TTL = float(os.environ.get('LLM_CACHE_TTL', 24 * 3600))  # 0表示不缓存
+DEFAULT_MEMORY_ENTRIES = int(os.environ.get('LLM_CACHE_MEMORY_ENTRIES', 256))
+DEFAULT_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# 流式接口回放缓存回复时每个数据块的字符数和间隔（秒），让前端仍按打字效果逐步显示
+REPLAY_CHUNK_CHARS = int(os.environ.get('LLM_CACHE_REPLAY_CHARS', 8))
+REPLAY_CHUNK_INTERVAL = float(os.environ.get('LLM_CACHE_REPLAY_INTERVAL', 0.02))
+
+
+def _normalize_text(text: str) -> str:
+    """去掉首尾空白并合并连续空白，仅空白不同的提示词视为相同"""
+    return " ".join(str(text).split())
+
+
+def make_prompt_key(model: str, messages: List[Dict[str, Any]], options: Dict[str, Any] = None) -> str:
+    """由模型名、消息（只取角色和内容）和其余请求选项生成缓存键"""
+    payload = {
+        "model": model,
+        "messages": [[m.get("role", "user"), _normalize_text(m.get("content", ""))] for m in messages],
+        "options": options or {},
+    }
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def replay_stream(content: str, model: str = None, chunk_chars: int = REPLAY_CHUNK_CHARS,
+                  interval: float = REPLAY_CHUNK_INTERVAL) -> Iterator[Dict[str, Any]]:
+    """把缓存的完整回复切成与Ollama流式接口格式相同的数据块，最后一块带done和cached标记"""
+    for start in range(0, len(content), chunk_chars):
+        if start and interval:
+            time.sleep(interval)
+        yield {"model": model, "message": {"role": "assistant", "content": content[start:start + chunk_chars]},
+               "done": False}
+    yield {"model": model, "message": {"role": "assistant", "content": ""}, "done": True, "cached": True}
+
+
+class LLMResponseCache:
+    """内存LRU + 磁盘文件的两级回复缓存，线程安全"""
+
+    def __init__(self, cache_dir: str, ttl: float = DEFAULT_TTL, memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.stores = 0
+        self._memory = OrderedDict()  # key -> {"model", "content", "created"}
+        self._files = OrderedDict()   # key -> 文件字节数，按访问顺序排列
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_entries()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_entries(self):
+        """启动时扫描磁盘，按文件修改时间恢复LRU顺序"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".tmp_"):
+                os.remove(path)  # 上次异常退出遗留的半成品
+            elif name.endswith(".json"):
+                entries.append((os.path.getmtime(path), name[:-len(".json")], os.path.getsize(path)))
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["created"] < self.ttl
+
+    def _remember_locked(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _drop_locked(self, key: str):
+        self._memory.pop(key, None)
+        if self._files.pop(key, None) is not None:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[str]:
+        """返回缓存的回复文本，未命中或已过期时返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry):
+                    self._memory.move_to_end(key)
+                    if key in self._files:
+                        self._files.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry["content"]
+                self._drop_locked(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            if key not in self._files:
+                self.misses += 1
+                return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._files.pop(key, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            if not self._fresh(entry):
+                self._drop_locked(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            if key in self._files:
+                self._files.move_to_end(key)
+            self._remember_locked(key, entry)
+            self.disk_hits += 1
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return entry["content"]
+
+    def put(self, key: str, content: str, model: str = None):
+        """缓存一条完整回复；空回复不缓存"""
+        if not self.enabled or not content:
+            return
+        entry = {"model": model, "content": content, "created": time.time()}
+        tmp_path = os.path.join(self.cache_dir, f".tmp_{key}_{threading.get_ident()}_{time.time_ns()}")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+            size = os.path.getsize(self._path(key))
+        except OSError as e:
+            print(f"[WARNING] Failed to cache model response: {str(e)}")
+            return
+        with self._lock:
+            self._remember_locked(key, entry)
+            self._files[key] = size
+            self._files.move_to_end(key)
+            self.stores += 1
+            total = sum(self._files.values())
+            while total > self.max_bytes and len(self._files) > 1:
+                old_key, old_size = self._files.popitem(last=False)
+                self._memory.pop(old_key, None)
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+                total -= old_size
+                self.evictions += 1
+
+    def clear(self) -> int:
+        """删除全部缓存条目，返回删除的条数"""
+        with self._lock:
+            keys = list(self._files)
+            for key in keys:
+                self._drop_locked(key)
+            self._memory.clear()
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "ttl": self.ttl,
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.memory_entries,
+                "disk_entries": len(self._files),
+                "disk_bytes": sum(self._files.values()),
+                "max_bytes": self.max_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "stores": self.stores,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+            }
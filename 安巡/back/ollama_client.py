@@ -0,0 +1,251 @@
+"""共享的Ollama HTTP客户端
+
+所有访问Ollama的路径（AI分析、对话、流式对话、服务状态检查）共用一个requests.Session，
+由HTTPAdapter维护到Ollama的keep-alive连接池，避免每次调用都新建TCP连接。
+服务地址、默认模型、连接池大小和各类操作的超时都在这里通过环境变量配置，
+同时按操作统计调用次数、错误数、延迟以及连接复用情况。
+传入LLMResponseCache时，对话请求先按规范化的提示词查缓存，流式请求命中时逐块回放缓存的回复。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import LLMResponseCache, make_prompt_key, replay_stream
+
+DEFAULT_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
+DEFAULT_MODEL = os.environ.get('OLLAMA_MODEL', 'qwen3:8b')
+# 连接池上限应不小于map-reduce分析的并发数加上同时进行的对话数
+DEFAULT_POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', 16))
+
+# (连接超时, 读取超时)秒；流式对话的读取超时是相邻两个数据块之间的最长间隔
+CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 3))
+OPERATION_TIMEOUTS = {
+    "chat": (CONNECT_TIMEOUT, float(os.environ.get('OLLAMA_CHAT_TIMEOUT', 60))),
+    "chat_stream": (CONNECT_TIMEOUT, float(os.environ.get('OLLAMA_STREAM_TIMEOUT', 60))),
+    "tags": (CONNECT_TIMEOUT, float(os.environ.get('OLLAMA_STATUS_TIMEOUT', 5))),
+    "load": (CONNECT_TIMEOUT, float(os.environ.get('OLLAMA_LOAD_TIMEOUT', 120))),
+}
+
+# 前端旧版本默认发送的模型名，映射为当前配置的默认模型
+LEGACY_DEFAULT_MODEL = "qwen2.5:7b"
+
+LATENCY_SAMPLES = 200
+
+
+class ModelCallError(Exception):
+    """Ollama接口返回非200状态码"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"status code {status_code}")
+        self.status_code = status_code
+
+
+class _OperationStats:
+    """单类操作的调用次数、错误数和最近若干次的延迟"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # 收到响应头的耗时（毫秒）
+        self.durations = deque(maxlen=LATENCY_SAMPLES)  # 读完响应体的耗时（毫秒）
+
+    @staticmethod
+    def _summary(samples) -> Dict[str, Any]:
+        if not samples:
+            return {"avg_ms": None, "p95_ms": None, "max_ms": None}
+        ordered = sorted(samples)
+        return {
+            "avg_ms": round(sum(ordered) / len(ordered), 2),
+            "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 2),
+            "max_ms": round(ordered[-1], 2),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "errors": self.errors, "first_byte": self._summary(self.latencies),
+                "total": self._summary(self.durations)}
+
+
+class OllamaClient:
+    """带连接池的Ollama客户端，线程安全，可在分析线程和请求线程之间共享"""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, model: str = DEFAULT_MODEL,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeouts: Dict[str, tuple] = None,
+                 cache: LLMResponseCache = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.cache = cache
+        self.pool_size = pool_size
+        self.timeouts = {**OPERATION_TIMEOUTS, **(timeouts or {})}
+        self.session = requests.Session()
+        # 对话请求不是幂等的，不自动重试；连接池满时不阻塞，临时多建的连接用完即关闭
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self._stats = {name: _OperationStats() for name in self.timeouts}
+        self._lock = threading.Lock()
+
+    def resolve_model(self, model: str = None) -> str:
+        """未指定或为旧版默认模型名时使用配置的默认模型"""
+        return self.model if not model or model == LEGACY_DEFAULT_MODEL else model
+
+    def _request(self, operation: str, method: str, path: str, **kwargs) -> requests.Response:
+        start_time = time.time()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}",
+                                            timeout=self.timeouts[operation], **kwargs)
+        except requests.RequestException:
+            self._record(operation, start_time, error=True)
+            raise
+        with self._lock:
+            self._stats[operation].latencies.append(response.elapsed.total_seconds() * 1000)
+        return response
+
+    def _record(self, operation: str, start_time: float, error: bool = False):
+        with self._lock:
+            stats = self._stats[operation]
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            else:
+                stats.durations.append((time.time() - start_time) * 1000)
+
+    def _cache_key(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None or not self.cache.enabled:
+            return None
+        return make_prompt_key(model, messages, options)
+
+    def chat(self, messages: List[Dict[str, str]], model: str = None, use_cache: bool = True, **options) -> str:
+        """非流式对话，返回模型回复文本；状态码不是200时抛出ModelCallError
+
+        use_cache=False时跳过缓存查找，但仍用新回复更新缓存。
+        """
+        model = self.resolve_model(model)
+        key = self._cache_key(model, messages, options)
+        if key is not None and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        start_time = time.time()
+        response = self._request("chat", "POST", "/api/chat",
+                                 json={"model": model, "messages": messages, "stream": False, **options})
+        if response.status_code != 200:
+            self._record("chat", start_time, error=True)
+            raise ModelCallError(response.status_code)
+        try:
+            content = response.json().get('message', {}).get('content', '')
+        except ValueError:
+            self._record("chat", start_time, error=True)
+            raise
+        self._record("chat", start_time)
+        if key is not None:
+            self.cache.put(key, content, model)
+        return content
+
+    def chat_stream(self, messages: List[Dict[str, str]], model: str = None, use_cache: bool = True,
+                    **options) -> Iterator[Dict[str, Any]]:
+        """流式对话，逐个产出Ollama返回的JSON数据块；状态码不是200时在产出任何数据块之前抛出ModelCallError
+
+        缓存命中时按同样的格式逐块回放（最后一块带cached标记）；未命中时完整收到done之后才写入缓存。
+        调用方提前停止迭代时关闭响应，未读完的连接不会放回连接池。
+        """
+        model = self.resolve_model(model)
+        key = self._cache_key(model, messages, options)
+        if key is not None and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield from replay_stream(cached, model)
+                return
+        start_time = time.time()
+        response = self._request("chat_stream", "POST", "/api/chat", stream=True,
+                                 json={"model": model, "messages": messages, "stream": True, **options})
+        error = True
+        parts = []
+        try:
+            if response.status_code != 200:
+                raise ModelCallError(response.status_code)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line.decode('utf-8'))
+                except json.JSONDecodeError:
+                    continue
+                parts.append(chunk.get('message', {}).get('content', ''))
+                if chunk.get('done', False) and key is not None:
+                    self.cache.put(key, "".join(parts), model)
+                yield chunk
+                if chunk.get('done', False):
+                    break
+            error = False
+        except GeneratorExit:
+            error = False  # 调用方（如断开的SSE客户端）主动停止，不算Ollama错误
+            raise
+        finally:
+            response.close()
+            self._record("chat_stream", start_time, error=error)
+
+    def load_model(self, model: str = None):
+        """让Ollama把模型加载进内存（消息列表为空时只加载不生成），用于预热，不经过缓存"""
+        start_time = time.time()
+        response = self._request("load", "POST", "/api/chat",
+                                 json={"model": self.resolve_model(model), "messages": [], "stream": False})
+        if response.status_code != 200:
+            self._record("load", start_time, error=True)
+            raise ModelCallError(response.status_code)
+        self._record("load", start_time)
+
+    def tags(self) -> List[Dict[str, Any]]:
+        """已安装的模型列表"""
+        start_time = time.time()
+        response = self._request("tags", "GET", "/api/tags")
+        if response.status_code != 200:
+            self._record("tags", start_time, error=True)
+            raise ModelCallError(response.status_code)
+        models = response.json().get("models", [])
+        self._record("tags", start_time)
+        return models
+
+    def status(self) -> str:
+        """running / error（服务可达但返回非200）/ offline（无法连接）"""
+        try:
+            self.tags()
+            return "running"
+        except ModelCallError:
+            return "error"
+        except (requests.RequestException, ValueError):
+            return "offline"
+
+    def stats(self) -> Dict[str, Any]:
+        """各类操作的延迟统计，以及连接池新建的连接数和复用的请求数
+
+        复用数按urllib3连接对象统计，服务端不支持keep-alive时（每次请求后关闭连接）会偏高。
+        """
+        # requests为每个连接池键附加了TLS参数，直接汇总适配器中已有的连接池
+        pools = self.adapter.poolmanager.pools
+        opened = sent = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        with self._lock:
+            operations = {name: stats.to_dict() for name, stats in self._stats.items()}
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "pool_size": self.pool_size,
+            "connections_opened": opened,
+            "requests_sent": sent,
+            "connections_reused": max(sent - opened, 0),
+            "operations": operations,
+            "response_cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    def close(self):
+        self.session.close()
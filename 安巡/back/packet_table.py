@@ -0,0 +1,262 @@
+"""列式数据包表
+
+每个字段保存为一个定长NumPy数组，IP地址和协议栈等字符串做字典编码，
+统计、过滤和提示词构建都可以直接在数组上向量化完成，无需反复解析"字段: 值"文本。
+"""
+from array import array
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# 数值列：列名 -> (array类型码, NumPy dtype)
+NUMERIC_COLUMNS = {
+    "frame_number": ("I", np.uint32),
+    "time_epoch": ("d", np.float64),
+    "frame_len": ("I", np.uint32),
+    "ip_proto": ("B", np.uint8),
+    "ttl": ("B", np.uint8),
+    "src_port": ("H", np.uint16),
+    "dst_port": ("H", np.uint16),
+    "tcp_flags": ("H", np.uint16),
+    "payload_len": ("I", np.uint32),
+}
+
+# 字典编码列：列名 -> 记录中的候选字段（按顺序取第一个存在的）
+DICTIONARY_COLUMNS = {
+    "src_ip": ("ip.src", "ipv6.src"),
+    "dst_ip": ("ip.dst", "ipv6.dst"),
+    "protocols": ("frame.protocols",),
+}
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# TCP标志位掩码
+TCP_FIN = 0x001
+TCP_SYN = 0x002
+TCP_RST = 0x004
+TCP_PSH = 0x008
+TCP_ACK = 0x010
+
+
+def _to_int(value: Optional[str], base: int = 10) -> int:
+    if not value:
+        return 0
+    try:
+        return int(value.split(",")[0], base)
+    except ValueError:
+        return 0
+
+
+class StringDictionary:
+    """字符串字典编码器"""
+
+    def __init__(self, values: List[str] = None):
+        self.values = list(values or [])
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class PacketTableBuilder:
+    """逐条追加数据包记录，最后一次性转换为PacketTable"""
+
+    def __init__(self):
+        self._numeric = {name: array(code) for name, (code, _) in NUMERIC_COLUMNS.items()}
+        self._codes = {name: array("l") for name in DICTIONARY_COLUMNS}
+        self._dicts = {name: StringDictionary() for name in DICTIONARY_COLUMNS}
+
+    def append(self, record: Dict[str, str]):
+        """追加一条tshark/内置读取器格式的记录"""
+        numeric = self._numeric
+        if "tcp.srcport" in record:
+            proto = IPPROTO_TCP
+            src_port = record["tcp.srcport"]
+            dst_port = record.get("tcp.dstport")
+            payload_len = _to_int(record.get("tcp.len"))
+        elif "udp.srcport" in record:
+            proto = IPPROTO_UDP
+            src_port = record["udp.srcport"]
+            dst_port = record.get("udp.dstport")
+            payload_len = max(_to_int(record.get("udp.length")) - 8, 0)
+        else:
+            proto = _to_int(record.get("ip.proto") or record.get("ipv6.nxt"))
+            src_port = dst_port = None
+            payload_len = 0
+
+        try:
+            time_epoch = float(record.get("frame.time_epoch") or 0.0)
+        except ValueError:
+            time_epoch = 0.0
+
+        numeric["frame_number"].append(_to_int(record.get("frame.number")))
+        numeric["time_epoch"].append(time_epoch)
+        numeric["frame_len"].append(_to_int(record.get("frame.len")))
+        numeric["ip_proto"].append(proto & 0xFF)
+        numeric["ttl"].append(_to_int(record.get("ip.ttl") or record.get("ipv6.hlim")) & 0xFF)
+        numeric["src_port"].append(_to_int(src_port) & 0xFFFF)
+        numeric["dst_port"].append(_to_int(dst_port) & 0xFFFF)
+        numeric["tcp_flags"].append(_to_int(record.get("tcp.flags"), 16) & 0xFFFF)
+        numeric["payload_len"].append(payload_len)
+
+        for name, candidates in DICTIONARY_COLUMNS.items():
+            value = ""
+            for field in candidates:
+                value = record.get(field)
+                if value:
+                    break
+            self._codes[name].append(self._dicts[name].encode(value or ""))
+
+    def __len__(self):
+        return len(self._numeric["frame_number"])
+
+    def build(self) -> "PacketTable":
+        columns = {name: np.array(values, dtype=NUMERIC_COLUMNS[name][1]) for name, values in self._numeric.items()}
+        for name, codes in self._codes.items():
+            columns[name] = np.asarray(codes, dtype=np.int32)
+        dictionaries = {name: d.values for name, d in self._dicts.items()}
+        return PacketTable(columns, dictionaries)
+
+
+class PacketTable:
+    """列式数据包表"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]]):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    @classmethod
+    def from_records(cls, records) -> "PacketTable":
+        builder = PacketTableBuilder()
+        for record in records:
+            builder.append(record)
+        return builder.build()
+
+    @classmethod
+    def empty(cls) -> "PacketTable":
+        return PacketTableBuilder().build()
+
+    def __len__(self):
+        return len(self.columns["frame_number"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def decode(self, name: str) -> np.ndarray:
+        """将字典编码列还原为字符串数组"""
+        values = np.asarray(self.dictionaries[name], dtype=object)
+        return values[self.columns[name]] if len(values) else np.zeros(0, dtype=object)
+
+    def take(self, indices) -> "PacketTable":
+        """按布尔掩码或下标选取行，字典保持共享"""
+        return PacketTable({name: col[indices] for name, col in self.columns.items()}, self.dictionaries)
+
+    def filter(self, mask: np.ndarray) -> "PacketTable":
+        return self.take(mask)
+
+    def sort_by_time(self) -> "PacketTable":
+        order = np.lexsort((self.columns["frame_number"], self.columns["time_epoch"]))
+        return self.take(order)
+
+    @classmethod
+    def concat(cls, tables: List["PacketTable"]) -> "PacketTable":
+        """合并多个表，重新映射各自的字典编码"""
+        tables = [t for t in tables if t is not None]
+        if not tables:
+            return cls.empty()
+
+        columns = {name: np.concatenate([t.columns[name] for t in tables]) for name in NUMERIC_COLUMNS}
+        dictionaries = {}
+        for name in DICTIONARY_COLUMNS:
+            merged = StringDictionary()
+            parts = []
+            for table in tables:
+                remap = np.fromiter((merged.encode(v) for v in table.dictionaries[name]),
+                                    dtype=np.int32, count=len(table.dictionaries[name]))
+                parts.append(remap[table.columns[name]] if len(remap) else table.columns[name])
+            columns[name] = np.concatenate(parts).astype(np.int32)
+            dictionaries[name] = merged.values
+        return cls(columns, dictionaries)
+
+    def value_counts(self, name: str, top: int = 10) -> List[Dict[str, Any]]:
+        """统计字典编码列的取值分布（按数量降序）"""
+        if not len(self):
+            return []
+        counts = np.bincount(self.columns[name], minlength=len(self.dictionaries[name]))
+        order = np.argsort(counts)[::-1][:top]
+        return [{"value": self.dictionaries[name][i], "count": int(counts[i])} for i in order if counts[i]]
+
+    def port_counts(self, top: int = 10) -> List[Dict[str, Any]]:
+        """目标端口分布"""
+        if not len(self):
+            return []
+        ports, counts = np.unique(self.columns["dst_port"], return_counts=True)
+        order = np.argsort(counts)[::-1][:top]
+        return [{"port": int(ports[i]), "count": int(counts[i])} for i in order]
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        """向量化计算的流量概况"""
+        if not len(self):
+            return {"packet_count": 0}
+
+        proto = self.columns["ip_proto"]
+        times = self.columns["time_epoch"]
+        flags = self.columns["tcp_flags"]
+        is_tcp = proto == IPPROTO_TCP
+        syn_only = is_tcp & ((flags & (TCP_SYN | TCP_ACK)) == TCP_SYN)
+        return {
+            "packet_count": len(self),
+            "total_bytes": int(self.columns["frame_len"].sum(dtype=np.uint64)),
+            "start_time": float(times.min()),
+            "end_time": float(times.max()),
+            "duration": float(times.max() - times.min()),
+            "tcp_packets": int(is_tcp.sum()),
+            "udp_packets": int((proto == IPPROTO_UDP).sum()),
+            "syn_packets": int(syn_only.sum()),
+            "rst_packets": int((is_tcp & ((flags & TCP_RST) != 0)).sum()),
+            "unique_src_ips": int(np.count_nonzero(np.bincount(self.columns["src_ip"]))),
+            "unique_dst_ips": int(np.count_nonzero(np.bincount(self.columns["dst_ip"]))),
+            "top_src_ips": self.value_counts("src_ip", top),
+            "top_dst_ips": self.value_counts("dst_ip", top),
+            "protocol_stacks": self.value_counts("protocols", top),
+            "top_dst_ports": self.port_counts(top),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可JSON序列化的列式结构"""
+        return {
+            "columns": {name: col.tolist() for name, col in self.columns.items()},
+            "dictionaries": self.dictionaries,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PacketTable":
+        columns = {}
+        for name, (_, dtype) in NUMERIC_COLUMNS.items():
+            columns[name] = np.asarray(data["columns"].get(name, []), dtype=dtype)
+        for name in DICTIONARY_COLUMNS:
+            columns[name] = np.asarray(data["columns"].get(name, []), dtype=np.int32)
+        return cls(columns, {name: list(data["dictionaries"].get(name, [])) for name in DICTIONARY_COLUMNS})
+
+    def save(self, path: str):
+        """以压缩npz格式保存"""
+        arrays = dict(self.columns)
+        for name, values in self.dictionaries.items():
+            arrays[f"dict_{name}"] = np.asarray(values, dtype=str)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "PacketTable":
+        with np.load(path, allow_pickle=False) as data:
+            columns = {name: data[name] for name in list(NUMERIC_COLUMNS) + list(DICTIONARY_COLUMNS)}
+            dictionaries = {name: data[f"dict_{name}"].tolist() for name in DICTIONARY_COLUMNS}
+        return cls(columns, dictionaries)
@@ -0,0 +1,806 @@
+"""纯Python的pcap/pcapng读取器
+
+通过mmap + struct/memoryview直接解码Ethernet/IPv4/IPv6/TCP/UDP头部，
+输出与tshark -T fields同名的字段记录，在只需要五元组和头部信息时替代tshark进程。
+无法mmap的顺序流（管道、仍在上传中的文件）由iter_stream_records逐条记录读取。
+"""
+import mmap
+import os
+import socket
+import struct
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class UnsupportedCaptureError(Exception):
+    """读取器无法处理的文件格式或链路类型，调用方应回退到tshark"""
+
+
+# 链路层类型（LINKTYPE_*）
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+LINKTYPE_UNDEFINED = -1  # 数据包引用了未定义的接口
+
+SUPPORTED_LINKTYPES = {
+    LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL,
+    LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_LINUX_SLL2,
+}
+
+# tshark中frame.encap_type使用的是wiretap封装编号，与LINKTYPE不同
+WTAP_ENCAP = {
+    LINKTYPE_NULL: "15",
+    LINKTYPE_ETHERNET: "1",
+    LINKTYPE_RAW: "7",
+    LINKTYPE_IPV4: "7",
+    LINKTYPE_IPV6: "7",
+    LINKTYPE_LINUX_SLL: "25",
+    LINKTYPE_LINUX_SLL2: "210",
+}
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPV6_EXT_HEADERS = (0, 43, 60)  # hop-by-hop / routing / destination options
+IPV6_FRAGMENT = 44
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1000),   # 微秒，小端
+    b"\xa1\xb2\xc3\xd4": (">", 1000),   # 微秒，大端
+    b"\x4d\x3c\xb2\xa1": ("<", 1),      # 纳秒，小端
+    b"\xa1\xb2\x3c\x4d": (">", 1),      # 纳秒，大端
+}
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 1
+PCAPNG_PB = 2
+PCAPNG_SPB = 3
+PCAPNG_ISB = 5
+PCAPNG_EPB = 6
+
+# ISB（接口统计块）中的计数器选项
+ISB_COUNTERS = {4: "ifrecv", 5: "ifdrop", 6: "filteraccept", 7: "osdrop", 8: "usrdeliv"}
+
+# TCP标志位展示顺序，与tshark的tcp.flags.str一致（3位保留位 + AE/CWR/ECE/URG/ACK/PSH/RST/SYN/FIN）
+TCP_FLAG_BITS = (
+    ("tcp.flags.ae", 0x100, "N"), ("tcp.flags.cwr", 0x080, "C"), ("tcp.flags.ece", 0x040, "E"),
+    ("tcp.flags.urg", 0x020, "U"), ("tcp.flags.ack", 0x010, "A"), ("tcp.flags.push", 0x008, "P"),
+    ("tcp.flags.reset", 0x004, "R"), ("tcp.flags.syn", 0x002, "S"), ("tcp.flags.fin", 0x001, "F"),
+)
+
+# tshark完整字段（traffic_analyzer.TSHARK_FIELDS）中内置读取器不输出的字段：相对序列号、TCP分析与重组、
+# 按流计算的时间和名称解析都依赖跨包状态或tshark的解析器。序列号以tcp.seq_raw/tcp.ack_raw给出；
+# tcp.stream/udp.stream只在顺序读取整个文件时输出（分片解析和按偏移下钻时没有全局编号）
+NATIVE_OMITTED_FIELDS = (
+    "eth.dst_resolved", "eth.src_resolved", "tcp.seq", "tcp.nxtseq", "tcp.ack", "tcp.time_relative",
+    "tcp.time_delta", "tcp.analysis.bytes_in_flight", "tcp.analysis.push_bytes_sent", "tcp.segment",
+    "tcp.segment.count", "tcp.reassembled.length", "data.len",
+)
+
+# 未校验校验和时tshark的*.checksum.status取值
+CHECKSUM_UNVERIFIED = "2"
+
+_ETH = struct.Struct("!6s6sH")
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_IPV6 = struct.Struct("!IHBB16s16s")
+_TCP = struct.Struct("!HHIIHHHH")
+_UDP = struct.Struct("!HHHH")
+
+
+class Frame(NamedTuple):
+    """抓包文件中的一帧（只包含位置信息，不复制数据）"""
+    number: int
+    ts_ns: int
+    linktype: int
+    caplen: int
+    wirelen: int
+    offset: int  # 帧数据在文件中的字节偏移
+    block_offset: int  # 帧所在记录（pcap记录头/pcapng块）的起始偏移
+
+
+def _bool(value) -> str:
+    return "True" if value else "False"
+
+
+def _mac(raw: bytes) -> str:
+    return raw.hex(":")
+
+
+class CaptureFile:
+    """以mmap方式打开的pcap/pcapng文件
+
+    check_interfaces为True时打开pcapng后先遍历全部块头，任何接口的链路类型不受支持、或数据包引用了
+    未定义的接口，都在读取第一个数据包之前抛出UnsupportedCaptureError；只按偏移读取已索引的帧或
+    只读取统计块时可以关闭。
+    """
+
+    def __init__(self, path: str, check_interfaces: bool = True):
+        self.path = path
+        self.check_interfaces = check_interfaces
+        self._fp = open(path, "rb")
+        try:
+            if os.fstat(self._fp.fileno()).st_size < 24:
+                raise UnsupportedCaptureError("文件过小，不是有效的抓包文件")
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._fp.close()
+            raise
+        self.buf = memoryview(self._mm)
+        self.format = None
+        self.endian = "<"
+        self.linktype = None
+        self.snaplen = None
+        self._ts_mult = 1000
+        self._data_start = 0
+        self._detect_format()
+
+    def _detect_format(self):
+        magic = bytes(self.buf[:4])
+        if magic in PCAP_MAGIC:
+            self.format = "pcap"
+            self.endian, self._ts_mult = PCAP_MAGIC[magic]
+            _, _, _, _, self.snaplen, self.linktype = struct.unpack_from(self.endian + "HHiIII", self.buf, 4)
+            self.linktype &= 0xFFFF
+            if self.linktype not in SUPPORTED_LINKTYPES:
+                raise UnsupportedCaptureError(f"不支持的链路类型: {self.linktype}")
+            self._data_start = 24
+        elif struct.unpack_from("<I", self.buf, 0)[0] == PCAPNG_SHB:
+            self.format = "pcapng"
+            self._data_start = 0
+            self._probe_pcapng()
+        else:
+            raise UnsupportedCaptureError("无法识别的文件格式")
+
+    def _probe_pcapng(self):
+        """检查第一个数据包之前声明的接口，尽早发现不支持的链路类型"""
+        bom = struct.unpack_from("<I", self.buf, 8)[0]
+        if bom not in (PCAPNG_BYTE_ORDER_MAGIC, 0x4D3C2B1A):
+            raise UnsupportedCaptureError("pcapng字节序标记无效")
+        self.endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+        if self.check_interfaces:
+            self._check_pcapng_interfaces()
+        else:
+            for _ in self._iter_pcapng_frames(0, len(self.buf), 1, []):
+                break
+
+    def _check_pcapng_interfaces(self):
+        """只读块头检查全部IDB的链路类型和数据包引用的接口号，多接口文件中靠后的接口也在这里拒绝"""
+        buf = self.buf
+        endian = self.endian
+        pos = 0
+        interfaces = 0
+        while pos + 12 <= len(buf):
+            block_type = struct.unpack_from(endian + "I", buf, pos)[0]
+            if block_type == PCAPNG_SHB:
+                bom = struct.unpack_from("<I", buf, pos + 8)[0]
+                endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                interfaces = 0
+            block_len = struct.unpack_from(endian + "I", buf, pos + 4)[0]
+            if block_len < 12 or pos + block_len > len(buf):
+                break
+            if block_type == PCAPNG_IDB:
+                linktype, _, snaplen = struct.unpack_from(endian + "HHI", buf, pos + 8)
+                if linktype not in SUPPORTED_LINKTYPES:
+                    raise UnsupportedCaptureError(f"不支持的链路类型: {linktype}（接口{interfaces}）")
+                if self.linktype is None:
+                    self.linktype, self.snaplen = linktype, snaplen
+                interfaces += 1
+            elif block_type == PCAPNG_EPB or block_type == PCAPNG_PB:
+                if_id = struct.unpack_from(endian + ("I" if block_type == PCAPNG_EPB else "H"), buf, pos + 8)[0]
+                if if_id >= interfaces:
+                    raise UnsupportedCaptureError("数据包引用了未定义的接口")
+            elif block_type == PCAPNG_SPB and not interfaces:
+                raise UnsupportedCaptureError("数据包引用了未定义的接口")
+            pos += block_len
+
+    def close(self):
+        self.buf.release()
+        self._mm.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def interface_statistics(self) -> Dict[int, Dict[str, int]]:
+        """读取pcapng中的接口统计块，返回每个接口最后一次记录的收包/丢包计数（pcap格式返回空字典）"""
+        if self.format != "pcapng":
+            return {}
+        buf = self.buf
+        endian = self.endian
+        pos = 0
+        counters = {}
+        while pos + 12 <= len(buf):
+            block_type = struct.unpack_from(endian + "I", buf, pos)[0]
+            if block_type == PCAPNG_SHB:
+                bom = struct.unpack_from("<I", buf, pos + 8)[0]
+                endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            block_len = struct.unpack_from(endian + "I", buf, pos + 4)[0]
+            if block_len < 12 or pos + block_len > len(buf):
+                break
+            if block_type == PCAPNG_ISB and block_len >= 24:
+                if_id = struct.unpack_from(endian + "I", buf, pos + 8)[0]
+                values = counters.setdefault(if_id, {})
+                opt = pos + 20
+                end = pos + block_len - 4
+                while opt + 4 <= end:
+                    code, length = struct.unpack_from(endian + "HH", buf, opt)
+                    if code == 0:
+                        break
+                    if code in ISB_COUNTERS and length == 8 and opt + 12 <= end:
+                        values[ISB_COUNTERS[code]] = struct.unpack_from(endian + "Q", buf, opt + 4)[0]
+                    opt += 4 + ((length + 3) & ~3)
+            pos += block_len
+        return counters
+
+    def iter_frames(self) -> Iterator[Frame]:
+        """按文件顺序遍历所有帧"""
+        if self.format == "pcap":
+            return self._iter_pcap_frames(self._data_start, len(self.buf), 1)
+        return self._iter_pcapng_frames(self._data_start, len(self.buf), 1, [])
+
+    def plan_shards(self, shard_count: int) -> List[Dict[str, Any]]:
+        """按字节范围把文件切分为若干分片，切分点落在帧边界上
+
+        只遍历记录头，不解码数据包。每个分片记录解析所需的上下文
+        （起始帧号、上一帧时间戳、pcapng的接口表与字节序），可在独立进程中解析。
+        """
+        data_start = self._data_start
+        target = max((len(self.buf) - data_start) // max(shard_count, 1), 1)
+        interfaces = []
+        frames = (self._iter_pcap_frames(data_start, len(self.buf), 1) if self.format == "pcap"
+                  else self._iter_pcapng_frames(data_start, len(self.buf), 1, interfaces))
+
+        shards = []
+        current = {"start": data_start, "first_frame": 1, "prev_ts_ns": None,
+                   "endian": self.endian, "interfaces": []}
+        first_ts = last_ts = None
+        next_cut = data_start + target
+        for frame in frames:
+            if first_ts is None:
+                first_ts = frame.ts_ns
+            if frame.block_offset >= next_cut and len(shards) < shard_count - 1:
+                current["end"] = frame.block_offset
+                shards.append(current)
+                current = {"start": frame.block_offset, "first_frame": frame.number, "prev_ts_ns": last_ts,
+                           "endian": self.endian, "interfaces": list(interfaces)}
+                next_cut = frame.block_offset + target
+            last_ts = frame.ts_ns
+        current["end"] = len(self.buf)
+        shards.append(current)
+
+        for index, shard in enumerate(shards):
+            shard["index"] = index
+            shard["first_ts_ns"] = first_ts
+        return shards
+
+    def iter_shard_frames(self, shard: Dict[str, Any]) -> Iterator[Frame]:
+        """遍历plan_shards生成的某个分片内的帧"""
+        self.endian = shard["endian"]
+        if self.format == "pcap":
+            return self._iter_pcap_frames(shard["start"], shard["end"], shard["first_frame"])
+        return self._iter_pcapng_frames(shard["start"], shard["end"], shard["first_frame"],
+                                        list(shard["interfaces"]))
+
+    def _iter_pcap_frames(self, pos: int, end: int, number: int) -> Iterator[Frame]:
+        rec = struct.Struct(self.endian + "IIII")
+        buf = self.buf
+        ts_mult = self._ts_mult
+        linktype = self.linktype
+        while pos + 16 <= end:
+            ts_sec, ts_frac, caplen, wirelen = rec.unpack_from(buf, pos)
+            pos += 16
+            if pos + caplen > len(buf):
+                break  # 文件被截断
+            yield Frame(number, ts_sec * 1_000_000_000 + ts_frac * ts_mult, linktype, caplen, wirelen, pos, pos - 16)
+            pos += caplen
+            number += 1
+
+    def _iter_pcapng_frames(self, pos: int, end: int, number: int,
+                            interfaces: List[tuple]) -> Iterator[Frame]:
+        buf = self.buf
+        endian = self.endian
+        while pos + 12 <= end:
+            block_type = struct.unpack_from(endian + "I", buf, pos)[0]
+            if block_type == PCAPNG_SHB:
+                bom = struct.unpack_from("<I", buf, pos + 8)[0]
+                endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                self.endian = endian
+                interfaces.clear()  # 新的Section重新编号接口
+            block_len = struct.unpack_from(endian + "I", buf, pos + 4)[0]
+            if block_len < 12 or pos + block_len > len(buf):
+                break
+
+            if block_type == PCAPNG_IDB:
+                linktype, _, snaplen = struct.unpack_from(endian + "HHI", buf, pos + 8)
+                if linktype not in SUPPORTED_LINKTYPES:
+                    raise UnsupportedCaptureError(f"不支持的链路类型: {linktype}")
+                ts_unit = _pcapng_ts_unit(buf, pos + 16, pos + block_len - 4, endian)
+                interfaces.append((linktype, ts_unit))
+                if self.linktype is None:
+                    self.linktype, self.snaplen = linktype, snaplen
+            elif block_type in (PCAPNG_EPB, PCAPNG_PB):
+                if block_type == PCAPNG_EPB:
+                    if_id, ts_high, ts_low, caplen, wirelen = struct.unpack_from(endian + "IIIII", buf, pos + 8)
+                else:
+                    if_id, _, ts_high, ts_low, caplen, wirelen = struct.unpack_from(endian + "HHIIII", buf, pos + 8)
+                if if_id >= len(interfaces):
+                    raise UnsupportedCaptureError("数据包引用了未定义的接口")
+                if 28 + caplen > block_len:
+                    break  # 包长度超出块长度，视为文件损坏
+                linktype, ts_unit = interfaces[if_id]
+                ts = (ts_high << 32) | ts_low
+                yield Frame(number, _pcapng_ts_to_ns(ts, ts_unit), linktype, caplen, wirelen, pos + 28, pos)
+                number += 1
+            elif block_type == PCAPNG_SPB:
+                if not interfaces:
+                    raise UnsupportedCaptureError("数据包引用了未定义的接口")
+                wirelen = struct.unpack_from(endian + "I", buf, pos + 8)[0]
+                caplen = min(wirelen, block_len - 16)
+                yield Frame(number, 0, interfaces[0][0], caplen, wirelen, pos + 12, pos)
+                number += 1
+
+            pos += block_len
+
+
+def _pcapng_ts_unit(buf, pos: int, end: int, endian: str) -> tuple:
+    """读取IDB中的if_tsresol选项，返回(底数, 指数)，默认微秒"""
+    while pos + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", buf, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            resol = buf[pos + 4]
+            return (2, resol & 0x7F) if resol & 0x80 else (10, resol)
+        pos += 4 + ((length + 3) & ~3)
+    return (10, 6)
+
+
+def _pcapng_ts_to_ns(ts: int, ts_unit: tuple) -> int:
+    base, exp = ts_unit
+    if base == 10:
+        if exp <= 9:
+            return ts * 10 ** (9 - exp)
+        return ts // 10 ** (exp - 9)
+    return (ts * 1_000_000_000) >> exp
+
+
+def decode_packet(data: memoryview, linktype: int) -> Optional[Dict[str, str]]:
+    """解码链路层/网络层/传输层头部，返回tshark同名字段；非TCP/UDP数据包返回None"""
+    record = {}
+    protocols = []
+    length = len(data)
+    offset = 0
+
+    if linktype == LINKTYPE_ETHERNET:
+        if length < 14:
+            return None
+        dst, src, ethertype = _ETH.unpack_from(data, 0)
+        record["eth.dst"] = _mac(dst)
+        record["eth.src"] = _mac(src)
+        protocols += ["eth", "ethertype"]
+        offset = 14
+        while ethertype in ETHERTYPE_VLAN and length >= offset + 4:
+            ethertype = struct.unpack_from("!H", data, offset + 2)[0]
+            protocols.append("vlan")
+            offset += 4
+        record["eth.type"] = f"0x{ethertype:04x}"
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if length < 16:
+            return None
+        ethertype = struct.unpack_from("!H", data, 14)[0]
+        protocols += ["sll", "ethertype"]
+        offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if length < 20:
+            return None
+        ethertype = struct.unpack_from("!H", data, 0)[0]
+        protocols += ["sll", "ethertype"]
+        offset = 20
+    elif linktype == LINKTYPE_NULL:
+        if length < 4:
+            return None
+        family = struct.unpack_from("<I", data, 0)[0]
+        if family > 0xFFFF:
+            family = struct.unpack_from(">I", data, 0)[0]
+        ethertype = ETHERTYPE_IPV4 if family == 2 else ETHERTYPE_IPV6
+        protocols.append("null")
+        offset = 4
+    else:
+        if length < 1:
+            return None
+        ethertype = ETHERTYPE_IPV4 if data[0] >> 4 == 4 else ETHERTYPE_IPV6
+        protocols.append("raw")
+
+    if ethertype == ETHERTYPE_IPV4:
+        if length < offset + 20:
+            return None
+        (ver_ihl, dsfield, total_len, ip_id, flags_frag, ttl, proto,
+         checksum, src, dst) = _IPV4.unpack_from(data, offset)
+        hdr_len = (ver_ihl & 0x0F) * 4
+        flags = flags_frag >> 13
+        frag_offset = (flags_frag & 0x1FFF) * 8
+        record.update({
+            "ip.version": str(ver_ihl >> 4),
+            "ip.hdr_len": str(hdr_len),
+            "ip.dsfield": f"0x{dsfield:02x}",
+            "ip.dsfield.dscp": str(dsfield >> 2),
+            "ip.len": str(total_len),
+            "ip.id": f"0x{ip_id:04x}",
+            "ip.flags": f"0x{flags:02x}",
+            "ip.flags.rb": _bool(flags & 0x4),
+            "ip.flags.df": _bool(flags & 0x2),
+            "ip.flags.mf": _bool(flags & 0x1),
+            "ip.frag_offset": str(frag_offset),
+            "ip.ttl": str(ttl),
+            "ip.proto": str(proto),
+            "ip.checksum": f"0x{checksum:04x}",
+            "ip.checksum.status": CHECKSUM_UNVERIFIED,
+            "ip.src": socket.inet_ntoa(src),
+            "ip.dst": socket.inet_ntoa(dst),
+        })
+        protocols.append("ip")
+        if frag_offset:
+            return None  # 非首片分片不含传输层头部
+        l4_offset = offset + hdr_len
+        l4_end = min(length, offset + total_len) if total_len else length
+    elif ethertype == ETHERTYPE_IPV6:
+        if length < offset + 40:
+            return None
+        vtcfl, payload_len, proto, hlim, src, dst = _IPV6.unpack_from(data, offset)
+        record.update({
+            "ipv6.version": str(vtcfl >> 28),
+            "ipv6.plen": str(payload_len),
+            "ipv6.nxt": str(proto),
+            "ipv6.hlim": str(hlim),
+            "ipv6.src": socket.inet_ntop(socket.AF_INET6, src),
+            "ipv6.dst": socket.inet_ntop(socket.AF_INET6, dst),
+        })
+        protocols.append("ipv6")
+        l4_offset = offset + 40
+        l4_end = min(length, l4_offset + payload_len) if payload_len else length
+        while proto in IPV6_EXT_HEADERS or proto == IPV6_FRAGMENT:
+            if l4_end < l4_offset + 8:
+                return None
+            next_proto = data[l4_offset]
+            if proto == IPV6_FRAGMENT:
+                if struct.unpack_from("!H", data, l4_offset + 2)[0] & 0xFFF8:
+                    return None
+                l4_offset += 8
+            else:
+                l4_offset += (data[l4_offset + 1] + 1) * 8
+            proto = next_proto
+    else:
+        return None
+
+    if proto == IPPROTO_TCP:
+        if l4_end < l4_offset + 20:
+            return None
+        (sport, dport, seq, ack, off_flags, window,
+         checksum, urgent) = _TCP.unpack_from(data, l4_offset)
+        hdr_len = (off_flags >> 12) * 4
+        flags = off_flags & 0x0FFF
+        payload = data[l4_offset + hdr_len:l4_end] if l4_end > l4_offset + hdr_len else b""
+        flag_str = "···" + "".join(ch if flags & bit else "·" for _, bit, ch in TCP_FLAG_BITS)
+        record.update({
+            "tcp.srcport": str(sport),
+            "tcp.dstport": str(dport),
+            "tcp.len": str(len(payload)),
+            "tcp.seq_raw": str(seq),
+            "tcp.ack_raw": str(ack),
+            "tcp.hdr_len": str(hdr_len),
+            "tcp.flags": f"0x{flags:04x}",
+            "tcp.flags.res": _bool(flags & 0xE00),
+        })
+        for field, bit, _ in TCP_FLAG_BITS:
+            record[field] = _bool(flags & bit)
+        record.update({
+            "tcp.flags.str": flag_str,
+            "tcp.window_size_value": str(window),
+            # 未跟踪握手中的窗口缩放选项，与tshark缩放因子未知（-1）时相同，window_size等于原始值
+            "tcp.window_size": str(window),
+            "tcp.window_size_scalefactor": "-1",
+            "tcp.checksum": f"0x{checksum:04x}",
+            "tcp.checksum.status": CHECKSUM_UNVERIFIED,
+            "tcp.urgent_pointer": str(urgent),
+        })
+        if payload:
+            record["tcp.payload"] = bytes(payload).hex()
+        protocols.append("tcp")
+    elif proto == IPPROTO_UDP:
+        if l4_end < l4_offset + 8:
+            return None
+        sport, dport, udp_len, checksum = _UDP.unpack_from(data, l4_offset)
+        record.update({
+            "udp.srcport": str(sport),
+            "udp.dstport": str(dport),
+            "udp.length": str(udp_len),
+            "udp.checksum": f"0x{checksum:04x}",
+            "udp.checksum.status": CHECKSUM_UNVERIFIED,
+        })
+        protocols.append("udp")
+    else:
+        return None
+
+    record["frame.protocols"] = ":".join(protocols)
+    return record
+
+
+def frame_record(frame: Frame, data: memoryview, first_ts_ns: int, prev_ts_ns: int) -> Optional[Dict[str, str]]:
+    """组合frame.*字段与协议头字段，字段顺序与tshark输出保持一致"""
+    decoded = decode_packet(data, frame.linktype)
+    if decoded is None:
+        return None
+    record = {
+        "frame.encap_type": WTAP_ENCAP.get(frame.linktype, ""),
+        "frame.time": _format_frame_time(frame.ts_ns),
+        "frame.offset_shift": "0.000000000",
+        "frame.time_epoch": _format_ns(frame.ts_ns),
+        "frame.time_delta": _format_ns(frame.ts_ns - prev_ts_ns),
+        "frame.time_relative": _format_ns(frame.ts_ns - first_ts_ns),
+        "frame.number": str(frame.number),
+        "frame.len": str(frame.wirelen),
+        "frame.marked": "False",
+        "frame.protocols": decoded.pop("frame.protocols"),
+    }
+    record.update(decoded)
+    return record
+
+
+@lru_cache(maxsize=4096)
+def _format_second(sec: int) -> Tuple[str, str]:
+    tm = time.localtime(sec)
+    return time.strftime("%b %e, %Y %H:%M:%S", tm), time.strftime("%Z", tm)
+
+
+def _format_frame_time(ns: int) -> str:
+    """与tshark的frame.time相同的本地时间格式，如 Jan  1, 2024 08:00:00.123456789 CST"""
+    sec, frac = divmod(ns, 1_000_000_000)
+    prefix, zone = _format_second(sec)
+    return f"{prefix}.{frac:09d} {zone}"
+
+
+def _stream_key(record: Dict[str, str]) -> Optional[tuple]:
+    """会话键：协议加上排序后的两个端点，两个方向属于同一会话"""
+    src = record.get("ip.src") or record.get("ipv6.src")
+    dst = record.get("ip.dst") or record.get("ipv6.dst")
+    if "tcp.srcport" in record:
+        proto, sport, dport = "tcp", record["tcp.srcport"], record["tcp.dstport"]
+    else:
+        proto, sport, dport = "udp", record["udp.srcport"], record["udp.dstport"]
+    a, b = (src, sport), (dst, dport)
+    return (proto,) + ((a, b) if a <= b else (b, a))
+
+
+def _format_ns(ns: int) -> str:
+    sign = "-" if ns < 0 else ""
+    sec, frac = divmod(abs(ns), 1_000_000_000)
+    return f"{sign}{sec}.{frac:09d}"
+
+
+def _frame_records(frames: Iterator[Tuple[Frame, Any]], stats: Dict[str, Any], max_packets: int = None,
+                   first_ts: int = None, prev_ts: int = None, number_streams: bool = True) -> Iterator[Dict[str, str]]:
+    """把(帧, 帧数据)序列解码为记录，同时累计帧数、未解码帧数和不支持的接口上的帧数
+
+    number_streams为True时按会话首次出现的顺序分别为TCP和UDP编号，输出tcp.stream/udp.stream（与tshark一致）。
+    """
+    streams = {}
+    stream_counts = {"tcp": 0, "udp": 0}
+    for frame, data in frames:
+        stats["total_frames"] += 1
+        if frame.linktype not in SUPPORTED_LINKTYPES:
+            stats["unsupported_frames"] += 1
+            continue
+        if first_ts is None:
+            first_ts = frame.ts_ns
+        if prev_ts is None:
+            prev_ts = frame.ts_ns
+        record = frame_record(frame, data, first_ts, prev_ts)
+        prev_ts = frame.ts_ns
+        if record is None:
+            stats["undecoded_frames"] += 1
+            continue
+        if number_streams:
+            key = _stream_key(record)
+            index = streams.get(key)
+            if index is None:
+                index = streams[key] = stream_counts[key[0]]
+                stream_counts[key[0]] += 1
+            record[f"{key[0]}.stream"] = str(index)
+
+        stats["yielded_packets"] += 1
+        yield record
+        if max_packets is not None and stats["yielded_packets"] >= max_packets:
+            break
+
+
+def iter_pcap_records(pcap_file: str, max_packets: int = None, stats: Dict[str, Any] = None,
+                      shard: Dict[str, Any] = None) -> Iterator[Dict[str, str]]:
+    """解析抓包文件（或其中一个分片），只输出TCP/UDP数据包（等价于tshark -Y "tcp or udp"）
+
+    字段与tshark同名，但不包含NATIVE_OMITTED_FIELDS；分片解析时没有tcp.stream/udp.stream。
+    文件格式或任一接口的链路类型不受支持时在产生任何记录之前抛出UnsupportedCaptureError。
+    """
+    if stats is None:
+        stats = {}
+    stats.update({"total_frames": 0, "yielded_packets": 0, "undecoded_frames": 0, "unsupported_frames": 0})
+
+    # 分片由plan_shards在父进程中遍历整个文件得到，接口已检查过
+    with CaptureFile(pcap_file, check_interfaces=shard is None) as capture:
+        if shard is None:
+            frames = capture.iter_frames()
+            first_ts = prev_ts = None
+        else:
+            frames = capture.iter_shard_frames(shard)
+            first_ts = shard["first_ts_ns"]
+            prev_ts = shard["prev_ts_ns"]
+
+        def with_data():
+            for frame in frames:
+                data = capture.buf[frame.offset:frame.offset + frame.caplen]
+                try:
+                    yield frame, data
+                finally:
+                    data.release()
+
+        yield from _frame_records(with_data(), stats, max_packets, first_ts, prev_ts, number_streams=shard is None)
+
+
+def _read_exact(stream, size: int) -> Optional[bytes]:
+    """从流中读取恰好size字节，流在中途结束时返回None（视为文件截断）"""
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            return None
+        data += more
+    return data
+
+
+def iter_stream_frames(stream) -> Iterator[Tuple[Frame, memoryview]]:
+    """从只能顺序读取的流中逐帧读取pcap/pcapng，返回(帧, 帧数据)
+
+    stream只需要提供read(size)；帧的offset/block_offset仍是相对文件开头的字节偏移。
+    格式错误在返回迭代器之前抛出。
+    """
+    magic = _read_exact(stream, 4)
+    if magic is None:
+        raise UnsupportedCaptureError("文件过小，不是有效的抓包文件")
+    if magic in PCAP_MAGIC:
+        return _iter_pcap_stream(stream, magic)
+    if struct.unpack("<I", magic)[0] == PCAPNG_SHB:
+        return _iter_pcapng_stream(stream, magic)
+    raise UnsupportedCaptureError("无法识别的文件格式")
+
+
+def _iter_pcap_stream(stream, magic: bytes) -> Iterator[Tuple[Frame, memoryview]]:
+    endian, ts_mult = PCAP_MAGIC[magic]
+    header = _read_exact(stream, 20)
+    if header is None:
+        raise UnsupportedCaptureError("文件过小，不是有效的抓包文件")
+    linktype = struct.unpack(endian + "HHiIII", header)[5] & 0xFFFF
+    if linktype not in SUPPORTED_LINKTYPES:
+        raise UnsupportedCaptureError(f"不支持的链路类型: {linktype}")
+
+    def frames(pos: int, number: int):
+        rec = struct.Struct(endian + "IIII")
+        while True:
+            header = _read_exact(stream, 16)
+            if header is None:
+                return
+            ts_sec, ts_frac, caplen, wirelen = rec.unpack(header)
+            data = _read_exact(stream, caplen)
+            if data is None:
+                return  # 文件被截断
+            yield (Frame(number, ts_sec * 1_000_000_000 + ts_frac * ts_mult, linktype, caplen, wirelen,
+                         pos + 16, pos), memoryview(data))
+            pos += 16 + caplen
+            number += 1
+
+    return frames(24, 1)
+
+
+def _read_pcapng_block(stream, head: bytes, endian: str) -> Optional[Tuple[bytes, str]]:
+    """读取以head（块类型）开头的完整pcapng块，返回(块数据, 字节序)；遇到SHB时重新确定字节序"""
+    prefix = head + (_read_exact(stream, 4) or b"")
+    if len(prefix) < 8:
+        return None
+    if struct.unpack_from("<I", prefix, 0)[0] == PCAPNG_SHB:
+        bom_raw = _read_exact(stream, 4)
+        if bom_raw is None:
+            return None
+        bom = struct.unpack("<I", bom_raw)[0]
+        if bom not in (PCAPNG_BYTE_ORDER_MAGIC, 0x4D3C2B1A):
+            raise UnsupportedCaptureError("pcapng字节序标记无效")
+        endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+        prefix += bom_raw
+    block_len = struct.unpack_from(endian + "I", prefix, 4)[0]
+    if block_len < max(12, len(prefix)):
+        return None
+    rest = _read_exact(stream, block_len - len(prefix))
+    if rest is None:
+        return None
+    return prefix + rest, endian
+
+
+def _iter_pcapng_stream(stream, head: bytes) -> Iterator[Tuple[Frame, memoryview]]:
+    """逐块读取pcapng，整块读入后按与CaptureFile相同的块内偏移解析"""
+    first_block = _read_pcapng_block(stream, head, "<")
+    if first_block is None:
+        raise UnsupportedCaptureError("文件过小，不是有效的抓包文件")
+
+    def frames():
+        interfaces = []
+        block, endian = first_block
+        pos = 0
+        number = 1
+        while True:
+            block_type, block_len = struct.unpack_from(endian + "II", block, 0)
+            if block_type == PCAPNG_SHB:
+                interfaces.clear()
+            elif block_type == PCAPNG_IDB:
+                # 流无法预先检查全部接口：第一帧之前仍然拒绝，之后出现的不支持接口上的帧由调用方跳过并计数
+                linktype = struct.unpack_from(endian + "H", block, 8)[0]
+                if linktype not in SUPPORTED_LINKTYPES and number == 1:
+                    raise UnsupportedCaptureError(f"不支持的链路类型: {linktype}")
+                interfaces.append((linktype, _pcapng_ts_unit(block, 16, block_len - 4, endian)))
+            elif block_type in (PCAPNG_EPB, PCAPNG_PB, PCAPNG_SPB):
+                if not interfaces and number == 1:
+                    raise UnsupportedCaptureError("数据包引用了未定义的接口")
+                if block_type == PCAPNG_SPB:
+                    wirelen = struct.unpack_from(endian + "I", block, 8)[0]
+                    caplen = min(wirelen, block_len - 16)
+                    linktype = interfaces[0][0] if interfaces else LINKTYPE_UNDEFINED
+                    frame = Frame(number, 0, linktype, caplen, wirelen, pos + 12, pos)
+                else:
+                    if block_type == PCAPNG_EPB:
+                        if_id, ts_high, ts_low, caplen, wirelen = struct.unpack_from(endian + "IIIII", block, 8)
+                    else:
+                        if_id, _, ts_high, ts_low, caplen, wirelen = struct.unpack_from(endian + "HHIIII", block, 8)
+                    if if_id >= len(interfaces) and number == 1:
+                        raise UnsupportedCaptureError("数据包引用了未定义的接口")
+                    if 28 + caplen > block_len:
+                        return  # 包长度超出块长度，视为文件损坏
+                    linktype, ts_unit = interfaces[if_id] if if_id < len(interfaces) else (LINKTYPE_UNDEFINED, (10, 6))
+                    frame = Frame(number, _pcapng_ts_to_ns((ts_high << 32) | ts_low, ts_unit), linktype,
+                                  caplen, wirelen, pos + 28, pos)
+                start = frame.offset - pos
+                yield frame, memoryview(block)[start:start + frame.caplen]
+                number += 1
+
+            pos += block_len
+            head = _read_exact(stream, 4)
+            next_block = _read_pcapng_block(stream, head, endian) if head else None
+            if next_block is None:
+                return
+            block, endian = next_block
+
+    return frames()
+
+
+def iter_stream_records(stream, max_packets: int = None, stats: Dict[str, Any] = None) -> Iterator[Dict[str, str]]:
+    """从顺序流（管道、仍在上传中的文件）解析TCP/UDP数据包，输出与iter_pcap_records相同的记录
+
+    文件格式或第一帧之前声明的链路类型不受支持时在产生任何记录之前抛出UnsupportedCaptureError；
+    流无法预先检查之后才声明的接口，这些接口上的帧跳过并计入stats["unsupported_frames"]，不会中途抛出异常。
+    """
+    if stats is None:
+        stats = {}
+    stats.update({"total_frames": 0, "yielded_packets": 0, "undecoded_frames": 0, "unsupported_frames": 0})
+    yield from _frame_records(iter_stream_frames(stream), stats, max_packets)
+
+
+def plan_shards(pcap_file: str, shard_count: int) -> List[Dict[str, Any]]:
+    """将抓包文件切分为可并行解析的字节范围分片；不支持的接口在遍历帧时抛出UnsupportedCaptureError"""
+    with CaptureFile(pcap_file, check_interfaces=False) as capture:
+        return capture.plan_shards(shard_count)
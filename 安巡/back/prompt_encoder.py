@@ -0,0 +1,258 @@
+"""面向token预算的紧凑提示词编码器
+
+把流量统计、检测发现和会话流编码成表头只出现一次的表格：IP地址做字典压缩，
+形态相近的流合并为一行，然后按价值从高到低填充，直到用完给定的token预算。
+"""
+import math
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 6000))
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+FLOW_HEADER = "#|协议|源|目标|目标端口|流数|包数|字节|时长s|标志|风险"
+LEGEND_PREFIX = "主机字典："
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文字符按1个token，其余字符按每3.5个字符1个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 3.5)
+
+
+def _bucket(value: float) -> int:
+    """按2的幂分桶，用于判断两条流的规模是否相近"""
+    return int(math.log2(value)) if value > 0 else -1
+
+
+def _human_bytes(value: int) -> str:
+    for unit in ("", "K", "M", "G"):
+        if value < 1024 or unit == "G":
+            return f"{value:.0f}{unit}" if unit == "" else f"{value:.1f}{unit}"
+        value /= 1024
+    return str(value)
+
+
+class _HostDictionary:
+    """IP地址字典：首次出现时分配短别名H1、H2..."""
+
+    def __init__(self):
+        self.aliases: Dict[str, str] = {}
+
+    def alias(self, ip: str, pending: Dict[str, str]) -> str:
+        if ip in self.aliases:
+            return self.aliases[ip]
+        if ip not in pending:
+            pending[ip] = f"H{len(self.aliases) + len(pending) + 1}"
+        return pending[ip]
+
+    def commit(self, pending: Dict[str, str]):
+        self.aliases.update(pending)
+
+    def copy(self) -> "_HostDictionary":
+        hosts = _HostDictionary()
+        hosts.aliases = dict(self.aliases)
+        return hosts
+
+    def legend(self) -> str:
+        return " ".join(f"{alias}={ip}" for ip, alias in self.aliases.items())
+
+    def cost(self, pending: Dict[str, str]) -> int:
+        """新别名写进主机字典所需的token数（字典第一次出现时包括前缀）"""
+        if not pending:
+            return 0
+        prefix = 0 if self.aliases else estimate_tokens(LEGEND_PREFIX)
+        return prefix + sum(estimate_tokens(f" {a}={ip}") for ip, a in pending.items())
+
+
+def group_flows(flows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """合并形态相近的流：相同协议、源IP、标志位、规模量级和风险得分的流归为一组"""
+    groups: Dict[Tuple, Dict[str, Any]] = {}
+    for flow in flows:
+        key = (flow["protocol"], flow["src_ip"], flow.get("tcp_flags", ""),
+               _bucket(flow["packets"]), _bucket(flow["bytes"]), round(flow.get("risk_score", 0.0), 1))
+        group = groups.get(key)
+        if group is None:
+            group = {
+                "protocol": flow["protocol"], "src_ip": flow["src_ip"], "tcp_flags": flow.get("tcp_flags", ""),
+                "risk_score": flow.get("risk_score", 0.0), "flows": 0, "packets": 0, "bytes": 0,
+                "duration": 0.0, "dst_ips": {}, "dst_ports": set(),
+            }
+            groups[key] = group
+        group["flows"] += 1
+        group["packets"] += flow["packets"]
+        group["bytes"] += flow["bytes"]
+        group["duration"] = max(group["duration"], flow["duration"])
+        group["dst_ips"][flow["dst_ip"]] = None
+        group["dst_ports"].add(flow["dst_port"])
+    return sorted(groups.values(), key=lambda g: (g["risk_score"], g["bytes"]), reverse=True)
+
+
+class PromptEncoder:
+    """把分析数据编码为不超过token预算的紧凑文本"""
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, max_findings: int = 20):
+        self.token_budget = token_budget
+        self.max_findings = max_findings
+
+    def _encode_statistics(self, statistics: Dict[str, Any], hosts: _HostDictionary) -> Tuple[str, Dict[str, str]]:
+        pending = {}
+        flows = statistics.get("flows", {})
+        lines = [
+            f"包数={statistics.get('packet_count', 0)} 字节={_human_bytes(statistics.get('total_bytes', 0))} "
+            f"时长={statistics.get('duration', 0):.1f}s TCP={statistics.get('tcp_packets', 0)} "
+            f"UDP={statistics.get('udp_packets', 0)} 纯SYN={statistics.get('syn_packets', 0)} "
+            f"RST={statistics.get('rst_packets', 0)} 源IP数={statistics.get('unique_src_ips', 0)} "
+            f"目标IP数={statistics.get('unique_dst_ips', 0)}",
+        ]
+        if flows:
+            lines.append(f"流数={flows.get('flow_count', 0)} 单包流={flows.get('single_packet_flows', 0)} "
+                         f"无应答TCP流={flows.get('unanswered_tcp_flows', 0)} "
+                         f"平均流时长={flows.get('mean_flow_duration', 0):.2f}s")
+        if statistics.get("top_src_ips"):
+            lines.append("源IP排行: " + " ".join(f"{hosts.alias(i['value'], pending)}({i['count']})"
+                                                 for i in statistics["top_src_ips"]))
+        if statistics.get("top_dst_ips"):
+            lines.append("目标IP排行: " + " ".join(f"{hosts.alias(i['value'], pending)}({i['count']})"
+                                                  for i in statistics["top_dst_ips"]))
+        if statistics.get("top_dst_ports"):
+            lines.append("目标端口排行: " + " ".join(f"{p['port']}({p['count']})" for p in statistics["top_dst_ports"]))
+        if statistics.get("protocol_stacks"):
+            lines.append("协议栈: " + " ".join(f"{p['value']}({p['count']})" for p in statistics["protocol_stacks"]))
+        return "\n".join(lines), pending
+
+    def _encode_group(self, index: int, group: Dict[str, Any], hosts: _HostDictionary) -> Tuple[str, Dict[str, str]]:
+        pending = {}
+        dst_ips = list(group["dst_ips"])
+        if len(dst_ips) == 1:
+            dst = hosts.alias(dst_ips[0], pending)
+        else:
+            dst = f"{len(dst_ips)}个主机"
+        ports = group["dst_ports"]
+        if len(ports) == 1:
+            port = str(next(iter(ports)))
+        else:
+            port = f"{min(ports)}-{max(ports)}({len(ports)}个)"
+        row = (f"{index}|{group['protocol']}|{hosts.alias(group['src_ip'], pending)}|{dst}|{port}|"
+               f"{group['flows']}|{group['packets']}|{_human_bytes(group['bytes'])}|{group['duration']:.1f}|"
+               f"{group['tcp_flags'] or '-'}|{group['risk_score']:.2f}")
+        return row, pending
+
+    def _fill_rows(self, groups: List[Dict[str, Any]], hosts: _HostDictionary, used: int) -> Tuple[List[str], int]:
+        """按顺序把流分组编码为表格行，直到预算用完；返回(行列表, 覆盖的流数)"""
+        rows = []
+        flows_included = 0
+        for group in groups:
+            row, pending = self._encode_group(len(rows) + 1, group, hosts)
+            cost = estimate_tokens(row + "\n") + hosts.cost(pending)
+            if used + cost > self.token_budget:
+                break
+            hosts.commit(pending)
+            rows.append(row)
+            used += cost
+            flows_included += group["flows"]
+        return rows, flows_included
+
+    def _encode_overview(self, statistics: Dict[str, Any], detection: Dict[str, Any], hosts: _HostDictionary,
+                         budget: int) -> Tuple[List[Tuple[str, List[str]]], int, int]:
+        """编码统计和检测发现两节，检测发现在budget内按顺序填充，返回(sections, 已用token数, 纳入的发现数)"""
+        used = 0
+        sections = []
+
+        if statistics:
+            text, pending = self._encode_statistics(statistics, hosts)
+            used += estimate_tokens(f"全量流量统计：\n{text}\n\n") + hosts.cost(pending)
+            hosts.commit(pending)
+            sections.append(("全量流量统计", [text]))
+
+        findings_included = 0
+        if detection and detection.get("findings"):
+            title = f"规则检测发现（基线风险等级：{detection['risk_level']}）"
+            used += estimate_tokens(f"{title}：\n\n")
+            lines = []
+            for finding in detection["findings"][:self.max_findings]:
+                line = f"- [{finding['severity']}] {finding['description']}"
+                cost = estimate_tokens(line + "\n")
+                if used + cost > budget:
+                    break
+                lines.append(line)
+                used += cost
+                findings_included += 1
+            if lines:
+                sections.append((title, lines))
+        return sections, used, findings_included
+
+    @staticmethod
+    def _render(hosts: _HostDictionary, sections: List[Tuple[str, List[str]]]) -> str:
+        parts = []
+        if hosts.aliases:
+            parts.append(f"{LEGEND_PREFIX}{hosts.legend()}")
+        for title, lines in sections:
+            parts.append(f"{title}：\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+    def encode(self, statistics: Dict[str, Any] = None, detection: Dict[str, Any] = None,
+               flows: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """按 统计 > 检测发现 > 会话流 的优先级填充预算，返回编码文本及覆盖情况"""
+        hosts = _HostDictionary()
+        sections, used, findings_included = self._encode_overview(statistics, detection, hosts, self.token_budget)
+
+        groups = group_flows(flows or [])
+        # 标题中的条数未知，按可用流数估计
+        total = len(flows or [])
+        used += estimate_tokens(f"会话流（相近的流已合并，共{total}条中的{total}条）：\n{FLOW_HEADER}\n")
+        rows, flows_included = self._fill_rows(groups, hosts, used)
+        if rows:
+            sections.append((f"会话流（相近的流已合并，共{len(flows)}条中的{flows_included}条）",
+                             [FLOW_HEADER] + rows))
+
+        text = self._render(hosts, sections)
+        return {
+            "text": text,
+            "tokens": estimate_tokens(text),
+            "token_budget": self.token_budget,
+            "findings_included": findings_included,
+            "flow_rows": len(rows),
+            "flows_included": flows_included,
+            "flows_available": len(flows or []),
+        }
+
+    def encode_chunks(self, flows: List[Dict[str, Any]], max_chunks: int = None,
+                      statistics: Dict[str, Any] = None, detection: Dict[str, Any] = None) -> Dict[str, Any]:
+        """把全部流切分为若干块，用于map-reduce分析
+
+        每块都带上同一份统计和检测发现概览，并共用概览的主机别名，整块（含概览）不超过token预算，
+        即留给流的预算为token_budget - overview_tokens。
+        返回{"chunks", "overview_tokens", "flows_dropped", "flows_remaining"}：单独一个分组就超出剩余预算时
+        跳过该分组并计入flows_dropped；达到max_chunks后未分块的流计入flows_remaining。
+        """
+        base_hosts = _HostDictionary()
+        # 概览最多占一半预算，其余留给流
+        overview, _, _ = self._encode_overview(statistics, detection, base_hosts, self.token_budget // 2)
+        overview_tokens = estimate_tokens(self._render(base_hosts, overview) + "\n\n") if overview else 0
+        title = "会话流（相近的流已合并）"
+        groups = group_flows(flows)
+        chunks = []
+        flows_dropped = 0
+        while groups and (max_chunks is None or len(chunks) < max_chunks):
+            hosts = base_hosts.copy()
+            used = overview_tokens + estimate_tokens(f"{title}：\n{FLOW_HEADER}\n")
+            rows, flows_included = self._fill_rows(groups, hosts, used)
+            if not rows:
+                flows_dropped += groups[0]["flows"]
+                groups = groups[1:]
+                continue
+            groups = groups[len(rows):]
+            text = self._render(hosts, overview + [(title, [FLOW_HEADER] + rows)])
+            chunks.append({
+                "text": text,
+                "tokens": estimate_tokens(text),
+                "flow_rows": len(rows),
+                "flows_included": flows_included,
+            })
+        if flows_dropped:
+            print(f"[WARNING] {flows_dropped} flows skipped: a single flow group exceeds the token budget")
+        return {"chunks": chunks, "overview_tokens": overview_tokens, "flows_dropped": flows_dropped,
+                "flows_remaining": sum(group["flows"] for group in groups)}
@@ -0,0 +1,314 @@
+"""固定内存的流式概要结构
+
+CountMinSketch：depth×width的计数矩阵，估计任意键的累计权重（只会高估，误差约为总权重×e/width）。
+SpaceSaving：最多跟踪capacity个键的重流量（heavy hitter）算法，计数同样只会高估，error记录上界。
+FanoutSketch：每个源一行HyperLogLog寄存器，估计其访问的不同目标主机数和目标端口数（相对误差约1.04/√m）。
+三者都可以合并，便于把多个时间桶或采集分段合成一个窗口。键的哈希使用Python内置hash，只在同一进程内一致。
+"""
+import heapq
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+DEFAULT_CMS_WIDTH = 2048
+DEFAULT_CMS_DEPTH = 4
+DEFAULT_TOPK_CAPACITY = 256
+DEFAULT_HLL_PRECISION = 8       # 每个计数器256个寄存器（256字节），标准误差约6.5%
+DEFAULT_FANOUT_SOURCES = 2048   # 每个扇出概要最多跟踪的源数量，超出时淘汰最久未更新的源
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+class CountMinSketch:
+    """Count-Min Sketch，按批量更新以便在NumPy中完成哈希和累加"""
+
+    def __init__(self, width: int = DEFAULT_CMS_WIDTH, depth: int = DEFAULT_CMS_DEPTH, seed: int = 0x5EED):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # 每行一组乘法哈希参数，乘数取奇数
+        self._mul = rng.integers(1, 2 ** 63, size=depth, dtype=np.uint64) | np.uint64(1)
+        self._add = rng.integers(0, 2 ** 63, size=depth, dtype=np.uint64)
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _indexes(self, keys: List[Any]) -> np.ndarray:
+        hashes = np.fromiter((hash(key) & _MASK64 for key in keys), dtype=np.uint64, count=len(keys))
+        with np.errstate(over="ignore"):
+            mixed = hashes[None, :] * self._mul[:, None] + self._add[:, None]
+        return ((mixed >> np.uint64(32)) % np.uint64(self.width)).astype(np.intp)
+
+    def add_many(self, keys: List[Any], weights) -> None:
+        if not len(keys):
+            return
+        weights = np.asarray(weights, dtype=np.int64)
+        indexes = self._indexes(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], indexes[row], weights)
+        self.total += int(weights.sum())
+
+    def add(self, key: Any, weight: int = 1) -> None:
+        self.add_many([key], [weight])
+
+    def estimate_many(self, keys: List[Any]) -> np.ndarray:
+        if not len(keys):
+            return np.zeros(0, dtype=np.int64)
+        indexes = self._indexes(keys)
+        return self.table[np.arange(self.depth)[:, None], indexes].min(axis=0)
+
+    def estimate(self, key: Any) -> int:
+        return int(self.estimate_many([key])[0])
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError("只能合并参数相同的Count-Min Sketch")
+        self.table += other.table
+        self.total += other.total
+
+    def clear(self) -> None:
+        self.table.fill(0)
+        self.total = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+
+class SpaceSaving:
+    """Space-Saving重流量跟踪
+
+    已满时新键替换当前计数最小的键，并继承其计数作为误差上界。最小堆与计数字典中每个键各一项，
+    计数增加时不更新堆，淘汰时才把过期的堆项修正后放回，均摊开销为O(log capacity)。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+        self.errors: Dict[Any, int] = {}
+        self._heap: List[Tuple[int, Any]] = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key: Any, weight: int = 1) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+            return
+        if len(counts) < self.capacity:
+            counts[key] = weight
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (weight, key))
+            return
+        heap = self._heap
+        while True:
+            count, victim = heap[0]
+            if counts[victim] == count:
+                break
+            heapq.heapreplace(heap, (counts[victim], victim))
+        heapq.heapreplace(heap, (count + weight, key))
+        del counts[victim]
+        del self.errors[victim]
+        counts[key] = count + weight
+        self.errors[key] = count
+
+    def add_many(self, items: Iterable[Tuple[Any, int]]) -> None:
+        for key, weight in items:
+            self.add(key, int(weight))
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """合并另一个概要：计数相加，超出容量时只保留计数最大的键"""
+        counts = dict(self.counts)
+        errors = dict(self.errors)
+        for key, count in other.counts.items():
+            counts[key] = counts.get(key, 0) + count
+            errors[key] = errors.get(key, 0) + other.errors[key]
+        if len(counts) > self.capacity:
+            kept = heapq.nlargest(self.capacity, counts.items(), key=lambda item: item[1])
+            counts = dict(kept)
+            errors = {key: errors[key] for key in counts}
+        self.counts = counts
+        self.errors = errors
+        self._heap = [(count, key) for key, count in counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n: int) -> List[Tuple[Any, int, int]]:
+        """返回计数最大的n个(键, 计数, 误差上界)"""
+        return [(key, count, self.errors[key])
+                for key, count in heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])]
+
+    def clear(self) -> None:
+        self.counts.clear()
+        self.errors.clear()
+        self._heap.clear()
+
+
+def hash64(values: np.ndarray) -> np.ndarray:
+    """splitmix64混合，把整数数组映射为均匀分布的64位哈希"""
+    with np.errstate(over="ignore"):
+        z = np.asarray(values).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """64位无符号整数的有效位数；拆成两个32位半部分，保证转为浮点数时没有舍入"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1]).astype(np.int64)
+
+
+def hll_registers(hashes: np.ndarray, precision: int):
+    """返回每个哈希落入的寄存器下标和对应的秩（剩余位的前导零个数+1）"""
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    rest = hashes << np.uint64(precision)
+    rank = np.minimum(64 - _bit_length(rest) + 1, 64 - precision + 1).astype(np.uint8)
+    return index, rank
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """按行估计基数，registers为(行数, 2^precision)的寄存器矩阵；小基数时使用线性计数修正"""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+    raw = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class FanoutSketch:
+    """按源统计不同目标主机数和目标端口数的HyperLogLog矩阵
+
+    每个源占两行寄存器（主机、端口），矩阵按需倍增到max_sources行；
+    源数量超过上限时淘汰最久未更新的源，内存上限为 max_sources × 2 × 2^precision 字节。
+    """
+
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION, max_sources: int = DEFAULT_FANOUT_SOURCES):
+        self.precision = precision
+        self.max_sources = max_sources
+        self.slots: Dict[Any, int] = {}
+        self._keys: List[Any] = []
+        self._hosts = np.zeros((0, 1 << precision), dtype=np.uint8)
+        self._ports = np.zeros((0, 1 << precision), dtype=np.uint8)
+        self._packets = np.zeros(0, dtype=np.int64)
+        self._syn = np.zeros(0, dtype=np.int64)
+        self._touched = np.zeros(0, dtype=np.int64)
+        self._tick = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _grow(self, rows: int):
+        size = min(max(rows, 2 * len(self._packets), 64), self.max_sources)
+        extra = size - len(self._packets)
+        if extra <= 0:
+            return
+        width = 1 << self.precision
+        self._hosts = np.vstack([self._hosts, np.zeros((extra, width), dtype=np.uint8)])
+        self._ports = np.vstack([self._ports, np.zeros((extra, width), dtype=np.uint8)])
+        self._packets = np.concatenate([self._packets, np.zeros(extra, dtype=np.int64)])
+        self._syn = np.concatenate([self._syn, np.zeros(extra, dtype=np.int64)])
+        self._touched = np.concatenate([self._touched, np.zeros(extra, dtype=np.int64)])
+
+    def _slots_for(self, keys: List[Any]) -> np.ndarray:
+        """为源分配寄存器行，必要时淘汰最久未更新的源"""
+        self._tick += 1
+        slots = np.empty(len(keys), dtype=np.intp)
+        new = []
+        for i, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is None:
+                new.append(i)
+            else:
+                slots[i] = slot
+        if new:
+            free = len(self._keys)
+            if free + len(new) > len(self._packets):
+                self._grow(free + len(new))
+            # 本批已有的源先标记为最新，避免被本批的新源淘汰
+            known = np.ones(len(keys), dtype=bool)
+            known[new] = False
+            self._touched[slots[known]] = self._tick
+            for i in new:
+                if len(self._keys) < len(self._packets):
+                    slot = len(self._keys)
+                    self._keys.append(keys[i])
+                else:
+                    slot = int(np.argmin(self._touched[:len(self._keys)]))
+                    del self.slots[self._keys[slot]]
+                    self._keys[slot] = keys[i]
+                    self._hosts[slot] = 0
+                    self._ports[slot] = 0
+                    self._packets[slot] = 0
+                    self._syn[slot] = 0
+                    self.evicted += 1
+                self.slots[keys[i]] = slot
+                self._touched[slot] = self._tick
+                slots[i] = slot
+        self._touched[slots] = self._tick
+        return slots
+
+    def add(self, keys: List[Any], source_index: np.ndarray, host_hashes: np.ndarray, port_hashes: np.ndarray,
+            packets: np.ndarray = None, syn: np.ndarray = None):
+        """批量更新：keys为本批的源，source_index为每个观测对应的源下标，*_hashes为目标的64位哈希"""
+        if not len(keys):
+            return
+        if len(keys) > self.max_sources:
+            # 一批的源多于上限时分段写入，保证同一批内分配的行不会互相淘汰
+            for start in range(0, len(keys), self.max_sources):
+                mask = (source_index >= start) & (source_index < start + self.max_sources)
+                self.add(keys[start:start + self.max_sources], source_index[mask] - start, host_hashes[mask],
+                         port_hashes[mask], None if packets is None else packets[start:start + self.max_sources],
+                         None if syn is None else syn[start:start + self.max_sources])
+            return
+        slots = self._slots_for(keys)
+        rows = slots[source_index]
+        index, rank = hll_registers(host_hashes, self.precision)
+        np.maximum.at(self._hosts, (rows, index), rank)
+        index, rank = hll_registers(port_hashes, self.precision)
+        np.maximum.at(self._ports, (rows, index), rank)
+        if packets is not None:
+            np.add.at(self._packets, slots, packets)
+        if syn is not None:
+            np.add.at(self._syn, slots, syn)
+
+    def merge(self, other: "FanoutSketch"):
+        if other.precision != self.precision:
+            raise ValueError("只能合并精度相同的HyperLogLog")
+        if not len(other):
+            return
+        keys = list(other.slots)
+        other_rows = np.fromiter((other.slots[key] for key in keys), dtype=np.intp, count=len(keys))
+        rows = self._slots_for(keys)
+        np.maximum.at(self._hosts, rows, other._hosts[other_rows])
+        np.maximum.at(self._ports, rows, other._ports[other_rows])
+        np.add.at(self._packets, rows, other._packets[other_rows])
+        np.add.at(self._syn, rows, other._syn[other_rows])
+
+    def estimates(self) -> Dict[str, np.ndarray]:
+        """返回各源的键和估计的不同主机数、不同端口数、包数、纯SYN包数"""
+        count = len(self._keys)
+        return {
+            "keys": list(self._keys),
+            "distinct_hosts": hll_estimate(self._hosts[:count]) if count else np.zeros(0),
+            "distinct_ports": hll_estimate(self._ports[:count]) if count else np.zeros(0),
+            "packets": self._packets[:count].copy(),
+            "syn": self._syn[:count].copy(),
+        }
+
+    def clear(self):
+        self.slots.clear()
+        self._keys.clear()
+        self._hosts.fill(0)
+        self._ports.fill(0)
+        self._packets.fill(0)
+        self._syn.fill(0)
+        self._touched.fill(0)
+        self._tick = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._hosts.nbytes + self._ports.nbytes + self._packets.nbytes * 3
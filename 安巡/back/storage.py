@@ -0,0 +1,313 @@
+"""结构化结果与实时采集数据的压缩列式存储
+
+analysis_results/和captured_traffic/中的数据包、会话流等记录表按列分块保存：每个分块的每一列
+单独序列化为紧凑JSON数组并压缩（安装了zstandard时使用zstd，否则使用zlib），文件末尾的
+页脚记录文档的其余字段、各表的列名以及每个分块每一列的偏移、长度和最小/最大值。
+读取时只解压页脚和所需的列，按行范围或列的取值范围跳过整个分块；历史记录列表只读页脚。
+
+文件布局：MAGIC | 列块... | 压缩的页脚JSON | 页脚长度(8字节) | 编码名(4字节) | MAGIC
+旧版indent=2的JSON文件可以通过同样的load_document/read_document_meta读取。
+"""
+import json
+import os
+import struct
+import zlib
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时使用zlib
+    zstandard = None
+
+MAGIC = b"AXCOL1\n"
+_TRAILER = struct.Struct("<Q4s")
+
+COLUMNAR_SUFFIX = ".cols"
+JSON_SUFFIX = ".json"
+
+# columnar为压缩列式格式；json为旧版的indent=2文本，便于人工查看
+STORAGE_FORMATS = ("columnar", "json")
+DEFAULT_STORAGE_FORMAT = os.environ.get('STORAGE_FORMAT', 'columnar')
+
+DEFAULT_CHUNK_ROWS = 4096
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+# 标量记录（如数据包样本文本）保存为单列表，读取时还原为标量列表
+VALUE_COLUMN = "value"
+
+
+class StorageError(ValueError):
+    """文件不是有效的列式文件，或缺少读取所需的压缩库"""
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise StorageError("该文件使用zstd压缩，需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise StorageError(f"未知的压缩编码: {codec}")
+
+
+def _column_stats(values: List[Any]) -> Dict[str, Any]:
+    """同一类型（数值或字符串）的非空值记录最小/最大值，供按取值范围跳过分块"""
+    present = [v for v in values if v is not None]
+    if not present:
+        return {"nulls": len(values)}
+    stats = {}
+    if all(isinstance(v, str) for v in present) or \
+            all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        stats["min"] = min(present)
+        stats["max"] = max(present)
+    if len(present) < len(values):
+        stats["nulls"] = len(values) - len(present)
+    return stats
+
+
+def _in_range(value: Any, low: Any, high: Any) -> bool:
+    if value is None:
+        return False
+    try:
+        return (low is None or value >= low) and (high is None or value <= high)
+    except TypeError:  # 类型不可比较（如字符串与数字）
+        return False
+
+
+def _chunk_may_match(chunk: Dict[str, Any], filters: Dict[str, Tuple[Any, Any]]) -> bool:
+    for column, (low, high) in filters.items():
+        stats = chunk["columns"].get(column)
+        if stats is None:
+            return False  # 分块中没有这一列，全部为空值
+        if "min" not in stats:
+            if stats.get("nulls", 0) >= chunk["rows"]:
+                return False
+            continue
+        try:
+            if (low is not None and stats["max"] < low) or (high is not None and stats["min"] > high):
+                return False
+        except TypeError:
+            continue
+    return True
+
+
+def _iter_chunks(rows: Iterable[Any], chunk_rows: int) -> Iterator[List[Any]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_columnar(path: str, tables: Dict[str, Iterable[Any]], meta: Dict[str, Any] = None,
+                   chunk_rows: int = DEFAULT_CHUNK_ROWS, codec: str = None) -> Dict[str, Any]:
+    """把若干记录表和文档元数据写成一个列式文件（先写临时文件再替换），返回页脚
+
+    记录表的元素为字典（按键拆列，缺失的键为空值）或标量；表可以是迭代器，按分块边读边写。
+    """
+    codec = codec or default_codec()
+    footer = {"version": 1, "codec": codec, "meta": meta or {}, "tables": {}}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for name, rows in tables.items():
+            table = {"kind": "values", "rows": 0, "columns": [], "chunks": []}
+            for chunk in _iter_chunks(rows, chunk_rows):
+                if isinstance(chunk[0], dict):
+                    table["kind"] = "records"
+                    columns = {}
+                    for record in chunk:
+                        for key in record:
+                            columns.setdefault(key, None)
+                    column_values = {key: [record.get(key) for record in chunk] for key in columns}
+                else:
+                    column_values = {VALUE_COLUMN: chunk}
+                entry = {"start": table["rows"], "rows": len(chunk), "columns": {}}
+                for key, values in column_values.items():
+                    data = _compress(json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+                                     .encode("utf-8"), codec)
+                    entry["columns"][key] = {"offset": f.tell(), "length": len(data), **_column_stats(values)}
+                    f.write(data)
+                    if key not in table["columns"]:
+                        table["columns"].append(key)
+                table["chunks"].append(entry)
+                table["rows"] += len(chunk)
+            footer["tables"][name] = table
+        data = _compress(json.dumps(footer, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), codec)
+        f.write(data)
+        f.write(_TRAILER.pack(len(data), codec.encode("ascii").ljust(4)))
+        f.write(MAGIC)
+    os.replace(tmp_path, path)
+    return footer
+
+
+class ColumnarFile:
+    """列式文件读取器：打开时只读取页脚"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise StorageError(f"不是列式存储文件: {path}")
+            f.seek(-(_TRAILER.size + len(MAGIC)), os.SEEK_END)
+            footer_length, codec = _TRAILER.unpack(f.read(_TRAILER.size))
+            if f.read(len(MAGIC)) != MAGIC:
+                raise StorageError(f"列式存储文件不完整: {path}")
+            self.codec = codec.decode("ascii").strip()
+            f.seek(-(_TRAILER.size + len(MAGIC) + footer_length), os.SEEK_END)
+            self.footer = json.loads(_decompress(f.read(footer_length), self.codec))
+        self.meta: Dict[str, Any] = self.footer["meta"]
+        self.tables: Dict[str, Dict[str, Any]] = self.footer["tables"]
+
+    def num_rows(self, table: str) -> int:
+        return self.tables[table]["rows"] if table in self.tables else 0
+
+    def columns(self, table: str) -> List[str]:
+        return list(self.tables[table]["columns"]) if table in self.tables else []
+
+    def iter_rows(self, table: str, columns: List[str] = None, filters: Dict[str, Tuple[Any, Any]] = None,
+                  start: int = 0, stop: int = None) -> Iterator[Any]:
+        """按行号范围[start, stop)读取，只解压需要的列
+
+        columns为投影的列名（None为全部列）；filters为{列名: (下限, 上限)}的闭区间条件（None表示不限），
+        根据分块的最小/最大值跳过不可能匹配的分块，再逐行过滤。行号范围在过滤之前计算。
+        """
+        if table not in self.tables:
+            return
+        info = self.tables[table]
+        filters = filters or {}
+        scalar = info["kind"] == "values"
+        wanted = [VALUE_COLUMN] if scalar else list(columns or info["columns"])
+        needed = list(dict.fromkeys(wanted + list(filters)))
+        with open(self.path, "rb") as f:
+            for chunk in info["chunks"]:
+                chunk_start, chunk_rows = chunk["start"], chunk["rows"]
+                if chunk_start + chunk_rows <= start:
+                    continue
+                if stop is not None and chunk_start >= stop:
+                    break
+                if filters and not _chunk_may_match(chunk, filters):
+                    continue
+                values = {}
+                for column in needed:
+                    location = chunk["columns"].get(column)
+                    if location is None:
+                        values[column] = [None] * chunk_rows
+                        continue
+                    f.seek(location["offset"])
+                    values[column] = json.loads(_decompress(f.read(location["length"]), self.codec))
+                first = max(start - chunk_start, 0)
+                last = chunk_rows if stop is None else min(stop - chunk_start, chunk_rows)
+                for i in range(first, last):
+                    if filters and not all(_in_range(values[c][i], low, high) for c, (low, high) in filters.items()):
+                        continue
+                    if scalar:
+                        yield values[VALUE_COLUMN][i]
+                    else:
+                        yield {column: values[column][i] for column in wanted}
+
+    def read(self, table: str, columns: List[str] = None, filters: Dict[str, Tuple[Any, Any]] = None,
+             start: int = 0, stop: int = None) -> List[Any]:
+        return list(self.iter_rows(table, columns, filters, start, stop))
+
+
+def is_document(filename: str) -> bool:
+    return filename.endswith(COLUMNAR_SUFFIX) or filename.endswith(JSON_SUFFIX)
+
+
+def save_document(path_base: str, document: Dict[str, Any], table_fields: Iterable[str],
+                  storage_format: str = None) -> str:
+    """保存文档，table_fields中的字段（记录列表）按列存储，其余字段进入页脚；返回实际文件路径"""
+    storage_format = storage_format or DEFAULT_STORAGE_FORMAT
+    if storage_format == "json":
+        path = path_base + JSON_SUFFIX
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+        return path
+    table_fields = [field for field in table_fields if field in document]
+    meta = {key: value for key, value in document.items() if key not in table_fields}
+    path = path_base + COLUMNAR_SUFFIX
+    write_columnar(path, {field: document[field] for field in table_fields}, meta)
+    return path
+
+
+def _load_json(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # 旧版实时采集文件直接是数据包列表
+    return {"packets": data} if isinstance(data, list) else data
+
+
+def _project(rows: List[Any], columns: Optional[List[str]]) -> List[Any]:
+    if not columns:
+        return rows
+    return [{c: row.get(c) for c in columns} if isinstance(row, dict) else row for row in rows]
+
+
+def load_document(path: str, tables: List[str] = None, columns: Dict[str, List[str]] = None) -> Dict[str, Any]:
+    """读取完整文档（列式或旧版JSON），tables限定读取的记录表，columns为{表名: 列名列表}的投影"""
+    columns = columns or {}
+    if not path.endswith(COLUMNAR_SUFFIX):
+        document = _load_json(path)
+        for name in list(document):
+            if isinstance(document[name], list):
+                if tables is not None and name not in tables:
+                    del document[name]
+                else:
+                    document[name] = _project(document[name], columns.get(name))
+        return document
+    reader = ColumnarFile(path)
+    document = dict(reader.meta)
+    for name in reader.tables:
+        if tables is None or name in tables:
+            document[name] = reader.read(name, columns.get(name))
+    return document
+
+
+def read_document_meta(path: str) -> Dict[str, Any]:
+    """文档中除记录表以外的字段，附带各记录表的行数（"tables": {表名: 行数}）
+
+    列式文件只读取页脚；旧版JSON文件需要完整解析。
+    """
+    if path.endswith(COLUMNAR_SUFFIX):
+        reader = ColumnarFile(path)
+        return {**reader.meta, "tables": {name: info["rows"] for name, info in reader.tables.items()}}
+    document = _load_json(path)
+    tables = {name: len(value) for name, value in document.items() if isinstance(value, list)}
+    return {**{k: v for k, v in document.items() if k not in tables}, "tables": tables}
+
+
+def read_document_table(path: str, table: str, columns: List[str] = None,
+                        filters: Dict[str, Tuple[Any, Any]] = None, offset: int = 0,
+                        limit: int = None) -> Dict[str, Any]:
+    """分页读取文档中的一个记录表，返回{"total", "rows"}；filters给定时total为None（需要扫描全部分块）"""
+    stop = None if limit is None else offset + limit
+    if path.endswith(COLUMNAR_SUFFIX):
+        reader = ColumnarFile(path)
+        if filters:
+            # 行号范围在过滤之后计算，读够一页即停止解压后续分块
+            return {"total": None, "rows": list(islice(reader.iter_rows(table, columns, filters), offset, stop))}
+        return {"total": reader.num_rows(table), "rows": reader.read(table, columns, start=offset, stop=stop)}
+    rows = _load_json(path).get(table) or []
+    if filters:
+        rows = [row for row in rows if isinstance(row, dict)
+                and all(_in_range(row.get(c), low, high) for c, (low, high) in filters.items())]
+        total = None
+    else:
+        total = len(rows)
+    return {"total": total, "rows": _project(rows[offset:stop], columns)}
@@ -0,0 +1,257 @@
+"""滑动窗口流量指标
+
+采集路径（环形缓冲分段、实时数据包流）把数据包表送进StreamMetrics，按数据包时间戳落入固定长度的时间桶。
+每个窗口（1s/1m/5m）由若干个桶组成环，每个桶记录包数、字节数，并按源IP、目标端口、五元组流
+各维护一个Count-Min Sketch和一个Space-Saving重流量概要（按字节加权）；1m/5m窗口的桶还带有
+按源的HyperLogLog扇出概要，用于标记访问大量不同主机或端口的扫描源。
+查询时合并窗口内已结束的桶，内存占用和查询耗时都与流量规模无关。
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from detectors import fanout_findings
+from packet_table import PacketTable, IPPROTO_TCP, TCP_ACK, TCP_SYN
+from sketches import (CountMinSketch, SpaceSaving, FanoutSketch, hash64, DEFAULT_CMS_DEPTH, DEFAULT_CMS_WIDTH,
+                      DEFAULT_TOPK_CAPACITY)
+
+# 窗口名 -> (窗口秒数, 桶数)；查询结果覆盖截至最近一个已结束桶的完整窗口
+METRIC_WINDOWS = {
+    "1s": (1, 1),
+    "1m": (60, 6),
+    "5m": (300, 5),
+}
+
+# 维护扇出概要的窗口（1秒内的扇出没有意义）
+FANOUT_WINDOWS = ("1m", "5m")
+
+METRIC_DIMENSIONS = ("src_ip", "dst_port", "flow")
+
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+_PROTO_NAMES = {6: "TCP", 17: "UDP"}
+
+
+class _Bucket:
+    """一个时间桶内的计数和概要"""
+
+    def __init__(self, width: int, depth: int, capacity: int, fanout: bool):
+        self.index = None
+        self.packets = 0
+        self.bytes = 0
+        self.sketches = {dim: CountMinSketch(width, depth) for dim in METRIC_DIMENSIONS}
+        self.heavy = {dim: SpaceSaving(capacity) for dim in METRIC_DIMENSIONS}
+        self.fanout = FanoutSketch() if fanout else None
+
+    def reset(self, index: int):
+        self.index = index
+        self.packets = 0
+        self.bytes = 0
+        for dim in METRIC_DIMENSIONS:
+            self.sketches[dim].clear()
+            self.heavy[dim].clear()
+        if self.fanout is not None:
+            self.fanout.clear()
+
+
+class SlidingWindow:
+    """由buckets+1个桶组成的环：buckets个已结束的桶加上当前正在写入的桶"""
+
+    def __init__(self, name: str, seconds: int, buckets: int, width: int = DEFAULT_CMS_WIDTH,
+                 depth: int = DEFAULT_CMS_DEPTH, capacity: int = DEFAULT_TOPK_CAPACITY, fanout: bool = False):
+        self.name = name
+        self.seconds = seconds
+        self.buckets = buckets
+        self.bucket_seconds = seconds // buckets
+        self.ring = [_Bucket(width, depth, capacity, fanout) for _ in range(buckets + 1)]
+        self.latest = None
+        self.late_packets = 0
+
+    def _bucket(self, index: int) -> Optional[_Bucket]:
+        if self.latest is not None and index <= self.latest - len(self.ring):
+            return None  # 已滑出窗口的迟到数据
+        bucket = self.ring[index % len(self.ring)]
+        if bucket.index != index:
+            bucket.reset(index)
+        if self.latest is None or index > self.latest:
+            self.latest = index
+        return bucket
+
+    def add(self, second: int, packets: int, nbytes: int, groups: Dict[str, tuple], fanout: tuple = None):
+        """写入一秒内的聚合结果，groups为{维度: (键列表, 字节数数组)}，fanout为FanoutSketch.add的参数"""
+        bucket = self._bucket(second // self.bucket_seconds)
+        if bucket is None:
+            self.late_packets += packets
+            return
+        bucket.packets += packets
+        bucket.bytes += nbytes
+        for dim, (keys, weights) in groups.items():
+            bucket.sketches[dim].add_many(keys, weights)
+            bucket.heavy[dim].add_many(zip(keys, weights.tolist()))
+        if bucket.fanout is not None and fanout is not None:
+            bucket.fanout.add(*fanout)
+
+    def _complete(self) -> List[_Bucket]:
+        return [b for b in self.ring if b.index is not None and self.latest - self.buckets <= b.index < self.latest]
+
+    def fanout(self) -> Optional[FanoutSketch]:
+        """合并窗口内已结束桶的扇出概要；临时概要容量足以容纳全部桶的源，合并时不淘汰"""
+        if self.latest is None or self.ring[0].fanout is None:
+            return None
+        complete = self._complete()
+        merged = FanoutSketch(self.ring[0].fanout.precision,
+                              max(sum(len(b.fanout) for b in complete), 1))
+        for bucket in complete:
+            merged.merge(bucket.fanout)
+        return merged
+
+    def query(self, top: int) -> Dict[str, Any]:
+        if self.latest is None:
+            return {"window": self.name, "seconds": self.seconds, "as_of": None, "packets": 0, "bytes": 0,
+                    "pps": 0.0, "bps": 0.0, **{f"top_{dim}": [] for dim in METRIC_DIMENSIONS}}
+        complete = self._complete()
+        packets = sum(b.packets for b in complete)
+        nbytes = sum(b.bytes for b in complete)
+        result = {
+            "window": self.name,
+            "seconds": self.seconds,
+            "as_of": float(self.latest * self.bucket_seconds),
+            "packets": packets,
+            "bytes": nbytes,
+            "pps": round(packets / self.seconds, 2),
+            "bps": round(nbytes * 8 / self.seconds, 2),
+        }
+        for dim in METRIC_DIMENSIONS:
+            heavy = SpaceSaving(self.ring[0].heavy[dim].capacity)
+            sketch = CountMinSketch(self.ring[0].sketches[dim].width, self.ring[0].sketches[dim].depth)
+            for bucket in complete:
+                heavy.merge(bucket.heavy[dim])
+                sketch.merge(bucket.sketches[dim])
+            candidates = heavy.top(top)
+            # 两种概要都只会高估，取较小者作为估计值
+            estimates = sketch.estimate_many([key for key, _, _ in candidates])
+            rows = []
+            for (key, count, error), estimate in zip(candidates, estimates.tolist()):
+                value = min(count, estimate)
+                rows.append({"key": key, "bytes": value, "bps": round(value * 8 / self.seconds, 2),
+                             "share": round(value / nbytes, 4) if nbytes else 0.0,
+                             "max_error": min(error, value)})
+            rows.sort(key=lambda row: row["bytes"], reverse=True)
+            result[f"top_{dim}"] = rows
+
+        fanout = self.fanout()
+        if fanout is not None:
+            estimates = fanout.estimates()
+            order = np.argsort(estimates["distinct_hosts"])[::-1][:top]
+            result["top_fanout"] = [{"ip": estimates["keys"][i],
+                                     "distinct_hosts": int(round(estimates["distinct_hosts"][i])),
+                                     "distinct_ports": int(round(estimates["distinct_ports"][i])),
+                                     "packets": int(estimates["packets"][i])} for i in order.tolist()]
+            result["scanners"] = fanout_findings(estimates, self.name)[:top]
+        return result
+
+
+def _group_bytes(keys: np.ndarray, weights: np.ndarray):
+    """对一组整数键（一维或多列）求唯一值和对应的字节数之和"""
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return unique, np.bincount(inverse.reshape(-1), weights=weights, minlength=len(unique)).astype(np.int64)
+
+
+class StreamMetrics:
+    """单个接口的多窗口流量指标"""
+
+    def __init__(self, interface: str):
+        self.interface = interface
+        self.windows = {name: SlidingWindow(name, seconds, buckets, fanout=name in FANOUT_WINDOWS)
+                        for name, (seconds, buckets) in METRIC_WINDOWS.items()}
+        self.total_packets = 0
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def add_table(self, table: PacketTable):
+        """按秒分组后写入各窗口；IP和端口在组内先聚合，概要只处理去重后的键"""
+        if not len(table):
+            return
+        seconds = np.floor(table["time_epoch"]).astype(np.int64)
+        frame_len = table["frame_len"].astype(np.int64)
+        src_dict = table.dictionaries["src_ip"]
+        dst_dict = table.dictionaries["dst_ip"]
+        # 扇出概要的目标哈希：主机按字典值哈希一次，端口连同协议号一起哈希
+        host_hashes = hash64(np.fromiter((hash(v) for v in dst_dict), dtype=np.int64, count=len(dst_dict))
+                             .view(np.uint64))[table["dst_ip"]]
+        port_hashes = hash64(table["dst_port"].astype(np.uint64) | table["ip_proto"].astype(np.uint64) << np.uint64(16))
+        is_syn = ((table["ip_proto"] == IPPROTO_TCP) & ((table["tcp_flags"] & (TCP_SYN | TCP_ACK)) == TCP_SYN))
+        order = np.argsort(seconds, kind="stable")
+        boundaries = np.flatnonzero(np.diff(seconds[order])) + 1
+        per_second = []
+        for rows in np.split(order, boundaries):
+            weights = frame_len[rows]
+            src_codes, src_bytes = _group_bytes(table["src_ip"][rows], weights)
+            ports, port_bytes = _group_bytes(table["dst_port"][rows], weights)
+            flow_cols = np.stack([table["src_ip"][rows].astype(np.int64), table["dst_ip"][rows].astype(np.int64),
+                                  table["ip_proto"][rows].astype(np.int64), table["src_port"][rows].astype(np.int64),
+                                  table["dst_port"][rows].astype(np.int64)], axis=1)
+            flows, flow_bytes = _group_bytes(flow_cols, weights)
+            flow_keys = [f"{src_dict[s]}:{sp} > {dst_dict[d]}:{dp} {_PROTO_NAMES.get(p, p)}"
+                         for s, d, p, sp, dp in flows.tolist()]
+            src_keys = [src_dict[code] for code in src_codes.tolist()]
+            groups = {
+                "src_ip": (src_keys, src_bytes),
+                "dst_port": (ports.tolist(), port_bytes),
+                "flow": (flow_keys, flow_bytes),
+            }
+            source_index = np.searchsorted(src_codes, table["src_ip"][rows])
+            fanout = (src_keys, source_index, host_hashes[rows], port_hashes[rows],
+                      np.bincount(source_index, minlength=len(src_keys)),
+                      np.bincount(source_index, weights=is_syn[rows], minlength=len(src_keys)).astype(np.int64))
+            per_second.append((int(seconds[rows[0]]), len(rows), int(weights.sum()), groups, fanout))
+
+        with self._lock:
+            for second, packets, nbytes, groups, fanout in per_second:
+                for window in self.windows.values():
+                    window.add(second, packets, nbytes, groups, fanout)
+            self.total_packets += len(table)
+            self.updated_at = time.time()
+
+    def add_records(self, records: List[Dict[str, str]]):
+        """tshark/内置读取器格式的记录先建成数据包表再写入"""
+        if records:
+            self.add_table(PacketTable.from_records(records))
+
+    def scanners(self, window: str = "5m") -> List[Dict[str, Any]]:
+        """窗口内扇出超过阈值的扫描源（检测发现格式）"""
+        with self._lock:
+            fanout = self.windows[window].fanout()
+        return fanout_findings(fanout.estimates(), window) if fanout is not None else []
+
+    def snapshot(self, windows: List[str] = None, top: int = DEFAULT_TOP) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "interface": self.interface,
+                "total_packets": self.total_packets,
+                "updated_at": self.updated_at,
+                "late_packets": {name: w.late_packets for name, w in self.windows.items()},
+                "windows": {name: self.windows[name].query(top) for name in (windows or self.windows)},
+            }
+
+
+class MetricsRegistry:
+    """按接口管理StreamMetrics"""
+
+    def __init__(self):
+        self.metrics: Dict[str, StreamMetrics] = {}
+        self._lock = threading.Lock()
+
+    def get(self, interface: str, create: bool = True) -> Optional[StreamMetrics]:
+        with self._lock:
+            metrics = self.metrics.get(interface)
+            if metrics is None and create:
+                metrics = self.metrics[interface] = StreamMetrics(interface)
+            return metrics
+
+    def interfaces(self) -> List[str]:
+        with self._lock:
+            return list(self.metrics)
@@ -1,122 +1,675 @@
 import os
 import subprocess
 import json
+import codecs
 import time
 from datetime import datetime
-import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import tempfile
+import shutil
+import uuid
 import pyshark
 import threading
+import heapq
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pcap_reader import iter_pcap_records, iter_stream_records, plan_shards, UnsupportedCaptureError
+from packet_table import PacketTable, PacketTableBuilder
+from flow_table import FlowTable
+from analysis_cache import AnalysisCache, file_sha256, make_cache_key
+from detectors import RISK_LEVELS, merge_findings, risk_rank, run_detectors, select_flows
+from frame_index import CaptureStore
+from capture_filters import capture_args, prefilter_capture
+from storage import save_document
+from prompt_encoder import PromptEncoder, DEFAULT_TOKEN_BUDGET
+from job_manager import JobCancelled
+from ollama_client import OllamaClient, ModelCallError
+
+# 默认提取的tshark字段
+TSHARK_FIELDS = [
+    "frame.encap_type", "frame.time", "frame.offset_shift", "frame.time_epoch", 
+    "frame.time_delta", "frame.time_relative", "frame.number", "frame.len", 
+    "frame.marked", "frame.protocols", "eth.dst", "eth.dst_resolved", "eth.src", 
+    "eth.src_resolved", "eth.type", "ip.version", "ip.hdr_len", "ip.dsfield", 
+    "ip.dsfield.dscp", "ip.len", "ip.id", "ip.flags", "ip.flags.rb", "ip.flags.df", 
+    "ip.flags.mf", "ip.frag_offset", "ip.ttl", "ip.proto", "ip.checksum", 
+    "ip.checksum.status", "ip.src", "ip.dst", "tcp.srcport", "tcp.dstport", 
+    "tcp.stream", "tcp.len", "tcp.seq", "tcp.nxtseq", "tcp.ack", "tcp.hdr_len", 
+    "tcp.flags", "tcp.flags.res", "tcp.flags.cwr", "tcp.flags.urg", "tcp.flags.ack", 
+    "tcp.flags.push", "tcp.flags.reset", "tcp.flags.syn", "tcp.flags.fin", 
+    "tcp.flags.str", "tcp.window_size", "tcp.window_size_scalefactor", 
+    "tcp.checksum", "tcp.checksum.status", "tcp.urgent_pointer", "tcp.time_relative", 
+    "tcp.time_delta", "tcp.analysis.bytes_in_flight", "tcp.analysis.push_bytes_sent", 
+    "tcp.segment", "tcp.segment.count", "tcp.reassembled.length", "tcp.payload", 
+    "udp.srcport", "udp.dstport", "udp.length", "udp.checksum", "udp.checksum.status", 
+    "udp.stream", "data.len"
+]
+
+# 构建列式数据包表所需的最小字段集
+FIVE_TUPLE_FIELDS = [
+    "frame.number", "frame.time_epoch", "frame.len", "frame.protocols",
+    "ip.src", "ip.dst", "ip.proto", "ip.ttl", "ipv6.src", "ipv6.dst", "ipv6.nxt", "ipv6.hlim",
+    "tcp.srcport", "tcp.dstport", "tcp.len", "tcp.flags", "udp.srcport", "udp.dstport", "udp.length",
+]
+
+# 字段配置：提取的字段以及附加的tshark参数（-n关闭名称解析，-o/--disable-protocol关闭昂贵的解析器）
+FIELD_PROFILES = {
+    "full": {
+        "description": "完整字段（兼容旧版本）",
+        "fields": TSHARK_FIELDS,
+        "options": [],
+    },
+    "five_tuple": {
+        "description": "仅五元组与基础头部，关闭名称解析、TCP序列号分析和流重组",
+        "fields": FIVE_TUPLE_FIELDS,
+        "options": [
+            "-n",
+            "-o", "tcp.analyze_sequence_numbers:FALSE",
+            "-o", "tcp.calculate_timestamps:FALSE",
+            "-o", "tcp.desegment_tcp_streams:FALSE",
+            "-o", "ip.defragment:FALSE",
+            "--disable-protocol", "http",
+            "--disable-protocol", "tls",
+            "--disable-protocol", "quic",
+        ],
+    },
+    "tcp_health": {
+        "description": "五元组加TCP重传、零窗口、RTT等健康指标，保留序列号分析",
+        "fields": FIVE_TUPLE_FIELDS + [
+            "tcp.stream", "tcp.seq", "tcp.ack", "tcp.window_size", "tcp.time_delta",
+            "tcp.analysis.retransmission", "tcp.analysis.fast_retransmission",
+            "tcp.analysis.duplicate_ack", "tcp.analysis.lost_segment",
+            "tcp.analysis.zero_window", "tcp.analysis.ack_rtt", "tcp.analysis.bytes_in_flight",
+        ],
+        "options": [
+            "-n",
+            "-o", "tcp.desegment_tcp_streams:FALSE",
+            "--disable-protocol", "http",
+            "--disable-protocol", "tls",
+            "--disable-protocol", "quic",
+        ],
+    },
+    "payload": {
+        "description": "五元组加载荷和常见应用层字段，保留流重组",
+        "fields": FIVE_TUPLE_FIELDS + [
+            "tcp.stream", "tcp.payload", "udp.payload", "data.len",
+            "http.host", "http.request.method", "http.request.uri", "http.user_agent",
+            "dns.qry.name", "tls.handshake.extensions_server_name",
+        ],
+        "options": ["-n"],
+    },
+}
+
+# 流式读取策略：stop=达到上限后终止tshark，drain=继续消费输出以统计总包数
+STREAM_POLICIES = ("stop", "drain")
+
+# 可选的数据包解析器：tshark=调用tshark完整解析，native=内置pcap/pcapng读取器（仅解码IP/TCP/UDP头部）
+# native输出固定的字段集，不受字段配置（profile）影响：与tshark同名，但不包含pcap_reader.NATIVE_OMITTED_FIELDS
+# 中依赖跨包分析的字段，序列号以tcp.seq_raw/tcp.ack_raw给出
+PACKET_PARSERS = ("tshark", "native")
+
+# 单个数据包文本中payload保留的最大长度
+MAX_PAYLOAD_CHARS = 200
+
+# 保留原始文本形式的样本数据包数量，避免撑爆模型上下文
+SAMPLE_PACKETS = 100
+
+# 交给提示词编码器的候选流数量，实际写入多少由token预算决定
+MAX_PROMPT_FLOWS = 20000
+
+# 提示词中包含的检测发现数量
+MAX_PROMPT_FINDINGS = 20
+
+# 结构化结果中保存的流摘要数量
+MAX_SAVED_FLOWS = 1000
+
+# AI分析模式：single=单次调用，mapreduce=按token预算分块并发调用后合并
+ANALYSIS_MODES = ("single", "mapreduce")
+
+# map-reduce模式下的候选流数量、最多分块数和默认并发数（受Ollama OLLAMA_NUM_PARALLEL限制）
+MAX_MAPREDUCE_FLOWS = 200000
+MAX_MAP_CHUNKS = 32
+DEFAULT_MAP_WORKERS = 2
+
+# 解析过程中每处理多少个数据包上报一次进度
+PROGRESS_INTERVAL_PACKETS = 10000
+
+# 分片解析时每个分片的最小字节数，小文件不值得启动进程池
+MIN_SHARD_BYTES = 16 * 1024 * 1024
+
+# 流式解析（边上传边解析）时每攒够多少个数据包就转成列式表并累加进流表
+STREAM_BATCH_PACKETS = 50000
+
+# 向tshark标准输入写数据的块大小
+STDIN_BLOCK_SIZE = 1024 * 1024
+
+# 保留已分析抓包文件（用于按流/时间窗口下钻）的总大小上限，0表示不保留
+MAX_RETAINED_CAPTURE_BYTES = int(os.environ.get('MAX_RETAINED_CAPTURE_BYTES', 20 * 1024 ** 3))
+
+# 增量解码tshark -T json输出时每次读取的字节数
+JSON_READ_BLOCK_SIZE = 64 * 1024
+
+# 实时采集结果只用到这些协议层，-j让tshark只输出它们
+JSON_CAPTURE_LAYERS = "frame ip ipv6 tcp udp"
+
+
+def parse_tshark_line(line: str, fields: List[str]) -> Optional[Dict[str, str]]:
+    """将tshark -T fields输出的一行解析为字段字典（只保留非空字段）"""
+    values = line.rstrip("\r\n").split("\t")
+    if not values or values == ['']:
+        return None
+
+    record = {}
+    for field, value in zip(fields, values):
+        if value == "":
+            continue
+        if field == "tcp.flags.str":
+            value = value.encode("unicode_escape").decode("unicode_escape")
+        record[field] = value
+    return record
+
+
+def iter_json_array(stream, block_size: int = JSON_READ_BLOCK_SIZE) -> Iterator[Any]:
+    """从字节流中逐个解码顶层JSON数组的元素
+
+    每次只缓冲尚未解码的文本，元素解码后立即从缓冲区丢弃，
+    内存占用取决于单个元素的大小而不是整个输出的大小。
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        block = stream.read(block_size)
+        if not block:
+            eof = True
+            buf = buf[pos:] + text_decoder.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + text_decoder.decode(block)
+        pos = 0
+        return True
+
+    while True:
+        # 跳过空白和元素之间的逗号
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or not fill():
+                break
+        if pos >= len(buf):
+            if started:
+                raise ValueError("JSON数组在结束符之前被截断")
+            return
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("输出不是JSON数组")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # 元素尚未完整到达，读入更多数据后重试
+            if not fill():
+                raise
+            continue
+        if isinstance(item, (int, float)) and not eof and (end >= len(buf) or buf[end] not in " \t\r\n,]"):
+            # 数字后面没有分隔符时可能被块边界截断（如"123"后面还有"45"、"1.5"后面还有"e10"），读入更多数据后重新解码
+            fill()
+            continue
+        pos = end
+        yield item
+
+
+def json_packet_summary(packet: Dict[str, Any]) -> Dict[str, Any]:
+    """从tshark -T json的单个数据包中只取出实时采集结果需要的字段"""
+    layers = packet.get('_source', {}).get('layers', {})
+    frame = layers.get('frame', {})
+    ip = layers.get('ip') or layers.get('ipv6') or {}
+    tcp = layers.get('tcp', {})
+    udp = layers.get('udp', {})
+    return {
+        'timestamp': frame.get('frame.time', 'N/A'),
+        'protocol': frame.get('frame.protocols', 'N/A'),
+        'length': frame.get('frame.len', 'N/A'),
+        'src_ip': ip.get('ip.src') or ip.get('ipv6.src', 'N/A'),
+        'dst_ip': ip.get('ip.dst') or ip.get('ipv6.dst', 'N/A'),
+        'src_port': tcp.get('tcp.srcport') or udp.get('udp.srcport', 'N/A'),
+        'dst_port': tcp.get('tcp.dstport') or udp.get('udp.dstport', 'N/A')
+    }
+
+
+def format_packet_record(record: Dict[str, str]) -> str:
+    """将数据包记录格式化为"字段: 值"文本，供模型提示词使用"""
+    parts = []
+    for field, value in record.items():
+        if field == "tcp.payload":
+            value = value[:MAX_PAYLOAD_CHARS]  # 限制payload长度
+        parts.append(field + ": " + value)
+    return ", ".join(parts)
+
+
+def _parse_shard(pcap_file: str, shard: Dict[str, Any], sample_size: int) -> Dict[str, Any]:
+    """在子进程中解析一个分片（模块级函数，便于进程池序列化）"""
+    start_time = time.time()
+    start_cpu = time.process_time()
+    builder = PacketTableBuilder()
+    samples = []
+    stats = {}
+
+    for record in iter_pcap_records(pcap_file, stats=stats, shard=shard):
+        builder.append(record)
+        if len(samples) < sample_size:
+            samples.append((float(record["frame.time_epoch"]), int(record["frame.number"]),
+                            format_packet_record(record)))
+
+    return {
+        "table": builder.build(),
+        "samples": samples,
+        "timing": {
+            "shard": shard["index"],
+            "start_offset": shard["start"],
+            "end_offset": shard["end"],
+            "frames": stats["total_frames"],
+            "packets": stats["yielded_packets"],
+            "seconds": round(time.time() - start_time, 3),
+            "cpu_seconds": round(time.process_time() - start_cpu, 3),
+        },
+    }
+
+
+def new_result_id() -> str:
+    """生成不会冲突的结果ID：微秒级时间戳（便于排序）加随机后缀（避免并发请求撞名）"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}"
+
+
+def _merge_unique(items: List[Any]) -> List[Any]:
+    """按出现顺序去重，威胁条目可能是字符串也可能是字典"""
+    seen = set()
+    merged = []
+    for item in items:
+        key = item if isinstance(item, str) else json.dumps(item, ensure_ascii=False, sort_keys=True)
+        key = key.strip()
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(item)
+    return merged
+
 
 class TrafficAnalyzer:
     """网络流量分析器"""
     
-    def __init__(self, data_dir='data', model='qwen3:8b'):
+    def __init__(self, data_dir='data', model=None, prompt_token_budget=DEFAULT_TOKEN_BUDGET, ollama=None):
         self.data_dir = data_dir
-        self.model = model
+        # 未传入共享客户端时自建一个；未指定模型时使用客户端配置的默认模型
+        self.ollama = ollama or OllamaClient()
+        self.model = model or self.ollama.model
         self.ensure_data_dir()
+        self.cache = AnalysisCache(os.path.join(data_dir, 'cache'))
+        self.captures = CaptureStore(os.path.join(data_dir, 'captures'), MAX_RETAINED_CAPTURE_BYTES)
+        self.encoder = PromptEncoder(prompt_token_budget, max_findings=MAX_PROMPT_FINDINGS)
         
     def ensure_data_dir(self):
         """确保数据目录存在"""
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
+        os.makedirs(self.data_dir, exist_ok=True)
         
         # 创建子目录
-        subdirs = ['captured_traffic', 'analysis_results', 'ai_responses']
+        subdirs = ['captured_traffic', 'analysis_results', 'ai_responses', 'cache', 'tmp']
         for subdir in subdirs:
             path = os.path.join(self.data_dir, subdir)
-            if not os.path.exists(path):
-                os.makedirs(path)
+            os.makedirs(path, exist_ok=True)
     
-    def load_pcap_with_tshark(self, pcap_file: str) -> List[str]:
+    def create_scratch_dir(self, prefix: str = "job_") -> str:
+        """为单次分析创建独立的临时目录（位于数据目录下，便于之后原地移动文件）"""
+        return tempfile.mkdtemp(prefix=prefix, dir=os.path.join(self.data_dir, 'tmp'))
+    
+    def remove_scratch_dir(self, path: str):
+        shutil.rmtree(path, ignore_errors=True)
+    
+    def iter_tshark_records(self, pcap_file: str, fields: List[str] = None, max_packets: int = None,
+                            stream_policy: str = "stop", display_filter: str = "tcp or udp",
+                            stats: Dict[str, Any] = None, profile: str = "full",
+                            input_stream=None) -> Iterator[Dict[str, str]]:
+        """逐行读取tshark标准输出，按需生成解析后的数据包记录
+
+        stream_policy:
+            stop  - 达到max_packets后立即终止tshark
+            drain - 达到max_packets后继续读取管道（只计数不解析），以获得总包数
+        profile: FIELD_PROFILES中的字段配置，显式传入fields时只使用其tshark参数
+        input_stream: 提供read(size)的顺序流，给定时忽略pcap_file，由后台线程写入tshark标准输入（-r -）
+        """
+        if stream_policy not in STREAM_POLICIES:
+            raise ValueError(f"未知的流式读取策略: {stream_policy}")
+        if profile not in FIELD_PROFILES:
+            raise ValueError(f"未知的字段配置: {profile}")
+        if fields is None:
+            fields = FIELD_PROFILES[profile]["fields"]
+        if stats is None:
+            stats = {}
+        stats.update({"total_packets": 0, "yielded_packets": 0, "stopped_early": False, "returncode": None,
+                      "profile": profile})
+
+        source = "-" if input_stream is not None else pcap_file
+        cmd = ["tshark", "-r", source, "-T", "fields"] + FIELD_PROFILES[profile]["options"]
+        for field in fields:
+            cmd += ["-e", field]
+        if display_filter:
+            cmd += ["-Y", display_filter]
+
+        print(f"[INFO] Running tshark command: {' '.join(cmd)}")
+
+        # stderr写入匿名临时文件，避免管道写满导致tshark阻塞
+        with tempfile.TemporaryFile() as err_file:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file, bufsize=1024 * 1024,
+                                    stdin=subprocess.PIPE if input_stream is not None else None)
+            if input_stream is not None:
+                threading.Thread(target=self._feed_stdin, args=(proc, input_stream), daemon=True).start()
+            finished = False
+            try:
+                for raw_line in proc.stdout:
+                    if max_packets is not None and stats["yielded_packets"] >= max_packets:
+                        # drain策略：只统计剩余行数，不做字段拆分
+                        if raw_line.strip():
+                            stats["total_packets"] += 1
+                        continue
+
+                    record = parse_tshark_line(raw_line.decode("utf-8", errors="ignore"), fields)
+                    if record is None:
+                        continue
+                    stats["total_packets"] += 1
+                    stats["yielded_packets"] += 1
+                    yield record
+
+                    if stream_policy == "stop" and stats["yielded_packets"] == max_packets:
+                        stats["stopped_early"] = True
+                        break
+                else:
+                    finished = True
+            finally:
+                # 达到上限或调用方提前关闭生成器时直接终止tshark，不再等待其解析完整个文件
+                if not finished:
+                    proc.kill()
+                proc.stdout.close()
+                stats["returncode"] = proc.wait()
+
+                if finished and stats["returncode"] != 0:
+                    err_file.seek(0)
+                    print(f"[ERROR] Tshark failed with exit code {stats['returncode']}")
+                    print(f"[STDERR]: {err_file.read().decode('utf-8', errors='ignore')}")
+
+    @staticmethod
+    def _feed_stdin(proc: subprocess.Popen, input_stream):
+        """把顺序流复制到tshark标准输入，tshark提前退出时静默结束"""
+        try:
+            for block in iter(lambda: input_stream.read(STDIN_BLOCK_SIZE), b""):
+                proc.stdin.write(block)
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def iter_packet_records(self, pcap_file: str, parser: str = "tshark", max_packets: int = None,
+                            stream_policy: str = "stop", stats: Dict[str, Any] = None,
+                            profile: str = "full") -> Iterator[Dict[str, str]]:
+        """按指定解析器生成数据包记录，内置读取器无法处理的文件自动回退到tshark
+
+        profile只对tshark生效；native的字段集见PACKET_PARSERS的说明。
+        """
+        if parser not in PACKET_PARSERS:
+            raise ValueError(f"未知的解析器: {parser}")
+        if stats is None:
+            stats = {}
+
+        if parser == "native":
+            native_records = iter_pcap_records(pcap_file, max_packets=max_packets, stats=stats)
+            try:
+                # 格式检查发生在产生第一条记录之前，此时回退不会导致重复数据
+                first = next(native_records, None)
+            except UnsupportedCaptureError as e:
+                print(f"[WARNING] Native reader cannot decode {pcap_file}: {str(e)}, falling back to tshark")
+            else:
+                stats["parser"] = "native"
+                if first is not None:
+                    yield first
+                    yield from native_records
+                return
+
+        stats["parser"] = "tshark"
+        yield from self.iter_tshark_records(pcap_file, max_packets=max_packets,
+                                            stream_policy=stream_policy, stats=stats, profile=profile)
+
+    def load_pcap(self, pcap_file: str, parser: str = "tshark", max_packets: int = 100,
+                  profile: str = "full") -> List[str]:
+        """解析pcap文件，返回用于模型分析的数据包文本"""
+        if parser == "tshark":
+            return self.load_pcap_with_tshark(pcap_file, max_packets=max_packets, profile=profile)
+
+        build_data = []
+        stats = {}
+        try:
+            for record in self.iter_packet_records(pcap_file, parser=parser, max_packets=max_packets,
+                                                   stats=stats, profile=profile):
+                build_data.append(format_packet_record(record))
+            print(f"[SUCCESS] Processed {len(build_data)} packets with {stats.get('parser')} parser")
+        except Exception as e:
+            print(f"[ERROR] Exception during pcap processing: {str(e)}")
+            return []
+
+        return build_data
+
+    def parse_capture(self, pcap_file: str, parser: str = "tshark", sample_size: int = SAMPLE_PACKETS,
+                      profile: str = "full", progress_callback=None) -> Dict[str, Any]:
+        """单次遍历整个抓包文件，构建列式数据包表并保留少量文本样本"""
+        builder = PacketTableBuilder()
+        samples = []
+        stats = {}
+
+        for record in self.iter_packet_records(pcap_file, parser=parser, stats=stats, profile=profile):
+            builder.append(record)
+            if len(samples) < sample_size:
+                samples.append(format_packet_record(record))
+            if progress_callback and len(builder) % PROGRESS_INTERVAL_PACKETS == 0:
+                progress_callback("parsing", None, f"已解析{len(builder)}个数据包")
+
+        table = builder.build()
+        print(f"[SUCCESS] Parsed {len(table)} packets with {stats.get('parser')} parser")
+        return {"table": table, "samples": samples, "stats": stats}
+
+    def parse_capture_stream(self, open_stream, parser: str = "native", sample_size: int = SAMPLE_PACKETS,
+                             profile: str = "full", progress_callback=None,
+                             stats: Dict[str, Any] = None) -> Dict[str, Any]:
+        """从顺序流解析抓包数据，每攒够一批就建表并累加进流表，数据到达的同时完成流聚合
+
+        open_stream()每次返回一个从头开始的新流；内置读取器无法处理时用新流回退到tshark -r -。
+        返回值在parse_capture的基础上多了已聚合好的flow_table及每个数据包对应的flow_ids。
+        """
+        if parser not in PACKET_PARSERS:
+            raise ValueError(f"未知的解析器: {parser}")
+        if stats is None:
+            stats = {}
+        flow_table = FlowTable()
+        tables = []
+        flow_ids = []
+        samples = []
+        builder = PacketTableBuilder()
+        packets = 0
+
+        def flush():
+            nonlocal builder
+            if len(builder):
+                table = builder.build()
+                flow_ids.append(flow_table.add_table(table))
+                tables.append(table)
+                builder = PacketTableBuilder()
+
+        def consume(records):
+            nonlocal packets
+            for record in records:
+                builder.append(record)
+                packets += 1
+                if len(samples) < sample_size:
+                    samples.append(format_packet_record(record))
+                if len(builder) >= STREAM_BATCH_PACKETS:
+                    flush()
+                if progress_callback and packets % PROGRESS_INTERVAL_PACKETS == 0:
+                    progress_callback("parsing", None, f"已解析{packets}个数据包，已聚合{len(flow_table)}条会话流")
+
+        stream = open_stream()
+        decoded_natively = False
+        try:
+            if parser == "native":
+                try:
+                    records = iter_stream_records(stream, stats=stats)
+                    first = next(records, None)
+                except UnsupportedCaptureError as e:
+                    print(f"[WARNING] Native reader cannot decode stream: {str(e)}, falling back to tshark")
+                    stream.close()
+                    stream = open_stream()
+                else:
+                    stats["parser"] = "native"
+                    if first is not None:
+                        consume([first])
+                        consume(records)
+                    decoded_natively = True
+            if not decoded_natively:
+                stats["parser"] = "tshark"
+                consume(self.iter_tshark_records("-", stats=stats, profile=profile, input_stream=stream))
+        finally:
+            stream.close()
+        flush()
+
+        table = PacketTable.concat(tables) if len(tables) > 1 else (tables[0] if tables else PacketTable.empty())
+        print(f"[SUCCESS] Stream-parsed {len(table)} packets into {len(flow_table)} flows "
+              f"with {stats.get('parser')} parser")
+        return {"table": table, "samples": samples, "stats": stats, "flow_table": flow_table,
+                "flow_ids": np.concatenate(flow_ids) if flow_ids else np.zeros(0, dtype=np.int32)}
+
+    def parse_capture_sharded(self, pcap_file: str, workers: int = None,
+                              sample_size: int = SAMPLE_PACKETS, profile: str = "full") -> Dict[str, Any]:
+        """按字节范围切分抓包文件，在进程池中并行解析后按时间戳合并（仅内置读取器支持）"""
+        start_time = time.time()
+        workers = workers or os.cpu_count() or 1
+        shard_count = max(1, min(workers, os.path.getsize(pcap_file) // MIN_SHARD_BYTES))
+
+        try:
+            shards = plan_shards(pcap_file, shard_count)
+        except UnsupportedCaptureError as e:
+            print(f"[WARNING] Cannot shard {pcap_file}: {str(e)}, falling back to tshark")
+            return self.parse_capture(pcap_file, parser="tshark", sample_size=sample_size, profile=profile)
+        plan_seconds = time.time() - start_time
+
+        if len(shards) == 1:
+            results = [_parse_shard(pcap_file, shards[0], sample_size)]
+        else:
+            with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+                futures = [pool.submit(_parse_shard, pcap_file, shard, sample_size) for shard in shards]
+                results = [future.result() for future in futures]
+
+        table = PacketTable.concat([result["table"] for result in results]).sort_by_time()
+        merged_samples = heapq.merge(*(result["samples"] for result in results))
+        samples = [text for _, _, text in list(merged_samples)[:sample_size]]
+
+        wall_seconds = time.time() - start_time
+        shard_timings = [result["timing"] for result in results]
+        # 用各分片的CPU时间估算并行加速比，墙钟时间在核数不足时会相互重叠
+        busy_seconds = sum(timing["cpu_seconds"] for timing in shard_timings)
+        stats = {
+            "parser": "native",
+            "sharded": True,
+            "shard_count": len(shards),
+            "plan_seconds": round(plan_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "speedup": round(busy_seconds / wall_seconds, 2) if wall_seconds else None,
+            "shards": shard_timings,
+        }
+        print(f"[SUCCESS] Parsed {len(table)} packets in {len(shards)} shards, {wall_seconds:.2f}s")
+        return {"table": table, "samples": samples, "stats": stats}
+
+    def load_pcap_with_tshark(self, pcap_file: str, max_packets: int = 100,
+                              stream_policy: str = "stop", profile: str = "full") -> List[str]:
         """使用tshark解析pcap文件"""
         build_data = []
-        tmp_path = os.path.join(tempfile.gettempdir(), "traffic_analysis_tmp.txt")
-        
-        # 删除旧的临时文件
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-        
-        # 定义要提取的字段
-        fields = [
-            "frame.encap_type", "frame.time", "frame.offset_shift", "frame.time_epoch", 
-            "frame.time_delta", "frame.time_relative", "frame.number", "frame.len", 
-            "frame.marked", "frame.protocols", "eth.dst", "eth.dst_resolved", "eth.src", 
-            "eth.src_resolved", "eth.type", "ip.version", "ip.hdr_len", "ip.dsfield", 
-            "ip.dsfield.dscp", "ip.len", "ip.id", "ip.flags", "ip.flags.rb", "ip.flags.df", 
-            "ip.flags.mf", "ip.frag_offset", "ip.ttl", "ip.proto", "ip.checksum", 
-            "ip.checksum.status", "ip.src", "ip.dst", "tcp.srcport", "tcp.dstport", 
-            "tcp.stream", "tcp.len", "tcp.seq", "tcp.nxtseq", "tcp.ack", "tcp.hdr_len", 
-            "tcp.flags", "tcp.flags.res", "tcp.flags.cwr", "tcp.flags.urg", "tcp.flags.ack", 
-            "tcp.flags.push", "tcp.flags.reset", "tcp.flags.syn", "tcp.flags.fin", 
-            "tcp.flags.str", "tcp.window_size", "tcp.window_size_scalefactor", 
-            "tcp.checksum", "tcp.checksum.status", "tcp.urgent_pointer", "tcp.time_relative", 
-            "tcp.time_delta", "tcp.analysis.bytes_in_flight", "tcp.analysis.push_bytes_sent", 
-            "tcp.segment", "tcp.segment.count", "tcp.reassembled.length", "tcp.payload", 
-            "udp.srcport", "udp.dstport", "udp.length", "udp.checksum", "udp.checksum.status", 
-            "udp.stream", "data.len"
-        ]
-        
-        fields_part = " ".join(f"-e {field}" for field in fields)
-        cmd = f'tshark -r "{pcap_file}" {fields_part} -T fields -Y "tcp or udp" > "{tmp_path}"'
-        
-        print(f"[INFO] Running tshark command: {cmd}")
-        
+        stats = {}
+
         try:
-            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = proc.communicate()
-            
-            if proc.returncode != 0:
-                print(f"[ERROR] Tshark failed with exit code {proc.returncode}")
-                print(f"[STDERR]: {stderr.decode('utf-8', errors='ignore')}")
-                return []
-            
-            if not os.path.exists(tmp_path):
-                print("[ERROR] Temporary file was not created.")
-                return []
-            
-            with open(tmp_path, "r", encoding="utf-8", errors="ignore") as fin:
-                lines = fin.readlines()
-                print(f"[INFO] Read {len(lines)} packets from temporary file")
-            
             # 处理数据，限制数量避免撑爆模型上下文
-            max_packets = 100  # 限制最大包数量
-            processed_count = 0
-            
-            for line in lines[:max_packets]:  # 只处理前100个包
-                packet_data = ""
-                values = line.strip('\n').split("\t")
-                
-                if not values or values == ['']:
-                    continue
-                
-                packet_data += fields[0] + ": " + values[0]
-                for field, value in zip(fields[1:], values[1:]):
-                    if field == "tcp.flags.str":
-                        value = value.encode("unicode_escape").decode("unicode_escape")
-                    if field == "tcp.payload":
-                        value = value[:200] if len(value) > 200 else value  # 限制payload长度
-                    if value == "":
-                        continue
-                    packet_data += ", "
-                    packet_data += field + ": " + value
-                
-                build_data.append(packet_data)
-                processed_count += 1
-            
-            print(f"[SUCCESS] Processed {processed_count} packets")
-            
-            # 清理临时文件
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-                
+            for record in self.iter_tshark_records(pcap_file, max_packets=max_packets,
+                                                   stream_policy=stream_policy, stats=stats, profile=profile):
+                build_data.append(format_packet_record(record))
+
+            if stats.get("returncode") not in (0, None) and not stats.get("stopped_early"):
+                return []
+
+            print(f"[INFO] Read {stats.get('total_packets', 0)} packets from tshark stream")
+            print(f"[SUCCESS] Processed {len(build_data)} packets")
+
         except Exception as e:
             print(f"[ERROR] Exception during tshark processing: {str(e)}")
             return []
-        
+
         return build_data
     
+    def benchmark_profiles(self, pcap_file: str, profiles: List[str] = None, include_native: bool = True,
+                           max_packets: int = None) -> Dict[str, Any]:
+        """用各字段配置分别完整解析同一文件并构建数据包表，比较吞吐量"""
+        runs = [("tshark", profile) for profile in (profiles or FIELD_PROFILES)]
+        if include_native:
+            runs.append(("native", None))
+
+        results = []
+        for parser, profile in runs:
+            stats = {}
+            builder = PacketTableBuilder()
+            start_time = time.time()
+            start_children = os.times()
+            try:
+                for record in self.iter_packet_records(pcap_file, parser=parser, max_packets=max_packets,
+                                                       stats=stats, profile=profile or "full"):
+                    builder.append(record)
+            except Exception as e:
+                print(f"[ERROR] Benchmark run {parser}/{profile} failed: {str(e)}")
+                results.append({"parser": parser, "profile": profile, "error": str(e)})
+                continue
+            seconds = time.time() - start_time
+            end_children = os.times()
+            packets = len(builder)
+            results.append({
+                "parser": stats.get("parser", parser),
+                "profile": profile,
+                "fields": len(FIELD_PROFILES[profile]["fields"]) if profile else None,
+                "packets": packets,
+                "seconds": round(seconds, 3),
+                "packets_per_second": round(packets / seconds, 1) if seconds > 0 else None,
+                # tshark子进程消耗的CPU时间（Windows上os.times不统计子进程，为0）
+                "tshark_cpu_seconds": round((end_children.children_user + end_children.children_system)
+                                            - (start_children.children_user + start_children.children_system), 3),
+            })
+            print(f"[INFO] Benchmark {parser}/{profile}: {packets} packets in {seconds:.2f}s")
+
+        baseline = next((r for r in results if r.get("profile") == "full" and r.get("packets_per_second")), None)
+        if baseline:
+            for result in results:
+                if result.get("packets_per_second"):
+                    result["speedup_vs_full"] = round(result["packets_per_second"] / baseline["packets_per_second"], 2)
+
+        return {
+            "file": os.path.basename(pcap_file),
+            "file_size": os.path.getsize(pcap_file),
+            "max_packets": max_packets,
+            "results": results,
+        }
+
     def get_network_interfaces(self):
         """获取可用的网络接口列表"""
         interfaces = []
@@ -182,16 +735,17 @@ class TrafficAnalyzer:
         
         return interfaces
     
-    def capture_live_traffic(self, interface='any', duration=30, packet_count=50):
-        """实时捕获网络流量"""
+    def capture_live_traffic(self, interface='any', duration=30, packet_count=50, capture_filter=None):
+        """实时捕获网络流量，capture_filter为resolve_capture_filter的返回值，由libpcap在采集时过滤和截断"""
         captured_packets = []
+        scratch_dir = self.create_scratch_dir(prefix="capture_")
         
         try:
             print(f"[INFO] Starting live capture on interface {interface} for {duration} seconds")
             
-            # 使用tshark命令行工具进行捕获，避免事件循环问题
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            temp_pcap = os.path.join(tempfile.gettempdir(), f"temp_capture_{timestamp}.pcap")
+            # 使用tshark命令行工具进行捕获，避免事件循环问题；每次捕获使用独立的临时目录
+            result_id = new_result_id()
+            temp_pcap = os.path.join(scratch_dir, "capture.pcap")
             
             # 如果是Windows且interface为'any'，尝试使用第一个可用接口
             if interface == 'any' and os.name == 'nt':
@@ -215,11 +769,12 @@ class TrafficAnalyzer:
             # 限制最大数据包数量
             max_packets = min(packet_count, 100)
             
-            # 构建tshark捕获命令
-            cmd = f'tshark -i {interface} -a duration:{duration} -c {max_packets} -w "{temp_pcap}"'
+            # 构建tshark捕获命令（列表形式传参，过滤器表达式中的空格和引号无需转义）
+            cmd = ["tshark", "-i", str(interface), "-a", f"duration:{duration}", "-c", str(max_packets),
+                   "-w", temp_pcap] + capture_args(capture_filter)
             
-            print(f"[INFO] Running capture command: {cmd}")
-            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            print(f"[INFO] Running capture command: {' '.join(cmd)}")
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             stdout, stderr = proc.communicate()
             
             if proc.returncode != 0:
@@ -232,48 +787,34 @@ class TrafficAnalyzer:
                 print("[WARNING] No packets captured or file is empty")
                 return []
             
-            # 使用tshark解析捕获的文件
-            parse_cmd = f'tshark -r "{temp_pcap}" -T json'
-            proc = subprocess.Popen(parse_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = proc.communicate()
-            
-            if proc.returncode == 0 and stdout:
+            # 使用tshark解析捕获的文件，增量解码JSON输出，逐个数据包提取字段后丢弃其余部分
+            parse_cmd = ["tshark", "-r", temp_pcap, "-n", "-T", "json", "-j", JSON_CAPTURE_LAYERS]
+            with tempfile.TemporaryFile() as err_file:
+                proc = subprocess.Popen(parse_cmd, stdout=subprocess.PIPE, stderr=err_file)
                 try:
-                    # 解析JSON输出
-                    packets_json = json.loads(stdout.decode('utf-8'))
-                    
-                    for packet in packets_json:
+                    for packet in iter_json_array(proc.stdout):
                         try:
-                            layers = packet.get('_source', {}).get('layers', {})
-                            
-                            packet_info = {
-                                'timestamp': layers.get('frame', {}).get('frame.time', 'N/A'),
-                                'protocol': layers.get('frame', {}).get('frame.protocols', 'N/A'),
-                                'length': layers.get('frame', {}).get('frame.len', 'N/A'),
-                                'src_ip': layers.get('ip', {}).get('ip.src', 'N/A'),
-                                'dst_ip': layers.get('ip', {}).get('ip.dst', 'N/A'),
-                                'src_port': layers.get('tcp', {}).get('tcp.srcport') or layers.get('udp', {}).get('udp.srcport', 'N/A'),
-                                'dst_port': layers.get('tcp', {}).get('tcp.dstport') or layers.get('udp', {}).get('udp.dstport', 'N/A')
-                            }
-                            captured_packets.append(packet_info)
+                            captured_packets.append(json_packet_summary(packet))
                         except Exception as e:
                             print(f"[WARNING] Error processing packet: {str(e)}")
                             continue
-                            
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     print(f"[ERROR] Failed to parse JSON output: {str(e)}")
-            
-            # 清理临时文件
-            if os.path.exists(temp_pcap):
-                os.remove(temp_pcap)
+                finally:
+                    proc.stdout.close()
+                    if proc.wait() != 0:
+                        err_file.seek(0)
+                        print(f"[WARNING] tshark exited with code {proc.returncode}: "
+                              f"{err_file.read().decode('utf-8', errors='ignore').strip()}")
             
             # 保存捕获的数据
             if captured_packets:
-                filename = f"live_capture_{timestamp}.json"
-                filepath = os.path.join(self.data_dir, 'captured_traffic', filename)
-                
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(captured_packets, f, ensure_ascii=False, indent=2)
+                filepath = save_document(
+                    os.path.join(self.data_dir, 'captured_traffic', f"live_capture_{result_id}"),
+                    {"result_id": result_id, "interface": interface, "duration": duration,
+                     "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+                     "packet_count": len(captured_packets), "packets": captured_packets},
+                    table_fields=["packets"])
                 
                 print(f"[SUCCESS] Captured {len(captured_packets)} packets, saved to {filepath}")
             else:
@@ -281,19 +822,155 @@ class TrafficAnalyzer:
             
         except Exception as e:
             print(f"[ERROR] Live capture failed: {str(e)}")
+        finally:
+            # 清理临时文件
+            self.remove_scratch_dir(scratch_dir)
         
         return captured_packets
     
-    def analyze_with_ai(self, traffic_data: List[str], model=None, enable_thinking=True) -> Dict[str, Any]:
-        """使用AI模型分析流量数据"""
+    def analyze_with_ai(self, traffic_data: List[str], model=None, enable_thinking=True,
+                        statistics: Dict[str, Any] = None, flows: List[Dict[str, Any]] = None,
+                        detection: Dict[str, Any] = None, result_id: str = None,
+                        use_cache: bool = True) -> Dict[str, Any]:
+        """使用AI模型分析流量数据，use_cache=False时不使用缓存的模型回复"""
+        
+        # 启发式检测结果作为确定性的基线风险，模型无法给出风险等级时使用
+        baseline_risk = detection["risk_level"] if detection else "中"
+        
+        # 有统计或流摘要时按token预算紧凑编码，否则退回到前10个原始数据包
+        prompt_stats = None
+        if statistics or flows or detection:
+            encoded = self.encoder.encode(statistics=statistics, detection=detection, flows=flows)
+            traffic_part = encoded["text"]
+            prompt_stats = {k: v for k, v in encoded.items() if k != "text"}
+            print(f"[INFO] Prompt encoded: {encoded['tokens']}/{encoded['token_budget']} tokens, "
+                  f"{encoded['flows_included']}/{encoded['flows_available']} flows in {encoded['flow_rows']} rows")
+        else:
+            traffic_part = f"""流量数据（共{len(traffic_data)}个数据包）：
+{"".join(traffic_data[:10])}  # 只发送前10个包避免上下文过长"""
+        
+        prompt = self._build_prompt(traffic_part, enable_thinking)
+        
+        try:
+            print("[INFO] Sending traffic data to AI model for analysis...")
+            ai_response = self._call_model(prompt, model, use_cache)
+            analysis_result = self._parse_ai_response(ai_response, baseline_risk, detection)
+            
+            if detection:
+                analysis_result["baseline_risk_level"] = baseline_risk
+                analysis_result["detections"] = detection["findings"][:MAX_PROMPT_FINDINGS]
+            if prompt_stats:
+                analysis_result["prompt_stats"] = prompt_stats
+            
+            self._save_ai_result(analysis_result, result_id)
+            return analysis_result
+                
+        except ModelCallError as e:
+            print(f"[ERROR] AI API call failed with status code: {e.status_code}")
+            return {"error": f"API调用失败，状态码: {e.status_code}"}
+        except Exception as e:
+            print(f"[ERROR] AI analysis failed: {str(e)}")
+            return {"error": f"AI分析失败: {str(e)}"}
+    
+    def analyze_with_ai_mapreduce(self, statistics: Dict[str, Any], flows: List[Dict[str, Any]],
+                                  detection: Dict[str, Any] = None, model=None, enable_thinking=True,
+                                  map_workers: int = DEFAULT_MAP_WORKERS, progress_callback=None,
+                                  result_id: str = None, use_cache: bool = True) -> Dict[str, Any]:
+        """map-reduce分析：把流按token预算分块并发送给模型，再合并各块结论"""
+        baseline_risk = detection["risk_level"] if detection else "中"
+        # 全局统计和检测发现放进每一块，让模型能把局部现象放到整体背景下判断；各块与概览共用主机别名
+        encoded = self.encoder.encode_chunks(flows, max_chunks=MAX_MAP_CHUNKS,
+                                             statistics=statistics, detection=detection)
+        chunks = encoded["chunks"]
+        if not chunks:
+            return self.analyze_with_ai([], model=model, enable_thinking=enable_thinking,
+                                        statistics=statistics, flows=flows, detection=detection,
+                                        result_id=result_id, use_cache=use_cache)
+        
+        covered = sum(chunk["flows_included"] for chunk in chunks)
+        print(f"[INFO] Map-reduce analysis: {len(chunks)} chunks covering {covered}/{len(flows)} flows, "
+              f"{map_workers} workers")
+        
+        submit_time = time.time()
+        completed = []
         
-        # 构建分析提示词
+        def map_chunk(index: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+            if progress_callback:
+                # 已请求取消时在这里抛出JobCancelled，尚未开始的分块不再调用模型
+                progress_callback("ai_analysis", None, f"开始分析第{index + 1}/{len(chunks)}块")
+            start = time.time()
+            timing = {"chunk": index, "flows": chunk["flows_included"], "flow_rows": chunk["flow_rows"],
+                      "tokens": chunk["tokens"], "queued_seconds": round(start - submit_time, 3)}
+            scope = f"\n以下数据是整个抓包文件的第{index + 1}/{len(chunks)}部分，请只针对这一部分给出结论。"
+            prompt = self._build_prompt(chunk["text"], enable_thinking, scope)
+            try:
+                result = self._parse_ai_response(self._call_model(prompt, model, use_cache), baseline_risk, detection)
+                timing["status"] = "ok"
+            except JobCancelled:
+                raise
+            except Exception as e:
+                result = None
+                timing["status"] = "error"
+                timing["error"] = str(e)
+            timing["seconds"] = round(time.time() - start, 3)
+            completed.append(index)
+            if progress_callback:
+                progress_callback("ai_analysis", 0.6 + 0.35 * len(completed) / len(chunks),
+                                  f"已完成{len(completed)}/{len(chunks)}块")
+            return {"result": result, "timing": timing}
+        
+        with ThreadPoolExecutor(max_workers=max(1, map_workers)) as executor:
+            mapped = list(executor.map(map_chunk, range(len(chunks)), chunks))
+        wall_seconds = time.time() - submit_time
+        
+        timings = [m["timing"] for m in mapped]
+        results = [m["result"] for m in mapped if m["result"] is not None]
+        if not results:
+            print(f"[ERROR] All {len(chunks)} map-reduce chunks failed")
+            return {"error": f"AI分析失败: {timings[0].get('error', '')}"}
+        
+        # reduce：风险取最高，威胁和建议按出现顺序去重
+        levels = [r.get("risk_level", baseline_risk) for r in results]
+        if detection:
+            levels.append(baseline_risk)
+        model_seconds = sum(t["seconds"] for t in timings)
+        analysis_result = {
+            "summary": f"共分{len(chunks)}块分析了{covered}条会话流。" +
+                       " ".join(str(r.get("summary", "")) for r in results),
+            "threats": _merge_unique([t for r in results for t in r.get("threats", [])]),
+            "risk_level": RISK_LEVELS[max(risk_rank(level) for level in levels)],
+            "recommendations": _merge_unique([t for r in results for t in r.get("recommendations", [])]),
+            "detailed_analysis": "\n\n".join(
+                f"【第{m['timing']['chunk'] + 1}部分】\n{m['result'].get('detailed_analysis', m['result']['summary'])}"
+                for m in mapped if m["result"] is not None),
+            "mapreduce": {
+                "chunk_count": len(chunks),
+                "workers": map_workers,
+                "flows_available": len(flows),
+                "flows_included": covered,
+                "flows_dropped": encoded["flows_dropped"],
+                "overview_tokens": encoded["overview_tokens"],
+                "failed_chunks": sum(1 for t in timings if t["status"] != "ok"),
+                "wall_seconds": round(wall_seconds, 3),
+                "model_seconds": round(model_seconds, 3),
+                "parallel_speedup": round(model_seconds / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+                "chunks": timings,
+            },
+        }
+        if detection:
+            analysis_result["baseline_risk_level"] = baseline_risk
+            analysis_result["detections"] = detection["findings"][:MAX_PROMPT_FINDINGS]
+        
+        self._save_ai_result(analysis_result, result_id)
+        return analysis_result
+    
+    def _build_prompt(self, traffic_part: str, enable_thinking=True, scope: str = "") -> str:
+        """构建完整分析提示词，scope用于说明数据只是整个文件的一部分"""
         thinking_prefix = "" if enable_thinking else "/no_think"
-        prompt = f"""{thinking_prefix}
-你是一个专业的校园网络安全分析师。请分析以下校园网络流量数据，并提供详细的安全评估报告。
+        return f"""{thinking_prefix}
+你是一个专业的校园网络安全分析师。请分析以下校园网络流量数据，并提供详细的安全评估报告。{scope}
 
-流量数据（共{len(traffic_data)}个数据包）：
-{"".join(traffic_data[:10])}  # 只发送前10个包避免上下文过长
+{traffic_part}
 
 请从校园网络环境的角度进行分析，重点关注：
 1. 流量概况（协议分布、通信模式，结合校园网络特点如学生宿舍、教学区域、实验室等）
@@ -315,120 +992,237 @@ class TrafficAnalyzer:
 3. 直接提供分析结论和发现的问题
 4. 使用具体的数据和事实来支撑结论
 """
-        
+    
+    def _call_model(self, prompt: str, model=None, use_cache: bool = True) -> str:
+        """调用Ollama对话接口，返回模型回复文本（相同的提示词可能直接返回缓存的回复）"""
+        return self.ollama.chat([{"role": "user", "content": prompt}], model=model or self.model,
+                                use_cache=use_cache)
+    
+    def _parse_ai_response(self, ai_response: str, baseline_risk: str,
+                           detection: Dict[str, Any] = None) -> Dict[str, Any]:
+        """将模型回复解析为统一的分析结果结构"""
+        # 尝试解析JSON响应
         try:
-            if model is None:
-                model = self.model
-            url = "http://localhost:11434/api/chat"
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "stream": False
-            }
+            analysis_result = json.loads(ai_response)
+            # 确保必要字段存在
+            if "summary" not in analysis_result:
+                analysis_result["summary"] = "流量分析已完成，请查看详细报告"
+            if "risk_level" not in analysis_result:
+                analysis_result["risk_level"] = baseline_risk
+            if "threats" not in analysis_result:
+                analysis_result["threats"] = []
+            if "recommendations" not in analysis_result:
+                analysis_result["recommendations"] = ["建议进一步分析流量模式"]
+        except json.JSONDecodeError:
+            # 如果不是JSON格式，尝试从文本中提取关键信息
+            summary = "基于流量特征的安全分析已完成"
+            risk_level = baseline_risk
+            threats = [f["description"] for f in detection["findings"][:5]] if detection else []
+            recommendations = ["建议持续监控网络流量"]
             
-            print("[INFO] Sending traffic data to AI model for analysis...")
-            response = requests.post(url, json=payload, timeout=60)
+            # 没有检测基线时退回到简单的关键词检测
+            if detection is None:
+                if any(keyword in ai_response.lower() for keyword in ['攻击', '恶意', '威胁', '异常', '入侵']):
+                    risk_level = "高"
+                    threats.append("检测到潜在安全威胁")
+                elif any(keyword in ai_response.lower() for keyword in ['正常', '安全', '无异常']):
+                    risk_level = "低"
             
-            if response.status_code == 200:
-                ai_response = response.json().get('message', {}).get('content', '')
-                
-                # 尝试解析JSON响应
-                try:
-                    analysis_result = json.loads(ai_response)
-                    # 确保必要字段存在
-                    if "summary" not in analysis_result:
-                        analysis_result["summary"] = "流量分析已完成，请查看详细报告"
-                    if "risk_level" not in analysis_result:
-                        analysis_result["risk_level"] = "中"
-                    if "threats" not in analysis_result:
-                        analysis_result["threats"] = []
-                    if "recommendations" not in analysis_result:
-                        analysis_result["recommendations"] = ["建议进一步分析流量模式"]
-                except json.JSONDecodeError:
-                    # 如果不是JSON格式，尝试从文本中提取关键信息
-                    summary = "基于流量特征的安全分析已完成"
-                    risk_level = "中"
-                    threats = []
-                    recommendations = ["建议持续监控网络流量"]
-                    
-                    # 简单的关键词检测
-                    if any(keyword in ai_response.lower() for keyword in ['攻击', '恶意', '威胁', '异常', '入侵']):
-                        risk_level = "高"
-                        threats.append("检测到潜在安全威胁")
-                    elif any(keyword in ai_response.lower() for keyword in ['正常', '安全', '无异常']):
-                        risk_level = "低"
-                    
-                    # 尝试提取摘要信息
-                    lines = ai_response.split('\n')
-                    for line in lines:
-                        if '摘要' in line or '概况' in line:
-                            summary = line.strip()
-                            break
-                    
-                    analysis_result = {
-                        "summary": summary,
-                        "threats": threats,
-                        "risk_level": risk_level,
-                        "recommendations": recommendations,
-                        "detailed_analysis": ai_response
-                    }
-                
-                # 保存AI分析结果
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"ai_analysis_{timestamp}.json"
-                filepath = os.path.join(self.data_dir, 'ai_responses', filename)
-                
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(analysis_result, f, ensure_ascii=False, indent=2)
-                
-                print(f"[SUCCESS] AI analysis completed, saved to {filepath}")
-                return analysis_result
-                
-            else:
-                print(f"[ERROR] AI API call failed with status code: {response.status_code}")
-                return {"error": f"API调用失败，状态码: {response.status_code}"}
-                
-        except Exception as e:
-            print(f"[ERROR] AI analysis failed: {str(e)}")
-            return {"error": f"AI分析失败: {str(e)}"}
+            # 尝试提取摘要信息
+            lines = ai_response.split('\n')
+            for line in lines:
+                if '摘要' in line or '概况' in line:
+                    summary = line.strip()
+                    break
+            
+            analysis_result = {
+                "summary": summary,
+                "threats": threats,
+                "risk_level": risk_level,
+                "recommendations": recommendations,
+                "detailed_analysis": ai_response
+            }
+        
+        return analysis_result
     
-    def process_pcap_file(self, pcap_file_path: str, enable_thinking=True) -> Dict[str, Any]:
-        """处理pcap文件的完整流程"""
+    def _save_ai_result(self, analysis_result: Dict[str, Any], result_id: str = None):
+        """保存AI分析结果"""
+        filename = f"ai_analysis_{result_id or new_result_id()}.json"
+        filepath = os.path.join(self.data_dir, 'ai_responses', filename)
+        
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(analysis_result, f, ensure_ascii=False, indent=2)
+        
+        print(f"[SUCCESS] AI analysis completed, saved to {filepath}")
+    
+    def process_pcap_file(self, pcap_file_path: str, enable_thinking=True, parser="tshark",
+                          workers=None, force=False, file_hash=None, mode="single",
+                          map_workers=DEFAULT_MAP_WORKERS, profile="full", progress_callback=None,
+                          preparsed=None, capture_filter=None, extra_findings=None) -> Dict[str, Any]:
+        """处理pcap文件的完整流程
+
+        以文件SHA-256和分析参数为键缓存解析结果与AI结论，force=True时忽略缓存重新分析。
+        mode="mapreduce"时把全部流分块并发交给模型，适合流数量很多的大文件。
+        progress_callback(stage, progress, message)在每个阶段开始时调用，可抛出JobCancelled中止分析。
+        preparsed为上传过程中已完成的解析结果（parse_capture_stream的返回值），给定时跳过解析阶段。
+        capture_filter为resolve_capture_filter的返回值，给定时先按BPF过滤器和snaplen生成较小的文件再分析。
+        extra_findings为文件之外得到的检测发现（如持续采集的跨分段扇出估计），并入检测结果、提示词和风险等级。
+        """
         print(f"[INFO] Starting analysis of pcap file: {pcap_file_path}")
         
-        # 1. 解析pcap文件
-        traffic_data = self.load_pcap_with_tshark(pcap_file_path)
+        def report(stage, progress, message=""):
+            if progress_callback:
+                progress_callback(stage, progress, message)
+        
+        if capture_filter:
+            report("filtering", 0.01, "按采集过滤器预先过滤抓包文件")
+            filter_dir = self.create_scratch_dir(prefix="filter_")
+            try:
+                prefilter = prefilter_capture(pcap_file_path, filter_dir, capture_filter)
+                if preparsed is not None:
+                    print("[INFO] Ignoring capture parsed during upload because a capture filter is set")
+                # 过滤后的文件内容不同，哈希需要重新计算，缓存键随之区分
+                result = self.process_pcap_file(prefilter.pop("path"), enable_thinking=enable_thinking,
+                                                parser=parser, workers=workers, force=force, mode=mode,
+                                                map_workers=map_workers, profile=profile,
+                                                progress_callback=progress_callback, extra_findings=extra_findings)
+            except ValueError as e:
+                print(f"[ERROR] Capture filter failed: {str(e)}")
+                return {"error": f"无法应用采集过滤器: {str(e)}"}
+            finally:
+                self.remove_scratch_dir(filter_dir)
+            if "error" not in result:
+                result["capture_filter"] = {**capture_filter, **prefilter}
+            return result
+        
+        # 0. 查找缓存的分析结果
+        report("hashing", 0.02, "计算文件哈希并查找缓存")
+        if file_hash is None:
+            file_hash = file_sha256(pcap_file_path)
+        parse_key = make_cache_key("parsed", file_hash, parser=parser, profile=profile)
+        result_params = {"parser": parser, "profile": profile, "model": self.model,
+                         "enable_thinking": enable_thinking, "mode": mode}
+        if extra_findings:
+            # 额外的检测发现会改变提示词，只有发现完全相同时才能复用缓存的AI结论
+            result_params["extra_findings"] = sorted(f["description"] for f in extra_findings)
+        result_key = make_cache_key("result", file_hash, **result_params)
+        if not force:
+            cached_result = self.cache.get_result(result_key)
+            if cached_result is not None:
+                print(f"[INFO] Analysis cache hit for {file_hash[:12]}")
+                cached_result["cache_hit"] = True
+                return cached_result
         
+        # 1. 解析pcap文件（内置读取器且指定多个进程时分片并行解析）
+        if preparsed is not None:
+            parsed = preparsed
+            print(f"[INFO] Using capture parsed during upload ({len(parsed['table'])} packets)")
+            if parsed["samples"]:
+                self.cache.put_parsed(parse_key, parsed)
+        else:
+            parsed = None if force else self.cache.get_parsed(parse_key)
+        if parsed is None:
+            report("parsing", 0.05, f"使用{parser}解析器解析抓包文件")
+            try:
+                if parser == "native" and workers and workers > 1:
+                    parsed = self.parse_capture_sharded(pcap_file_path, workers=workers, profile=profile)
+                else:
+                    parsed = self.parse_capture(pcap_file_path, parser=parser, profile=profile,
+                                                progress_callback=progress_callback)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Exception during pcap processing: {str(e)}")
+                return {"error": f"无法解析pcap文件: {str(e)}"}
+            if parsed["samples"]:
+                self.cache.put_parsed(parse_key, parsed)
+        elif preparsed is None:
+            print(f"[INFO] Parsed capture cache hit for {file_hash[:12]}")
+        
+        traffic_data = parsed["samples"]
+        packet_table = parsed["table"]
         if not traffic_data:
             return {"error": "无法解析pcap文件或文件为空"}
         
-        # 2. 保存结构化数据
+        # 2. 保存结构化数据（列式数据包表单独保存为npz），文件名使用不会冲突的结果ID
+        result_id = new_result_id()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        structured_filename = f"structured_data_{timestamp}.json"
-        structured_filepath = os.path.join(self.data_dir, 'analysis_results', structured_filename)
+        table_filepath = os.path.join(self.data_dir, 'analysis_results', f"packet_table_{result_id}.npz")
+        packet_table.save(table_filepath)
+        
+        # 2.1 五元组流聚合（覆盖全部数据包；流式解析时已在上传过程中聚合完成）
+        flow_table = parsed.get("flow_table")
+        flow_ids = parsed.get("flow_ids")
+        if flow_table is None:
+            report("flows", 0.4, f"聚合{len(packet_table)}个数据包的会话流")
+            flow_table = FlowTable()
+            flow_ids = flow_table.add_table(packet_table)
+        statistics = packet_table.summary()
+        statistics["flows"] = flow_table.overview()
+        
+        # 2.2 启发式检测，得分决定哪些流进入提示词
+        report("detection", 0.5, f"对{len(flow_table)}条会话流运行启发式检测")
+        detection = run_detectors(packet_table)
+        if extra_findings:
+            detection = merge_findings(detection, extra_findings)
+        print(f"[INFO] Detectors found {len(detection['findings'])} findings in {detection['elapsed_ms']}ms, "
+              f"baseline risk {detection['risk_level']}")
+        
+        # 2.3 保留抓包文件并建立帧偏移索引，之后可按流或时间窗口直接读取数据包
+        report("indexing", 0.55, "建立帧偏移索引")
+        capture_index = None
+        if len(packet_table) and packet_table["frame_number"].min() > 0:
+            capture_index = self.captures.add(result_id, pcap_file_path, packet_table["frame_number"], flow_ids,
+                                              source_file=os.path.basename(pcap_file_path))
         
         structured_data = {
+            "result_id": result_id,
             "timestamp": timestamp,
             "source_file": os.path.basename(pcap_file_path),
-            "packet_count": len(traffic_data),
+            "packet_count": len(packet_table),
+            "statistics": statistics,
+            "packet_table_file": table_filepath,
+            "flow_count": len(flow_table),
+            "flows": flow_table.summaries(limit=MAX_SAVED_FLOWS),
+            "detection": detection,
+            "capture_index": capture_index,
             "packets": traffic_data
         }
         
-        with open(structured_filepath, 'w', encoding='utf-8') as f:
-            json.dump(structured_data, f, ensure_ascii=False, indent=2)
+        # 数据包样本和流摘要按列压缩存储，其余字段写入页脚
+        structured_filepath = save_document(
+            os.path.join(self.data_dir, 'analysis_results', f"structured_data_{result_id}"),
+            structured_data, table_fields=["packets", "flows"])
         
         # 3. AI分析
-        ai_result = self.analyze_with_ai(traffic_data, enable_thinking=enable_thinking)
+        report("ai_analysis", 0.6, "等待AI模型分析")
+        if mode == "mapreduce":
+            flows = select_flows(flow_table, detection, MAX_MAPREDUCE_FLOWS)
+            ai_result = self.analyze_with_ai_mapreduce(statistics, flows, detection=detection,
+                                                       enable_thinking=enable_thinking, map_workers=map_workers,
+                                                       progress_callback=progress_callback, result_id=result_id,
+                                                       use_cache=not force)
+        else:
+            ai_result = self.analyze_with_ai(traffic_data, enable_thinking=enable_thinking, statistics=statistics,
+                                             flows=select_flows(flow_table, detection, MAX_PROMPT_FLOWS),
+                                             detection=detection, result_id=result_id, use_cache=not force)
         
         # 4. 合并结果
         final_result = {
+            "result_id": result_id,
             "structured_data_file": structured_filepath,
             "ai_analysis": ai_result,
+            "parse_stats": parsed["stats"],
+            "capture_index": capture_index,
+            "file_sha256": file_hash,
+            "cache_hit": False,
             "processing_time": datetime.now().isoformat()
         }
         
+        # AI调用失败（包括部分分块失败）的结果不缓存，下次上传时重试
+        if "error" not in ai_result and not ai_result.get("mapreduce", {}).get("failed_chunks"):
+            self.cache.put_result(result_key, final_result)
+        
         return final_result
 
 # 测试函数
@@ -0,0 +1,302 @@
+"""分块、可续传的抓包文件上传
+
+客户端先创建上传会话并声明文件大小，再按偏移量逐块PUT原始字节。每块直接从请求流写入磁盘，
+同时增量计算SHA-256；连接中断后查询已确认的偏移量即可从断点继续。
+文件大小和上传速率在写入过程中强制限制，任何时候都不会把整个文件读进内存。
+UploadTail可以在上传进行中顺序读取已到达的字节，供解析器与上传流水线并行工作。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+RECOMMENDED_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class UploadError(Exception):
+    """上传请求无效，status为对应的HTTP状态码"""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class TokenBucket:
+    """令牌桶限速器，rate为每秒字节数，0表示不限速"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        """取走amount个令牌，不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class UploadSession:
+    """单个上传会话，磁盘上的已写入字节数即为已确认偏移量"""
+
+    def __init__(self, upload_id: str, directory: str, meta: Dict[str, Any]):
+        self.id = upload_id
+        self.directory = directory
+        self.meta = meta
+        self.lock = threading.Lock()
+        self.closed = False
+        self.written = threading.Condition()
+        self._hasher = None
+        self._hashed = 0
+
+    def save_meta(self):
+        with open(os.path.join(self.directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory, "data" + self.meta["extension"])
+
+    @property
+    def offset(self) -> int:
+        try:
+            return os.path.getsize(self.data_path)
+        except OSError:
+            return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.meta["size"]
+
+    def hasher(self):
+        """返回与已写入字节一致的SHA-256对象，进程重启后首次使用时从磁盘补算"""
+        if self._hasher is None or self._hashed != self.offset:
+            hasher = hashlib.sha256()
+            hashed = 0
+            with open(self.data_path, "rb") as f:
+                for block in iter(lambda: f.read(UPLOAD_BLOCK_SIZE), b""):
+                    hasher.update(block)
+                    hashed += len(block)
+            self._hasher, self._hashed = hasher, hashed
+        return self._hasher
+
+    def notify(self, closed: bool = False):
+        """唤醒等待新数据的UploadTail；closed=True表示会话已被删除"""
+        with self.written:
+            self.closed = self.closed or closed
+            self.written.notify_all()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.id,
+            "filename": self.meta["filename"],
+            "size": self.meta["size"],
+            "offset": self.offset,
+            "complete": self.complete,
+            "created_at": self.meta["created_at"],
+            "updated_at": self.meta.get("updated_at", self.meta["created_at"]),
+        }
+
+
+class UploadTail:
+    """跟随上传进度顺序读取数据文件：数据尚未到达时阻塞等待
+
+    读到声明的文件大小后返回EOF；会话被删除或超过idle_timeout秒没有新数据时提前返回EOF，
+    并通过aborted/stalled标记原因，调用方据此判断解析结果是否完整。
+    """
+
+    def __init__(self, session: UploadSession, idle_timeout: float = 300):
+        self.session = session
+        self.idle_timeout = idle_timeout
+        self.position = 0
+        self.aborted = False
+        self.stalled = False
+        self._fp = open(session.data_path, "rb")
+
+    @property
+    def complete(self) -> bool:
+        return self.position >= self.session.meta["size"]
+
+    def read(self, size: int) -> bytes:
+        waited_since = time.monotonic()
+        while True:
+            data = self._fp.read(min(size, self.session.meta["size"] - self.position))
+            if data:
+                self.position += len(data)
+                return data
+            if self.complete:
+                return b""
+            with self.session.written:
+                if self.aborted or self.session.closed:
+                    self.aborted = True
+                    return b""
+                if self.session.offset <= self.position:
+                    self.session.written.wait(1.0)
+            if self.session.offset <= self.position and time.monotonic() - waited_since > self.idle_timeout:
+                self.stalled = True
+                return b""
+
+    def abort(self):
+        """让阻塞中的read立即返回EOF"""
+        self.aborted = True
+        self.session.notify()
+
+    def close(self):
+        self._fp.close()
+
+
+class UploadManager:
+    """管理上传会话目录，限制单文件大小和全局上传速率"""
+
+    def __init__(self, upload_dir: str, max_bytes: int, rate_limit: float = 0,
+                 allowed_extensions=(".pcap", ".pcapng", ".cap"), ttl_seconds: float = 24 * 3600):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.allowed_extensions = set(allowed_extensions)
+        self.ttl_seconds = ttl_seconds
+        # 突发量限制在4个块以内，避免小文件分块完全绕过限速
+        self.limiter = TokenBucket(rate_limit, burst=max(min(rate_limit, 4 * UPLOAD_BLOCK_SIZE), UPLOAD_BLOCK_SIZE))
+        self.sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        os.makedirs(upload_dir, exist_ok=True)
+        self._load_sessions()
+
+    def _load_sessions(self):
+        """启动时恢复未完成的上传，客户端可以在服务重启后继续续传"""
+        for upload_id in os.listdir(self.upload_dir):
+            directory = os.path.join(self.upload_dir, upload_id)
+            try:
+                with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            self.sessions[upload_id] = UploadSession(upload_id, directory, meta)
+
+    def _expire_locked(self):
+        now = time.time()
+        for upload_id, session in list(self.sessions.items()):
+            if now - session.meta.get("updated_at", session.meta["created_at"]) > self.ttl_seconds:
+                del self.sessions[upload_id]
+                session.notify(closed=True)
+                shutil.rmtree(session.directory, ignore_errors=True)
+                print(f"[INFO] Expired stale upload {upload_id}")
+
+    def create(self, filename: str, size: int, sha256: Optional[str] = None) -> UploadSession:
+        """创建上传会话并预先检查大小和磁盘空间"""
+        extension = os.path.splitext(filename or "")[1].lower()
+        if extension not in self.allowed_extensions:
+            raise UploadError("不支持的文件格式，请上传pcap、pcapng或cap文件")
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("size必须是正整数")
+        if size > self.max_bytes:
+            raise UploadError(f"文件大小超过上限 {self.max_bytes} 字节", status=413)
+        if shutil.disk_usage(self.upload_dir).free < size:
+            raise UploadError("服务器磁盘空间不足", status=507)
+
+        upload_id = uuid.uuid4().hex
+        directory = os.path.join(self.upload_dir, upload_id)
+        os.makedirs(directory)
+        meta = {"filename": filename, "extension": extension, "size": size,
+                "sha256": sha256.lower() if sha256 else None, "created_at": time.time()}
+        session = UploadSession(upload_id, directory, meta)
+        session.save_meta()
+        open(session.data_path, "wb").close()
+
+        with self._lock:
+            self._expire_locked()
+            self.sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        with self._lock:
+            session = self.sessions.get(upload_id)
+        if session is None:
+            raise UploadError("上传会话不存在", status=404)
+        return session
+
+    def write_chunk(self, upload_id: str, offset: int, stream, content_length: Optional[int]) -> UploadSession:
+        """从请求流把一块数据写到offset处，边写边更新哈希
+
+        offset必须等于已确认的偏移量；传输中断时已写入磁盘的部分仍然有效，客户端查询偏移量后续传即可。
+        """
+        session = self.get(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadError("该上传会话正在写入其他分块", status=409, offset=session.offset)
+        try:
+            current = session.offset
+            if offset != current:
+                raise UploadError("分块偏移量与已确认的偏移量不一致", status=409, offset=current)
+            remaining = session.meta["size"] - current
+            if content_length is not None and content_length > remaining:
+                raise UploadError(f"分块超出声明的文件大小，剩余 {remaining} 字节", status=413, offset=current)
+
+            hasher = session.hasher()
+            with open(session.data_path, "r+b") as f:
+                f.seek(current)
+                while True:
+                    block = stream.read(min(UPLOAD_BLOCK_SIZE, remaining + 1))
+                    if not block:
+                        break
+                    if len(block) > remaining:
+                        raise UploadError("上传数据超出声明的文件大小", status=413, offset=f.tell())
+                    self.limiter.consume(len(block))
+                    f.write(block)
+                    f.flush()
+                    hasher.update(block)
+                    session._hashed += len(block)
+                    remaining -= len(block)
+                    session.notify()
+            session.meta["updated_at"] = time.time()
+            session.save_meta()
+            return session
+        finally:
+            session.lock.release()
+
+    def finish(self, upload_id: str) -> Dict[str, Any]:
+        """校验上传完整性，返回文件路径和SHA-256"""
+        session = self.get(upload_id)
+        with session.lock:
+            if not session.complete:
+                raise UploadError("上传尚未完成", status=409, offset=session.offset)
+            digest = session.hasher().hexdigest()
+            expected = session.meta.get("sha256")
+            if expected and expected != digest:
+                raise UploadError("文件SHA-256校验失败", status=422, sha256=digest)
+        return {"path": session.data_path, "sha256": digest, "filename": session.meta["filename"]}
+
+    def open_tail(self, upload_id: str, idle_timeout: float = 300) -> UploadTail:
+        """打开一个跟随上传进度的顺序读取器，可以在第一个分块到达之前调用"""
+        return UploadTail(self.get(upload_id), idle_timeout)
+
+    def remove(self, upload_id: str):
+        with self._lock:
+            session = self.sessions.pop(upload_id, None)
+        if session is not None:
+            session.notify(closed=True)
+            shutil.rmtree(session.directory, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return {
+            "active_uploads": len(sessions),
+            "bytes_received": sum(session.offset for session in sessions),
+            "max_bytes": self.max_bytes,
+            "rate_limit": self.limiter.rate,
+        }
@@ -0,0 +1,162 @@
+"""边上传边解析
+
+启用流水线的上传会话在创建时就启动后台解析线程，线程通过UploadTail跟随上传进度读取已到达的字节，
+同时完成列式数据包表构建和流聚合。上传结束时解析通常也已接近完成，端到端耗时接近max(上传, 解析)
+而不是两者之和；流水线解析失败或不完整时，完成上传后的分析任务照常从磁盘文件重新解析。
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from job_manager import JobCancelled
+from upload_manager import UploadError, UploadManager, UploadTail
+
+PIPELINE_STATES = ("running", "succeeded", "incomplete", "failed", "cancelled")
+
+
+class UploadPipeline:
+    """单个上传会话的后台解析线程
+
+    parse_func(open_stream, stats, progress_callback)执行实际解析并返回解析结果，
+    open_stream()每次返回一个从文件开头跟随上传进度读取的新流。
+    """
+
+    def __init__(self, upload_manager: UploadManager, upload_id: str, parse_func: Callable,
+                 options: Dict[str, Any], idle_timeout: float = 300):
+        self.upload_manager = upload_manager
+        self.upload_id = upload_id
+        self.parse_func = parse_func
+        self.options = options
+        self.idle_timeout = idle_timeout
+        self.state = "running"
+        self.parsed = None
+        self.error = None
+        self.stats: Dict[str, Any] = {}
+        self.started_at = time.time()
+        self.uploaded_at = None
+        self.finished_at = None
+        self._tail: Optional[UploadTail] = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"upload-parse-{upload_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def _open_stream(self) -> UploadTail:
+        self._tail = self.upload_manager.open_tail(self.upload_id, self.idle_timeout)
+        return self._tail
+
+    def _progress(self, stage: str, progress: Optional[float] = None, message: str = ""):
+        if self._cancel.is_set():
+            raise JobCancelled(f"上传 {self.upload_id} 的流式解析已取消")
+
+    def _run(self):
+        try:
+            parsed = self.parse_func(self._open_stream, self.stats, self._progress)
+            tail = self._tail
+            if self._cancel.is_set():
+                self.state = "cancelled"
+            elif tail is not None and tail.complete:
+                self.parsed = parsed
+                self.state = "succeeded"
+            else:
+                self.state = "incomplete"
+                if tail is not None and tail.aborted:
+                    self.error = "上传会话已被删除"
+                elif tail is not None and tail.stalled:
+                    self.error = f"超过{self.idle_timeout:.0f}秒没有收到新数据"
+                else:
+                    self.error = "解析在文件末尾之前停止"
+        except JobCancelled:
+            self.state = "cancelled"
+        except (UploadError, OSError) as e:
+            self.state = "incomplete"
+            self.error = str(e)
+        except Exception as e:
+            print(f"[ERROR] Upload pipeline {self.upload_id} failed: {str(e)}")
+            self.state = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+            print(f"[INFO] Upload pipeline {self.upload_id} finished: {self.state}")
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def mark_uploaded(self):
+        """记录上传完成的时间，用于计算上传与解析的重叠程度"""
+        if self.uploaded_at is None:
+            self.uploaded_at = time.time()
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待解析线程结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        self._cancel.set()
+        if self._tail is not None:
+            self._tail.abort()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "state": self.state,
+            "parser": self.stats.get("parser", self.options.get("parser")),
+            "profile": self.options.get("profile"),
+            "packets": self.stats.get("yielded_packets", 0),
+            "bytes_parsed": self._tail.position if self._tail is not None else 0,
+            "error": self.error,
+        }
+        if self.uploaded_at is not None:
+            data["upload_seconds"] = round(self.uploaded_at - self.started_at, 3)
+        if self.finished_at is not None:
+            data["parse_seconds"] = round(self.finished_at - self.started_at, 3)
+            if self.uploaded_at is not None:
+                # 上传结束后还需要等待解析的时间，理想情况下接近0
+                data["parse_after_upload_seconds"] = round(max(self.finished_at - self.uploaded_at, 0.0), 3)
+        return data
+
+
+class PipelineManager:
+    """按上传ID管理流水线解析"""
+
+    def __init__(self, upload_manager: UploadManager, idle_timeout: float = 300):
+        self.upload_manager = upload_manager
+        self.idle_timeout = idle_timeout
+        self.pipelines: Dict[str, UploadPipeline] = {}
+        self._lock = threading.Lock()
+
+    def _prune_locked(self):
+        """丢弃上传会话已不存在（过期或已删除）且已结束的流水线"""
+        for upload_id, pipeline in list(self.pipelines.items()):
+            if not pipeline.finished:
+                continue
+            try:
+                self.upload_manager.get(upload_id)
+            except UploadError:
+                del self.pipelines[upload_id]
+
+    def start(self, upload_id: str, parse_func: Callable, options: Dict[str, Any]) -> UploadPipeline:
+        pipeline = UploadPipeline(self.upload_manager, upload_id, parse_func, options, self.idle_timeout)
+        with self._lock:
+            self._prune_locked()
+            self.pipelines[upload_id] = pipeline
+        return pipeline
+
+    def get(self, upload_id: str) -> Optional[UploadPipeline]:
+        with self._lock:
+            return self.pipelines.get(upload_id)
+
+    def discard(self, upload_id: str):
+        """停止并移除流水线；解析线程在下一次读取或进度上报时退出"""
+        with self._lock:
+            pipeline = self.pipelines.pop(upload_id, None)
+        if pipeline is not None:
+            pipeline.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {state: 0 for state in PIPELINE_STATES}
+            for pipeline in self.pipelines.values():
+                counts[pipeline.state] += 1
+        return {"pipelines": counts, "idle_timeout": self.idle_timeout}
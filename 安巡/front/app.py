@@ -323,18 +323,10 @@ def preload_model(model="qwen2.5:7b"):
         if f'model_preloaded_{model}' in st.session_state:
             return "already_loaded"
         
-        # 发送一个简单的预热请求到Ollama直接API
-        import requests
-        url = "http://localhost:11434/api/chat"
-        payload = {
-            "model": "qwen3:8b" if model == "qwen2.5:7b" else model,
-            "messages": [{"role": "user", "content": "Hello"}],
-            "stream": False
-        }
-        
-        response = requests.post(url, json=payload, timeout=30)
+        # 通过后端让Ollama只加载模型，不再每次生成一条"Hello"回复
+        result = call_backend_api("/api/preload_model", method="POST", data={"model": model})
         
-        if response.status_code == 200:
+        if result.get("success"):
             # 标记模型已预加载
             st.session_state[f'model_preloaded_{model}'] = True
             return "success"
@@ -467,6 +459,30 @@ def capture_network_traffic(duration=10, interface='any', packet_count=50):
         st.session_state.capture_status = False
         return []
 
+# 实时采集事件流
+def stream_live_capture(interface='any', duration=10, max_packets=100):
+    """订阅后端/api/live_capture/stream的SSE事件，逐个产出(事件名, 数据)
+
+    迭代提前结束（如页面重新运行）时关闭连接，后端随即终止tshark。
+    """
+    params = {"interface": interface, "duration": duration, "max_packets": max_packets, "mode": "packets"}
+    with requests.get("http://localhost:5000/api/live_capture/stream", params=params,
+                      stream=True, timeout=(5, 60)) as response:
+        if response.status_code != 200:
+            try:
+                message = response.json().get("error", "")
+            except ValueError:
+                message = ""
+            raise RuntimeError(message or f"API调用失败，状态码: {response.status_code}")
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = "message"
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):].strip())
+
 # 页面内容
 if page == "🤖 智能对话":
     # 模型预加载（仅在首次访问时执行）
@@ -812,50 +828,56 @@ elif page == "📊 流量分析":
                 st.session_state.capture_status = True
                 st.session_state.captured_packets = []
                 
-                # 显示捕获进度
+                # 显示捕获进度，数据包到达后立即刷新表格
                 progress_bar = st.progress(0)
                 status_text = st.empty()
+                live_table = st.empty()
                 
                 try:
-                    # 调用后端API进行流量捕获
-                    data = {
-                        "duration": duration,
-                        "interface": selected_interface,
-                        "packet_count": 100
-                    }
-                    
                     status_text.text(f"正在使用接口 {selected_interface_name} 捕获网络流量...")
+                    captured_data = []
+                    started = time.time()
+                    summary = {}
                     
-                    # 调用后端API
-                    result = call_backend_api("/api/capture_traffic", "POST", data)
+                    for event, payload in stream_live_capture(selected_interface, duration, max_packets=100):
+                        if event == "packets":
+                            for packet in payload:
+                                captured_data.append({
+                                    "time": packet.get("time"),
+                                    "src_ip": packet.get("src"),
+                                    "dst_ip": packet.get("dst"),
+                                    "protocol": packet.get("protocol"),
+                                    "port": packet.get("dst_port"),
+                                    "length": packet.get("length"),
+                                    "flags": packet.get("flags"),
+                                })
+                            live_table.dataframe(pd.DataFrame(captured_data[-20:]), use_container_width=True)
+                        elif event == "end":
+                            summary = payload
+                        elapsed = min(time.time() - started, duration)
+                        progress_bar.progress(elapsed / duration)
+                        status_text.text(f"正在捕获网络流量... {elapsed:.0f}/{duration}秒，已收到 {len(captured_data)} 个数据包")
                     
-                    # 模拟进度更新
-                    for i in range(duration):
-                        progress_bar.progress((i + 1) / duration)
-                        status_text.text(f"正在捕获网络流量... {i + 1}/{duration}秒")
-                        time.sleep(1)
+                    st.session_state.captured_packets = captured_data
+                    st.session_state.capture_status = False
                     
-                    if "error" in result:
-                        st.error(f"捕获失败: {result['error']}")
-                        st.session_state.capture_status = False
+                    if summary.get("error"):
+                        st.error(f"捕获失败: {summary['error']}")
+                    elif captured_data:
+                        st.success(f"成功捕获 {len(captured_data)} 个数据包")
                     else:
-                        captured_data = result.get("data", [])
-                        st.session_state.captured_packets = captured_data
-                        st.session_state.capture_status = False
-                        
-                        if captured_data:
-                            st.success(f"成功捕获 {len(captured_data)} 个数据包")
-                        else:
-                            st.warning("未捕获到数据包，请检查网络接口权限或尝试其他接口")
+                        st.warning("未捕获到数据包，请检查网络接口权限或尝试其他接口")
                     
                     progress_bar.empty()
                     status_text.empty()
+                    live_table.empty()
                     
                 except Exception as e:
                     st.error(f"捕获失败: {str(e)}")
                     st.session_state.capture_status = False
                     progress_bar.empty()
                     status_text.empty()
+                    live_table.empty()
         
         with col3:
             if st.button("停止捕获"):
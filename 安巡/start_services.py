@@ -13,6 +13,10 @@ import threading
 import requests
 from pathlib import Path
 
+# 与后端共用Ollama客户端的地址和超时配置
+sys.path.insert(0, str(Path(__file__).parent / "back"))
+from ollama_client import OllamaClient, DEFAULT_BASE_URL
+
 def check_service(url, service_name, max_retries=10):
     """检查服务是否启动成功"""
     for i in range(max_retries):
@@ -88,16 +92,19 @@ def start_frontend():
 def check_ollama():
     """检查Ollama服务状态"""
     print("🔍 检查Ollama服务状态...")
+    client = OllamaClient()
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code == 200:
-            print("✅ Ollama服务运行正常")
-            return True
-        else:
-            print("❌ Ollama服务异常")
-            return False
-    except:
-        print("❌ Ollama服务未启动，请先启动Ollama")
+        status = client.status()
+    finally:
+        client.close()
+    if status == "running":
+        print("✅ Ollama服务运行正常")
+        return True
+    elif status == "error":
+        print("❌ Ollama服务异常")
+        return False
+    else:
+        print(f"❌ Ollama服务未启动（{client.base_url}），请先启动Ollama")
         print("   提示: 请运行 'ollama serve' 命令启动Ollama服务")
         return False
 
@@ -129,7 +136,7 @@ def main():
     print("🎉 所有服务启动成功！")
     print("📱 前端应用: http://localhost:8501")
     print("🔧 后端API: http://localhost:5000")
-    print("🤖 Ollama服务: http://localhost:11434")
+    print(f"🤖 Ollama服务: {DEFAULT_BASE_URL}")
     print("="*50)
     print("\n💡 提示:")
     print("   - 按 Ctrl+C 停止所有服务")